@@ -14,11 +14,11 @@
 from collections import OrderedDict
 
 
-Seed_Actions = ['----seeds----', 'add-seed', 'fetch-seed',
+Seed_Actions = ['----seeds----', 'add-seed', 'compact', 'fetch-seed',
     'update-seed', 'list-seed', 'list-seedfiles', 'move-seed',
     'remove-seed']
 
-Key_Actions = ['----keys-----', 'check-key', 'installed',
+Key_Actions = ['----keys-----', 'check-key', 'expiring', 'installed',
     'install-key', 'list-key', 'send-key', 'refresh-key', 'remove-key',
     'search-key', 'spec-check']
 
@@ -87,7 +87,7 @@ Action_Map = OrderedDict([
     ('check-key', {
         'func': 'checkkey',
         'options': ['category', 'nick', 'name', 'fingerprint', 'keyid', 'keys',
-            'keydir', 'keyring'],
+            'keydir', 'keyring', 'jobs'],
         'desc': '''Check key validity''',
         'long_desc': '''Check keys actions
     Performs basic validity checks on the key(s), checks expiry,
@@ -109,6 +109,23 @@ Found:
     Revoked: 0
     Invalid: 0
     No signing capable subkeys: 0
+''',
+        }),
+    ('expiring', {
+        'func': 'expiring',
+        'options': ['category', 'within'],
+        'desc': '''List the installed keys expiring within the next days''',
+        'long_desc': '''List the installed primary keys and subkeys expiring
+    within the next --within days (the days_limit setting by default).
+    The keys are looked up in the expiry index, which is built from the
+    installed keys on first use and kept current by install-key and
+    refresh-key.''',
+        'example': '''$ gkeys expiring -C gentoo-devs --within 30
+
+ Gkey task results:
+    Found 2 key(s) expiring within 30 days:
+    dolsen: SUB 1C2D3E4F5A6B7C8D9E0F1A2B3C4D5E6F7A8B9C0D, dolsen expires 2015-08-01 (12 days)
+    dolsen: PUB 0A1B2C3D4E5F60718293A4B5C6D7E8F901234567, dolsen expires 2015-08-01 (12 days)
 ''',
         }),
     ('import-key', {
@@ -122,7 +139,7 @@ Found:
     ('install-key', {
         'func': 'installkey',
         'options':  ['category', 'nick', 'name', 'fingerprint', 'keys',
-            'keydir', 'keyring', '1file'],
+            'keydir', 'keyring', '1file', 'jobs'],
         'desc': '''Install a key from the seed(s)''',
         'long_desc': '''Install a key from the seed(s).  The key will be
     installed to the pre-configured seed's keydir value within the category's directory.''',
@@ -195,7 +212,7 @@ Gpg info.: pub   4096R/825533CBF6CD6C97 2014-10-03 [expires: 2017-09-17]
     ('refresh-key', {
         'func': 'refreshkey',
         'options': ['category', 'nick', 'name', 'fingerprint', 'keyid', 'keys',
-            'keydir', 'keyring'],
+            'keydir', 'keyring', 'jobs'],
         'desc': '''Calls gpg with the --refresh-keys option
         for in place updates of the installed keys''',
         'long_desc': '''Calls gpg with the --refresh-keys option
@@ -253,7 +270,7 @@ Do you really want to remove dolsen?[y/n]: y
     ('search-key', {
         'func': 'key_search',
         'options': ['category', 'nick', '1name', 'fingerprint', 'keyid', 'uid',
-            'keys', 'keydir', 'exact', 'all'],
+            'keys', 'keydir', 'regex', 'exact', 'fuzzy', 'all'],
         'desc': '''Search for a key's seed in the installed keys db''',
         'long_desc': '''Search for a key's seed in the installed keys db''',
         'example': '''$ gkeys search-key  -n gkeys
@@ -285,7 +302,7 @@ Do you really want to remove dolsen?[y/n]: y
     ('spec-check', {
         'func': 'speccheck',
         'options': ['category', 'nick', 'name', 'fingerprint', 'keyid', 'keys',
-            'keydir', 'keyring', 'email', 'user'],
+            'keydir', 'keyring', 'email', 'user', 'jobs'],
         'desc': '''Check if keys meet specifications requirements''',
         'long_desc': '''Check if keys meet specifications requirements''',
         'example': '''$ gkeys spec-check -C gentoo -n gkeys
@@ -384,7 +401,7 @@ Found Failures:
     ('update-seed', {
         'func': 'updateseed',
         'options': ['category', 'nick', '1file', 'dest', 'signature',
-            'timestamp'],
+            'timestamp', 'jobs', 'json'],
         'desc': '''Update the selected seed file(s) or all categories if no arguments are given''',
         'long_desc': '''Update the selected seed file(s) or all categories if no arguments are given''',
         'example': '''$ gkeys update-seed -C gentoo-devs
@@ -401,7 +418,7 @@ Found Failures:
     ('list-seed', {
         'func': 'listseed',
         'options': ['category', 'nick', 'name', 'fingerprint', 'keys',
-            'keydir', '1file'],
+            'keydir', 'regex', '1file'],
         'desc': '''Pretty-print the selected seed file''',
         'long_desc': '''Pretty-print the selected seed file''',
         'example': '''$ gkeys list-seed -C gentoo -n gkeys
@@ -418,6 +435,23 @@ Found Failures:
     Keyid........: 0x825533CBF6CD6C97
       Fingerprint: D2DE1DBBA0F43EBA341B97D8825533CBF6CD6C97''',
          }),
+    ('compact', {
+        'func': 'compact',
+        'options': ['category'],
+        'desc': '''Fold the seed file journals into their seed files''',
+        'long_desc': '''Fold the seed file journals into their seed files.
+    With the seed_journal config option enabled, changes to the seed files,
+    the installed keys dbs and the keydirs' gkey.seeds files are appended to
+    a journal next to the file.  The journals are compacted automatically once
+    over the journal_max_size or journal_max_age limits, this action compacts
+    the journals of the selected category or of all categories now.''',
+        'example': '''$ gkeys compact -C gentoo-devs
+
+ Gkey task results:
+    Compacted: /home/brian/gpg-test/seeds/gentoo-devs.seeds
+    Compacted: /home/brian/gpg-test/keyrings/gentoo-devs/installed.seeds
+''',
+         }),
     ('list-seedfiles', {
         'func': 'listseedfiles',
         'options': [],
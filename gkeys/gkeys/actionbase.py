@@ -15,6 +15,11 @@ from __future__ import print_function
 import os
 import sys
 
+import multiprocessing
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
 if sys.version_info[0] >= 3:
     _unicode = str
 else:
@@ -30,6 +35,33 @@ demandload(
 )
 
 
+# the number of gkey chunks queued per check worker process,
+# evening out the workers' loads while keeping the chunks large
+JOB_CHUNKS_PER_WORKER = 4
+
+# the GkeysGPG instance of a check worker process
+_worker_gpg = None
+
+
+def _init_check_worker(gpg):
+    global _worker_gpg
+    _worker_gpg = gpg
+
+
+def _check_job(job):
+    func, gkeys = job
+    return func(_worker_gpg, gkeys)
+
+
+def _check_pool(processes, gpg):
+    '''Returns a pool of forked check worker processes, which inherit
+    gpg instead of pickling it'''
+    try:
+        context = multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        context = multiprocessing
+    return context.Pool(processes, _init_check_worker, (gpg,))
+
 
 class ActionBase(object):
     '''Base actions class holding comon functions and init'''
@@ -54,6 +86,7 @@ class ActionBase(object):
                 self._set_category(self.category), self.logger)
         else:
             self._gpg.basedir = self._set_category(self.category)
+        self._gpg.category = self.category
         return self._gpg
 
 
@@ -100,3 +133,86 @@ class ActionBase(object):
             self.config.defaults['gpg_defaults'][index+1] = trust
         else:
             self.config.defaults['gpg_defaults'].extend(['--trust-model', trust])
+
+
+    def _run_keydir_jobs(self, func, gkeys, jobs=1):
+        '''Runs func for each gkey, working on up to jobs keydirs
+        concurrently.  All the gkeys sharing a keydir are run in order
+        by the same worker, so no two workers use the same gpg homedir.
+        The workers share the GkeysGPG instance, whose gpg tasks are
+        reentrant.
+
+        @param func: function taking (GkeysGPG instance, GKEY) arguments
+        @param gkeys: list of GKEY instances
+        @param jobs: int, the maximum number of worker threads
+        @returns generator of (gkey, result, error) tuples, in keydir order
+        '''
+        groups = OrderedDict()
+        for gkey in gkeys:
+            groups.setdefault(gkey.keydir, []).append(gkey)
+        if not jobs or jobs < 2 or len(groups) < 2:
+            gpg = self.gpg
+            for group in groups.values():
+                for outcome in self._keydir_job(func, gpg, group):
+                    yield outcome
+            return
+        gpg = self.gpg
+
+        def worker(group):
+            return list(self._keydir_job(func, gpg, group))
+
+        self.logger.debug("ActionBase: _run_keydir_jobs; %d keydirs, %d jobs"
+            % (len(groups), jobs))
+        pool = ThreadPool(min(jobs, len(groups)))
+        try:
+            for outcomes in pool.imap(worker, list(groups.values())):
+                for outcome in outcomes:
+                    yield outcome
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def _run_check_jobs(self, func, gkeys, jobs=1):
+        '''Runs func over consecutive chunks of gkeys in up to jobs
+        worker processes.  Unlike the gpg tasks of _run_keydir_jobs(),
+        the key checks are cpu bound python code, so they are spread
+        over processes rather than threads.
+
+        @param func: module level function taking (GkeysGPG instance,
+                        list of GKEY) arguments, returning a list of
+                        one result per gkey
+        @param gkeys: list of GKEY instances
+        @param jobs: int, the maximum number of worker processes
+        @returns generator of (gkey, result) tuples, in the order of gkeys,
+                 each chunk's results are yielded as soon as it is done
+        '''
+        gpg = self.gpg
+        if not jobs or jobs < 2 or len(gkeys) < 2:
+            for outcome in zip(gkeys, func(gpg, gkeys)):
+                yield outcome
+            return
+        size = -(-len(gkeys) // (jobs * JOB_CHUNKS_PER_WORKER))
+        chunks = [gkeys[x:x + size] for x in range(0, len(gkeys), size)]
+        self.logger.debug("ActionBase: _run_check_jobs; %d gkeys, %d chunks, "
+            "%d jobs" % (len(gkeys), len(chunks), jobs))
+        pool = _check_pool(min(jobs, len(chunks)), gpg)
+        try:
+            results = pool.imap(_check_job, [(func, x) for x in chunks])
+            for chunk, chunk_results in zip(chunks, results):
+                for outcome in zip(chunk, chunk_results):
+                    yield outcome
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def _keydir_job(self, func, gpg, gkeys):
+        for gkey in gkeys:
+            try:
+                yield (gkey, func(gpg, gkey), None)
+            except Exception as err:
+                self.logger.exception(_unicode("ActionBase: _keydir_job; %s failed for %s")
+                    % (func.__name__, gkey.nick))
+                yield (gkey, None, err)
+
@@ -15,6 +15,7 @@ from __future__ import print_function
 
 import itertools
 import os
+import time
 
 
 from collections import defaultdict
@@ -22,19 +23,41 @@ from collections import defaultdict
 from gkeys import _unicode, py_input
 from gkeys.actionbase import ActionBase
 from gkeys.gkey import GKEY
-from gkeys.checks import SPECCHECK_SUMMARY, convert_pf, convert_yn
+from gkeys.checks import (SECONDS_PER_DAY, SPECCHECK_SUMMARY, convert_pf,
+    convert_yn)
+from gkeys.expiryindex import expiry_entries
 from gkeys.mail import Emailer
+from gkeys.seed import (SEED_JOURNAL, Seeds, installed_current, installed_db,
+    keydirs_state, save_installed_state)
 
 from snakeoil.demandload import demandload
 
 demandload(
     "gkeys.base:Args",
     "gkeys.fetch:Fetch",
+    "json:dumps",
     "json:load",
 )
 
 EXTENSIONS = ['.sig', '.asc', '.gpg','.gpgsig']
 
+# updateseed's record of the last keyserver refresh of a category's keys
+LAST_REFRESH = '.last-refresh'
+
+
+def _checkkey_gkeys(gpg, gkeys):
+    '''Runs the validity checks of the gkeys' keys, for checkkey's jobs'''
+    return [[gpg.check_keys(gkey.keydir, key) for key in gkey.pub_keyid]
+        for gkey in gkeys]
+
+
+def _speccheck_gkeys(gpg, gkeys):
+    '''Runs the spec checks of the gkeys' keys in a single batch,
+    for speccheck's jobs'''
+    results = iter(gpg.speccheck_batch([(gkey.keydir, key)
+        for gkey in gkeys for key in gkey.keys]))
+    return [[next(results) for key in gkey.keys] for gkey in gkeys]
+
 
 class Actions(ActionBase):
     '''Primary API actions'''
@@ -72,6 +95,9 @@ class Actions(ActionBase):
                 return (False, ['', "Failed to load seed file. Consider fetching seedfiles."])
         if self.seeds:
             results = self.seeds.list(**kwargs)
+            if getattr(args, 'regex', None):
+                matched = set(x.nick for x in self.seeds.regex_search(args.regex))
+                results = [x for x in results if x.nick in matched]
         else:
             results = ''
         return (True, ['', results])
@@ -118,30 +144,105 @@ class Actions(ActionBase):
             self.output('', "Fetch failed.\n")
         else:
             self.output('', "Fetch succeeded.\n")
+            success, new_gkeys = self.listseed(args)
+            changes = self.seedhandler.diff_seeds(old_gkeys[1], new_gkeys[1])
+            added_gkeys, changed_gkeys, removed_gkeys = changes[:3]
+            if getattr(args, 'json', False):
+                self.output('', dumps(changes.to_dict(), indent=4, sort_keys=True))
+            else:
+                if changed_gkeys:
+                    self.output([changed_gkeys], "Updated or revoked GKeys:")
+                    self.output([_unicode("%s: %s")
+                        % (gkey.nick, ', '.join(changes.fields[gkey.nick]))
+                        for gkey in changed_gkeys], "Changed fields:")
+                else:
+                    self.output('', "No GKeys were updated or revoked")
+                if added_gkeys:
+                    self.output([added_gkeys], "Added GKeys:")
+                else:
+                    self.output('', "No GKeys were added")
+                if removed_gkeys:
+                    self.output([removed_gkeys], "Removed GKeys:")
+                else:
+                    self.output('', "No GKeys were removed")
             self.output('', "Installing or Refreshing keys for %s category." %args.category)
-            install_success, install_messages = self.installkey(args)
+            install_success, install_messages = self._update_installed(args,
+                new_gkeys[1] or [], added_gkeys, changed_gkeys, removed_gkeys)
             if install_success is not True:
                 self.output('', "Update failed.\n")
                 success = False
             else:
                 self.output('', "Update succeeded.\n")
             messages = fetch_messages + [" Update operation:"] + [install_messages]
-            success, new_gkeys = self.listseed(args)
-            added_gkeys, changed_gkeys, removed_gkeys  = self.seedhandler.compare_seeds(old_gkeys, new_gkeys)
-            for gkey in changed_gkeys:
-                self.output([changed_gkeys], "Updated or revoked GKeys:")
-            else:
-                self.output('', "No GKeys were updated or revoked")
-            for gkey in added_gkeys:
-                self.output([added_gkeys], "Added GKeys:")
-            else:
-                self.output('', "No GKeys were added")
-            for gkey in removed_gkeys:
-                self.output([removed_gkeys], "Removed GKeys:")
-            else:
-                self.output('', "No GKeys were removed")
         return (success, messages)
 
+
+    def _update_installed(self, args, gkeys, added_gkeys, changed_gkeys,
+            removed_gkeys):
+        '''Brings the category's installed keys in line with its updated
+        seed file.  Added and not yet installed gkeys are installed, changed
+        gkeys are fetched again, removed gkeys are only reported.  The
+        unchanged installed keys are refreshed from the keyserver once the
+        refresh_interval (days) has elapsed since their last refresh.
+
+        @param args: the updateseed args
+        @param gkeys: list of the category's GKEYs in the updated seed file
+        @param added_gkeys: list of GKEYs added to the seed file
+        @param changed_gkeys: list of GKEYs changed in the seed file
+        @param removed_gkeys: list of GKEYs removed from the seed file
+        @returns (success, messages)
+        '''
+        installed = self.seedhandler.load_category(args.category).seeds
+        self._set_category(args.category)
+        pending = set(gkey.nick for gkey in added_gkeys)
+        pending.update(gkey.nick for gkey in changed_gkeys)
+        pending.update(gkey.nick for gkey in gkeys if gkey.nick not in installed)
+        work = [gkey for gkey in gkeys if gkey.nick in pending]
+        refresh_path = os.path.join(self.gpg.basedir, LAST_REFRESH)
+        refresh = self._refresh_due(refresh_path)
+        if refresh:
+            work.extend(gkey for gkey in gkeys if gkey.nick not in pending)
+        self.logger.info("ACTIONS: updateseed; %d to install or fetch again, "
+            "%s of the %d unchanged installed keys"
+            % (len(pending), 'refreshing' if refresh else 'skipping',
+            len(gkeys) - len(pending)))
+        messages = []
+        removed = [gkey for gkey in removed_gkeys if gkey.nick in installed]
+        if removed:
+            self.output([removed], "Removed GKeys still installed, "
+                "use the remove-key action to remove them:")
+            messages.append(_unicode("Removed GKeys still installed: %s")
+                % ', '.join(sorted(gkey.nick for gkey in removed)))
+        if not work:
+            messages.append("No keys to install or refresh")
+            return (True, messages)
+        failed, elapsed = self._install_gkeys(work, getattr(args, 'jobs', 1))
+        if failed and self.output:
+            self.output([failed], "\n Failed to install:")
+        if refresh and not failed:
+            try:
+                with open(refresh_path, 'w'):
+                    pass
+            except IOError as err:
+                self.logger.debug(_unicode("ACTIONS: updateseed; failed to record "
+                    "the refresh time %s: %s") % (refresh_path, _unicode(err)))
+        messages.append(elapsed)
+        return (not failed, messages)
+
+
+    def _refresh_due(self, refresh_path):
+        '''Checks if the refresh_interval has elapsed since the refresh
+        recorded by refresh_path'''
+        try:
+            interval = float(self.config.get_key('refresh_interval'))
+        except (TypeError, ValueError):
+            interval = 0
+        try:
+            last = os.stat(refresh_path).st_mtime
+        except OSError:
+            return True
+        return time.time() - last >= interval * 86400
+
     def addseed(self, args):
         '''Add or replace a key in the selected seed file'''
         success, data = self.listseed(args)
@@ -194,6 +295,53 @@ class Actions(ActionBase):
             "No matching seed found"])
 
 
+    def compact(self, args):
+        '''Fold the seed file journals into their seed files'''
+        if args.category:
+            categories = [args.category]
+        else:
+            categories = sorted(self.config.get_key('seeds'))
+        messages = []
+        failed = []
+        for category in categories:
+            paths = []
+            seedfile = self.config.get_key('seeds', category)
+            if seedfile:
+                paths.append(seedfile)
+            catdir = self.config.get_key('keyrings', category)
+            dbpath = None
+            current = False
+            if catdir and os.path.isdir(catdir):
+                dbpath = os.path.join(catdir, installed_db(self.config))
+                # compacting leaves the seeds as they were, so the db
+                # stays current with the compacted files
+                current = installed_current(dbpath, catdir)
+                paths.append(dbpath)
+                for keydir in sorted(os.listdir(catdir)):
+                    paths.append(os.path.join(catdir, keydir, 'gkey.seeds'))
+            for path in paths:
+                if not os.path.exists(path + SEED_JOURNAL):
+                    continue
+                self.logger.debug("ACTIONS: compact; compacting %s" % path)
+                seeds = Seeds(path, self.config, self.logger)
+                if not (seeds.load(refresh=True) and seeds.compact()):
+                    failed.append(path)
+                    continue
+                messages.append(_unicode("Compacted: %s") % path)
+            if current:
+                try:
+                    save_installed_state(dbpath, keydirs_state(catdir))
+                except (IOError, OSError) as err:
+                    self.logger.debug("ACTIONS: compact; failed to save the "
+                        "state of %s: %s" % (dbpath, str(err)))
+        if failed:
+            messages.append("Failed to compact:")
+            messages.extend(failed)
+        elif not messages:
+            messages.append("No seed file journals to compact")
+        return (not failed, messages)
+
+
     def moveseed(self, args):
         '''Move keys between seed files'''
         searchkey = self.seedhandler.new(args, checkgkey=False)
@@ -273,9 +421,7 @@ class Actions(ActionBase):
             args.category = 'gentoo'
         self._set_category(args.category)
         if args.keydir:
-            self.gpg.set_keydir(args.keydir, "list-keys")
-            self.gpg.set_keyseedfile()
-            seeds = self.gpg.seedfile
+            seeds = self.gpg.keyseedfile(args.keydir)
         else:
             seeds = self.seedhandler.load_category(args.category)
         results = {}
@@ -342,54 +488,82 @@ class Actions(ActionBase):
             # get confirmation
             # fill in code here
             self._set_category(args.category)
-            for gkey in gkeys:
-                self.gpg.set_keydir(gkey.keydir, "recv-keys")
-                self.gpg.set_keyseedfile()
-                seeds = self.gpg.seedfile.seeds
-                if seeds:
-                    self.logger.debug("ACTIONS: installkey; found installed seeds:"
-                        "\n %s" % seeds)
-                results = {}
-                failed = []
-                if gkey.nick in seeds and gkey.keys == seeds[gkey.nick].keys:
-                    self.logger.debug("ACTIONS: installkey; refreshing key:")
-                    if self.config.options['print_results']:
-                        print(_unicode("Refreshing already installed key: %s, %s"
-                            %(gkey.nick, gkey.keys)))
-                    self.gpg.refresh_key(gkey)
-                else:
-                    self.logger.debug("ACTIONS: installkey; adding key:")
-                    self.logger.debug("ACTIONS: " + str(gkey))
-                    results[gkey.name] = self.gpg.add_key(gkey)
-                    for result in results[gkey.name]:
-                        self.logger.debug("ACTIONS: installkey; result.failed = " +
-                                          str(result.failed))
-                    if self.config.options['print_results']:
-                        msg = _unicode("key desired: %(name)s, key added: %(key)s, succeeded:" +\
-                            " %(success)s, fingerprint: %(fpr)s")
-                        for result in results[gkey.name]:
-                            umsg = msg % ({'name': gkey.name, 'key': result.username,
-                                    'success': str(not result.failed),
-                                    'fpr': result.fingerprint})
-                            try:
-                                print(umsg)
-                            except UnicodeDecodeError:
-                                print(_unicode("UnicodeDecodeError printing results for:"), gkey.name)
-                                self.logger.debug(_unicode("installkey(); UnicodeDecodeError for:") + gkey.name)
-                                self.logger.debug(_unicode("    result.username...:") + result.username)
-                                self.logger.debug(_unicode("    result.failed.....:") + result.failed)
-                                self.logger.debug(_unicode("    result.fingerprint:") + result.fingerprint)
-                            self.logger.debug("stderr_out: " + str(result.stderr_out))
-                            if result.failed:
-                                failed.append(gkey)
+            failed, elapsed = self._install_gkeys(gkeys, getattr(args, 'jobs', 1))
             if failed and self.output:
                 self.output([failed], "\n Failed to install:")
             if failed:
                 success = False
-            return (success, ["Completed"])
+            return (success, [elapsed])
         return (success, ["No seeds to search or install"])
 
 
+    def _install_gkeys(self, gkeys, jobs=1):
+        '''Installs or refreshes the gkeys and prints the results
+
+        @param gkeys: list of GKEY instances
+        @param jobs: int, the number of keydirs to process concurrently
+        @returns (list of the failed GKEYs, elapsed time message)
+        '''
+        failed = []
+        start = time.time()
+        for gkey, results, error in self._run_keydir_jobs(
+                self._installkey, gkeys, jobs):
+            if error:
+                failed.append(gkey)
+                continue
+            if results is None:
+                if self.config.options['print_results']:
+                    print(_unicode("Refreshed already installed key: %s, %s"
+                        %(gkey.nick, gkey.keys)))
+                continue
+            for result in results:
+                self.logger.debug("ACTIONS: installkey; result.failed = " +
+                                  str(result.failed))
+            if self.config.options['print_results']:
+                msg = _unicode("key desired: %(name)s, key added: %(key)s, succeeded:" +\
+                    " %(success)s, fingerprint: %(fpr)s")
+                for result in results:
+                    umsg = msg % ({'name': gkey.name, 'key': result.username,
+                            'success': str(not result.failed),
+                            'fpr': result.fingerprint})
+                    try:
+                        print(umsg)
+                    except UnicodeDecodeError:
+                        print(_unicode("UnicodeDecodeError printing results for:"), gkey.name)
+                        self.logger.debug(_unicode("installkey(); UnicodeDecodeError for:") + gkey.name)
+                        self.logger.debug(_unicode("    result.username...:") + result.username)
+                        self.logger.debug(_unicode("    result.failed.....:") + result.failed)
+                        self.logger.debug(_unicode("    result.fingerprint:") + result.fingerprint)
+                    self.logger.debug("stderr_out: " + str(result.stderr_out))
+            for result in results:
+                if result.failed:
+                    failed.append(gkey)
+                    break
+        elapsed = _unicode("Completed in %.1f seconds") % (time.time() - start)
+        self.logger.info("ACTIONS: installkey; %s, %d jobs" % (elapsed, jobs))
+        return (failed, elapsed)
+
+
+    def _installkey(self, gpg, gkey):
+        '''Installs or refreshes a single gkey, run by installkey's workers
+
+        @param gpg: GkeysGPG instance to use
+        @param gkey: GKEY instance
+        @returns list of add_key results, or None if the key was refreshed
+        '''
+        seeds = gpg.keyseedfile(gkey.keydir).seeds
+        if seeds:
+            self.logger.debug("ACTIONS: installkey; found installed seeds:"
+                "\n %s" % seeds)
+        if gkey.nick in seeds and gkey.keys == seeds[gkey.nick].keys:
+            self.logger.debug("ACTIONS: installkey; refreshing key:")
+            gpg.refresh_key(gkey)
+            return None
+        self.logger.debug("ACTIONS: installkey; adding key:")
+        self.logger.debug("ACTIONS: " + str(gkey))
+        return gpg.add_key(gkey)
+
+
     def checkkey(self, args):
         '''Check keys actions
         Performs basic validity checks on the key(s), checks expiry,
@@ -404,7 +578,8 @@ class Actions(ActionBase):
         kwargs = self.seedhandler.build_gkeydict(args)
         keyresults = seeds.list(**kwargs)
         self.output('', '\n Checking keys...')
-        for gkey in sorted(keyresults):
+        for gkey, checks in self._run_check_jobs(_checkkey_gkeys,
+                sorted(keyresults), getattr(args, 'jobs', 1)):
             self.logger.info(_unicode("Checking key %s, %s")
                 % (gkey.nick, gkey.pub_keyid))
             self.output('',
@@ -412,8 +587,8 @@ class Actions(ActionBase):
                 _unicode(', ').join(gkey.pub_keyid))) +
                 _unicode("\n  =============================================="))
             self.logger.debug(_unicode("ACTIONS: checkkey; gkey = %s") % _unicode(gkey))
-            for key in gkey.pub_keyid:
-                results[gkey.name] = self.gpg.check_keys(gkey.keydir, key)
+            for key, check in zip(gkey.pub_keyid, checks):
+                results[gkey.name] = check
                 if results[gkey.name].expired:
                     failed['expired'].append(_unicode("%s <%s>: %s")
                         % (gkey.name, gkey.nick, key))
@@ -467,7 +642,8 @@ class Actions(ActionBase):
             message_template = self.keyhandler.set_template(template_path)
             self.logger.debug(_unicode('Emailer started with login: %s') \
                 % _unicode(email_user['login_email']))
-        for gkey in sorted(keyresults):
+        for gkey, specchecks in self._run_check_jobs(_speccheck_gkeys,
+                sorted(keyresults), getattr(args, 'jobs', 1)):
             self.logger.info(_unicode("Checking key %s, %s")
                 % (gkey.nick, gkey.keys))
             self.output('',
@@ -476,8 +652,7 @@ class Actions(ActionBase):
                 _unicode("\n  =============================================="))
             self.logger.debug(_unicode("ACTIONS: speccheck; gkey = %s")
                 % _unicode(gkey))
-            for key in gkey.keys:
-                results = self.gpg.speccheck(gkey.keydir, key)
+            for results in specchecks:
                 for g in results:
                     pub_pass = {}
                     key_print = ''
@@ -754,29 +929,63 @@ class Actions(ActionBase):
             return (False, ["Please specify a category."])
         catdir = self._set_category(args.category)
         self.logger.debug("ACTIONS: installed; catdir = %s" % catdir)
-        installed_keys = []
-        try:
-            if args.nick:
-                keys = [args.nick]
-            else:
-                keys = os.listdir(catdir)
-            for key in keys:
-                seed_path = os.path.join(catdir, key)
-                gkey_path = os.path.join(seed_path, 'gkey.seeds')
-                seed = None
-                try:
-                    with open(gkey_path, 'r') as fileseed:
-                        seed = load(fileseed)
-                except IOError:
-                    return ["No seed file found in %s." % gkey_path, ""]
-                if seed:
-                    for val in list(seed.values()):
-                        installed_keys.append(GKEY(**val))
-        except OSError:
+        if not os.path.isdir(catdir):
             return (False, [_unicode("%s directory does not exist.") % catdir, ""])
+        if args.nick:
+            keys = [args.nick]
+        else:
+            keys = None
+        seeds = self.seedhandler.load_category(args.category, keys)
+        if args.nick and not seeds.seeds:
+            return (False, ["No seed file found in %s."
+                % os.path.join(catdir, args.nick, 'gkey.seeds'), ""])
+        installed_keys = [seeds.seeds[nick] for nick in sorted(seeds.seeds)]
         return (True, ['Found Key(s):', installed_keys])
 
 
+    def expiring(self, args):
+        '''Lists the installed keys expiring within the next days'''
+        if not args.category:
+            return (False, ["Please specify a category."])
+        catdir = self._set_category(args.category)
+        self.logger.debug("ACTIONS: expiring; catdir = %s" % catdir)
+        if not os.path.isdir(catdir):
+            return (False, [_unicode("%s directory does not exist.") % catdir, ""])
+        days = args.within
+        if days is None:
+            days = int(self.config.get_key('days_limit'))
+        index = self.gpg.expiryindex
+        index.load()
+        if not index.has_category(args.category):
+            self._build_expiryindex(args.category)
+        now = time.time()
+        found = index.expiring(args.category, days, now)
+        messages = []
+        for entry in found:
+            messages.append(_unicode("%s: %s %s, %s expires %s (%d days)")
+                % (entry.nick, entry.key, entry.fingerprint, entry.keydir,
+                time.strftime('%Y-%m-%d', time.gmtime(entry.expires)),
+                (entry.expires - now) // SECONDS_PER_DAY))
+        return (True, [_unicode("Found %d key(s) expiring within %d days:")
+            % (len(found), days), messages])
+
+
+    def _build_expiryindex(self, category):
+        '''Builds the category's expiry timeline from the listings
+        of its installed keys'''
+        seeds = self.seedhandler.load_category(category)
+        self.logger.debug("ACTIONS: _build_expiryindex; listing the keys "
+            "of %d installed gkeys" % len(seeds.seeds))
+        timeline = []
+        for nick in sorted(seeds.seeds):
+            gkey = seeds.seeds[nick]
+            if gkey.keys:
+                timeline.extend(expiry_entries(gkey, [self.gpg.list_keys(
+                    gkey.keydir, list(gkey.keys), colons=True)]))
+        self.gpg.expiryindex.replace(category, timeline)
+        return self.gpg.expiryindex.save()
+
+
     def user_confirm(self, message):
         '''Prompt a user to confirm an action
 
@@ -992,16 +1201,36 @@ class Actions(ActionBase):
         kwargs = self.seedhandler.build_gkeydict(args)
         keyresults = seeds.list(**kwargs)
         self.output('', '\n Refreshig keys...')
-        for gkey in sorted(keyresults):
-            self.logger.info(_unicode("Refreshig key %s, %s")
-                % (gkey.nick, gkey.pub_keyid))
+        failed = []
+        start = time.time()
+        jobs = getattr(args, 'jobs', 1)
+        for gkey, result, error in self._run_keydir_jobs(
+                self._refreshkey, sorted(keyresults), jobs):
             self.output('', _unicode("  %s: %s")
                 % (gkey.name, ', '.join(gkey.pub_keyid)))
             #self.output('', "  ===============")
-            self.logger.debug(_unicode("ACTIONS: refreshkey; gkey = %s")
-                % _unicode(gkey))
-            results[gkey.keydir] = self.gpg.refresh_key(gkey)
-        return (True, ['Completed'])
+            if error or result.returncode:
+                failed.append(gkey)
+            results[gkey.nick] = result
+        elapsed = _unicode("Completed in %.1f seconds") % (time.time() - start)
+        self.logger.info("ACTIONS: refreshkey; %s, %d jobs" % (elapsed, jobs))
+        if failed:
+            self.output([failed], "\n Failed to refresh:")
+        return (not failed, [elapsed])
+
+
+    def _refreshkey(self, gpg, gkey):
+        '''Refreshes a single gkey, run by refreshkey's workers
+
+        @param gpg: GkeysGPG instance to use
+        @param gkey: GKEY instance
+        @returns the gpg result
+        '''
+        self.logger.info(_unicode("Refreshig key %s, %s")
+            % (gkey.nick, gkey.pub_keyid))
+        self.logger.debug(_unicode("ACTIONS: refreshkey; gkey = %s")
+            % _unicode(gkey))
+        return gpg.refresh_key(gkey)
 
 
     def key_search(self, args, data_only=False):
@@ -52,17 +52,22 @@ class Args(object):
         self.exact = False
         self.filename = None
         self.fingerprint = None
+        self.fuzzy = False
+        self.jobs = 1
+        self.json = False
         self.keyid = None
         self.keyring = None
         self.keys = None
         self.nick = None
         self.name = None
+        self.regex = None
         self.keydir = None
         self.seedfile = None
         self.signature = None
         self.status = False
         self.timestamp = None
         self.uid = None
+        self.within = None
         self.fetchonly = None
 
 
@@ -131,6 +136,12 @@ class CliBase(object):
             action='store_true', default=False,
             help='Use CASE matching in searches')
 
+    @staticmethod
+    def _option_fuzzy(parser=None):
+        parser.add_argument('--fuzzy', dest='fuzzy',
+            action='store_true', default=False,
+            help='Allow typos in the name and uid searches')
+
     @staticmethod
     def _option_fetchonly(parser=None):
         parser.add_argument('--fetchonly',
@@ -171,6 +182,17 @@ class CliBase(object):
             nargs='+',
             help='The long keyid of the gpg key to search for')
 
+    @staticmethod
+    def _option_jobs(parser=None):
+        parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+            help='The number of keydirs or key check processes to run concurrently')
+
+    @staticmethod
+    def _option_json(parser=None):
+        parser.add_argument('--json', dest='json', default=False,
+            action='store_true',
+            help='Output the results as json')
+
     @staticmethod
     def _option_justdoit(parser=None):
         parser.add_argument('--justdoit', dest='justdoit',
@@ -234,6 +256,12 @@ class CliBase(object):
             action='store_true', default=False,
             help='Turn on timestamp use')
 
+    @staticmethod
+    def _option_regex(parser=None):
+        parser.add_argument('--regex', dest='regex', default=None,
+            help='Regular expression to match against the nick, name, '
+            'uids and fingerprints')
+
     @staticmethod
     def _option_uid(parser=None):
         parser.add_argument('-u', '--uid', dest='uid', nargs='+', default=None,
@@ -249,6 +277,12 @@ class CliBase(object):
         parser.add_argument('-U', '--user', dest='user', default=None,
             help='User parameter for service login')
 
+    @staticmethod
+    def _option_within(parser=None):
+        parser.add_argument('--within', dest='within', type=int, default=None,
+            help='The number of days ahead to list the expiring keys for, '
+            'defaults to the days_limit setting')
+
     def parse_args(self, argv):
         '''Parse a list of aruments
 
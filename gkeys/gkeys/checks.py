@@ -11,6 +11,7 @@
 """
 
 import time
+from array import array
 from collections import namedtuple, OrderedDict
 
 from gkeys.gkey import GKEY_CHECK
@@ -84,6 +85,9 @@ TEST_REQUIREMENTS = {
 
 SECONDS_PER_DAY = 86400
 
+# days to the expiry warning of spec checks
+EXPIRE_WARNING_DAYS = 30
+
 
 SPECCHECK_STRING = '''    ----------
     Fingerprint......: %(fingerprint)s
@@ -291,6 +295,19 @@ class KeyChecks(object):
         return results
 
 
+    def spec_check_batch(self, listings):
+        '''Performs the minimum specifications checks on many keys
+        in a single SpecBatch pass
+
+        @param listings: list of (keyid, pyGPG.output.GPGResult) tuples
+        @returns list of the spec_check() results, in the order of listings
+        '''
+        batch = SpecBatch(self.logger, self.check_id)
+        for keyid, result in listings:
+            batch.add(keyid, result)
+        return batch.evaluate()
+
+
     def _test_algo(self, data, stats):
         algo = data.pubkey_algo
         if algo in TEST_SPEC['algorithms']:
@@ -374,7 +391,7 @@ class KeyChecks(object):
         else:
             self.logger.warn("ERROR in key %s : invalid gpg key expire date: %s"
                 % (data.long_keyid, data.expiredate))
-        if 0 < days < 30 and not ('i' in data.validity or 'r' in data.validity):
+        if 0 < days < EXPIRE_WARNING_DAYS and not ('i' in data.validity or 'r' in data.validity):
             stats[SPEC_INDEX['expire_reason']] = '<== WARNING < 30 days'
             self.logger.warn("WARNING in key %s : gpg key expire date: %s WARNING < 30 days"
                 % (data.long_keyid, data.expiredate))
@@ -437,3 +454,315 @@ class KeyChecks(object):
                 stats[SPEC_INDEX['passed_spec']] = False
                 break
         return stats
+
+
+def days_left(expires, now):
+    '''Returns the spec check days till the expires timestamp'''
+    if expires == float("inf"):
+        return expires
+    return max(0, int((expires - now) / SECONDS_PER_DAY))
+
+
+def expire_reason(days, expire, revoked):
+    '''Returns the spec check expire_reason of a key
+
+    @param days: the key's days till expiry
+    @param expire: boolean, the expire test result
+    @param revoked: boolean, the key is revoked or invalid
+    '''
+    reason = ''
+    if not expire and not revoked:
+        reason = '<== Exceeds specification'
+    if 0 < days < EXPIRE_WARNING_DAYS and not revoked:
+        reason = '<== WARNING < 30 days'
+    return reason
+
+
+def spec_passed(check):
+    '''Returns the passed_spec value of a SpecCheck's test results'''
+    for test, result in TEST_REQUIREMENTS.items():
+        if ((check.key == 'PUB' and test == 'sign_capable') or
+            (check.capabilities == 'e' and test in ['algo', 'bits', 'sign_capable'])
+            or (check.capabilities == 'a' and test in ['sign_capable'])):
+            continue
+        if getattr(check, test) != result:
+            return False
+    return True
+
+
+# the inputs of a SpecCheck's date dependent fields
+SpecTimes = namedtuple('SpecTimes', ['created', 'expires', 'expire_limit',
+    'revoked'])
+
+
+def refresh_speccheck(results, times, now=None):
+    '''Recomputes the date dependent fields of stored spec check results,
+    the created, days, expire, expire_reason and passed_spec fields
+
+    @param results: dict of {pub keyid: list of SpecCheck}
+    @param times: dict of {pub keyid: list of SpecTimes} of the results
+    @param now: optional timestamp, defaults to the current time
+    @returns dict of {pub keyid: list of SpecCheck}
+    '''
+    now = now or time.time()
+    refreshed = {}
+    for keyid, checks in results.items():
+        refreshed[keyid] = []
+        pub_days = 0
+        for check, spec_times in zip(checks, times[keyid]):
+            days = days_left(spec_times.expires, now)
+            if check.key == 'PUB':
+                pub_days = days
+            elif days == float("inf"):
+                days = pub_days
+            expire = days <= spec_times.expire_limit
+            check = check._replace(created=spec_times.created <= now,
+                days=days, expire=expire,
+                expire_reason=expire_reason(days, expire, spec_times.revoked))
+            refreshed[keyid].append(check._replace(passed_spec=spec_passed(check)))
+    return refreshed
+
+
+# the capabilities string's spec rules, looked up once per distinct string
+CapsRule = namedtuple('CapsRule', ['passed', 'reason', 'long_caps', 'sign',
+    'encrypt', 'expire', 'skip_algo', 'skip_sign'])
+
+
+class SpecBatch(object):
+    '''Evaluates the spec checks of many keys' colon listings at once
+
+    The PUB and SUB records are loaded into columnar arrays of their
+    algorithm, bit length, creation and expiry dates, capabilities and
+    validity.  The algorithm, capabilities and validity columns hold
+    indexes into tables of their distinct values, so every rule is
+    tested once per distinct value and once per column entry, giving the
+    same SpecCheck results as KeyChecks.spec_check() for each listing.
+    '''
+
+    def __init__(self, logger, qualified_id_check=True):
+        self.logger = logger
+        self.check_id = qualified_id_check
+        self.listings = []
+        self.times = []
+        # one entry per PUB/SUB record
+        self.is_pub = array('B')
+        self.algo = array('H')
+        self.bits = array('l')
+        self.created = array('d')
+        self.expires = array('d')
+        self.caps = array('H')
+        self.validity = array('H')
+        self.version = array('B')
+        self.owner = array('l')
+        self.fingerprint = []
+        self.qualified_id = []
+        self.id_reason = []
+        # the distinct values of the indexed columns
+        self.algos = []
+        self.capabilities = []
+        self.validities = []
+        self._values = ({}, {}, {})
+
+
+    def _intern(self, column, table, value):
+        index = self._values[column].get(value)
+        if index is None:
+            index = self._values[column][value] = len(table)
+            table.append(value)
+        return index
+
+
+    def add(self, keyid, result):
+        '''Loads the PUB and SUB records of a key's colon listing
+
+        @param keyid: the keyid checked
+        @param result: pyGPG.output.GPGResult object
+        '''
+        rows = []
+        row = pub = None
+        found_id = False
+        found_id_reason = ''
+        for data in result.status.data:
+            if data.name in ["PUB", "SUB"]:
+                row = len(self.is_pub)
+                if data.name == "PUB":
+                    pub = row
+                    found_id = False
+                    found_id_reason = ''
+                    self.qualified_id.append(False)
+                    self.id_reason.append('')
+                    self.fingerprint.append('')
+                else:
+                    self.qualified_id.append(found_id)
+                    self.id_reason.append(found_id_reason)
+                    self.fingerprint.append('%s' % data.long_keyid)
+                rows.append((data.name == "PUB", data.long_keyid, row))
+                self.is_pub.append(data.name == "PUB")
+                self.owner.append(-1 if pub is None else pub)
+                self.algo.append(self._intern(0, self.algos, data.pubkey_algo))
+                self.bits.append(int(data.keylength or 0))
+                try:
+                    self.created.append(float(data.creation_date))
+                except ValueError:
+                    self.created.append(0)
+                try:
+                    self.expires.append(float(data.expiredate))
+                except ValueError:
+                    self.expires.append(float("inf"))
+                self.caps.append(self._intern(1, self.capabilities,
+                    data.key_capabilities))
+                self.validity.append(self._intern(2, self.validities,
+                    data.validity))
+                self.version.append(False)
+            elif row is None:
+                continue
+            elif data.name == "FPR":
+                self.fingerprint[row] = data.fingerprint
+                fpr_version = KEY_VERSION_FPR_LEN[len(data.fingerprint)]
+                self.version[row] = fpr_version in TEST_SPEC['versions']
+            elif data.name == "UID":
+                if not self.check_id:
+                    self.qualified_id[row] = '-----'
+                elif TEST_SPEC['qualified_id'] in data.user_ID:
+                    self.qualified_id[row] = True
+                else:
+                    self.id_reason[row] = ("<== '%s' user id not found"
+                        % TEST_SPEC['qualified_id'])
+                if self.qualified_id[row] in [True, '-----']:
+                    found_id = self.qualified_id[row]
+                    found_id_reason = self.id_reason[row] = ''
+                else:
+                    found_id_reason = self.id_reason[row]
+        self.listings.append((keyid, rows))
+
+
+    def _algo_table(self):
+        '''Returns the (algo passed, minimum bit length) of each algorithm'''
+        table = []
+        for algo in self.algos:
+            if algo in TEST_SPEC['algorithms']:
+                table.append((True, TEST_SPEC['bits'][ALGORITHM_CODES[algo]]))
+            else:
+                table.append((False, None))
+        return table
+
+
+    def _caps_table(self):
+        '''Returns the CapsRule of each capabilities string'''
+        table = []
+        for caps in self.capabilities:
+            passed = not ('e' in caps and ('s' in caps or 'a' in caps))
+            kcaps = []
+            if passed:
+                kcaps = [CAPABILITY_MAP[x] for x in caps if CAPABILITY_MAP[x]]
+            delta_t = TEST_SPEC['expire']
+            if caps:
+                try:
+                    delta_t = TEST_SPEC['subkeys'][CAPABILITY_MAP[caps[0]]]['expire']
+                except KeyError:
+                    pass
+            table.append(CapsRule(passed,
+                '' if passed else "<== Mixing of 'e' with 's' and/or 'a'",
+                ', '.join(kcaps), passed and 's' in caps, passed and 'e' in caps,
+                delta_t, caps == 'e', caps in ['e', 'a']))
+        return table
+
+
+    def _skipped(self, test, rules):
+        '''Returns the column of the records test does not apply to'''
+        if test == 'sign_capable':
+            return [p or r.skip_sign for p, r in zip(self.is_pub, rules)]
+        if test in ['algo', 'bits']:
+            return [r.skip_algo for r in rules]
+        return [False] * len(rules)
+
+
+    def evaluate(self):
+        '''Evaluates the spec checks of all the loaded keys
+
+        @returns list of the KeyChecks.spec_check() results of the keys,
+                 in the order they were added, their SpecTimes are left
+                 in the times list
+        '''
+        now = time.time()
+        infinite = float("inf")
+        algos = self._algo_table()
+        caps = self._caps_table()
+        rules = [caps[x] for x in self.caps]
+        valid = [x in VALID_LIST for x in self.validities]
+        revoked = [('i' in x or 'r' in x) for x in self.validities]
+        revoked = [revoked[x] for x in self.validity]
+
+        columns = {}
+        columns['algo'] = [algos[x][0] for x in self.algo]
+        columns['bits'] = [algos[a][0] and b >= algos[a][1]
+            for a, b in zip(self.algo, self.bits)]
+        columns['created'] = [x <= now for x in self.created]
+        columns['version'] = [bool(x) for x in self.version]
+        columns['id'] = self.qualified_id
+        columns['is_valid'] = [valid[x] for x in self.validity]
+        columns['caps'] = [r.passed for r in rules]
+        days = [days_left(x, now) for x in self.expires]
+        # a subkey without an expiry date has its primary key's days left
+        for row, is_pub in enumerate(self.is_pub):
+            if not is_pub and days[row] == infinite:
+                owner = self.owner[row]
+                days[row] = days[owner] if owner >= 0 else 0
+        delta_t = [TEST_SPEC['expire'] if p else r.expire
+            for p, r in zip(self.is_pub, rules)]
+        columns['expire'] = [d <= t for d, t in zip(days, delta_t)]
+        # the primary keys' capabilities are tested before their validity
+        use_caps = [not p and v for p, v in zip(self.is_pub, columns['is_valid'])]
+        columns['sign_capable'] = [u and r.sign for u, r in zip(use_caps, rules)]
+        encrypt = [u and r.encrypt for u, r in zip(use_caps, rules)]
+        long_caps = [r.long_caps if u else '' for u, r in zip(use_caps, rules)]
+
+        passed = [True] * len(rules)
+        for test, required in TEST_REQUIREMENTS.items():
+            passed = [ok and (skip or value == required) for ok, value, skip
+                in zip(passed, columns[test], self._skipped(test, rules))]
+        reasons = self._expire_reasons(days, columns['expire'], revoked)
+
+        specchecks = list(map(SpecCheck._make, zip(
+            ['PUB' if x else 'SUB' for x in self.is_pub],
+            [self.capabilities[x] for x in self.caps],
+            self.fingerprint, columns['bits'], columns['created'],
+            columns['expire'], encrypt, columns['sign_capable'],
+            columns['algo'], columns['version'], self.qualified_id, days,
+            [self.validities[x] for x in self.validity], reasons, long_caps,
+            columns['caps'], [r.reason for r in rules], self.id_reason,
+            columns['is_valid'], passed)))
+
+        results = []
+        self.times = []
+        for keyid, rows in self.listings:
+            checks = {}
+            times = {}
+            for is_pub, long_keyid, row in rows:
+                if is_pub:
+                    pub_keyid = long_keyid
+                    checks[long_keyid] = []
+                    times[long_keyid] = []
+                checks[pub_keyid].append(specchecks[row])
+                times[pub_keyid].append(SpecTimes(self.created[row],
+                    self.expires[row], delta_t[row], revoked[row]))
+            results.append(checks)
+            self.times.append(times)
+        self.logger.debug("SpecBatch: evaluate; checked %d keys, %d records, "
+            "%d passed" % (len(self.listings), len(passed), passed.count(True)))
+        return results
+
+
+    def _expire_reasons(self, days, expire, revoked):
+        '''Returns the expire_reason column, logging the failed records'''
+        reasons = []
+        for row, days_till in enumerate(days):
+            if not expire[row]:
+                self.logger.warn("ERROR in key %s : gpg key expire date %s, "
+                    "days: %s" % (self.fingerprint[row], "is invalid"
+                    if revoked[row] else "EXCEEDS specification", days_till))
+            if 0 < days_till < EXPIRE_WARNING_DAYS and not revoked[row]:
+                self.logger.warn("WARNING in key %s : gpg key expire date "
+                    "WARNING < 30 days, days: %s" % (self.fingerprint[row], days_till))
+            reasons.append(expire_reason(days_till, expire[row], revoked[row]))
+        return reasons
@@ -87,6 +87,19 @@ class GKeysConfig(GPGConfig):
         self.defaults['verify-nick'] = 'gkeys'
         self.defaults['verify-seeds'] = {}
         self.defaults['days_limit'] = 30
+        # days between keyserver refreshes of unchanged keys by updateseed
+        self.defaults['refresh_interval'] = 7
+        # record seed file changes in an append-only journal,
+        # compacted into the seed file once over the size (bytes)
+        # or age (days) limit
+        self.defaults['seed_journal'] = 'no'
+        self.defaults['journal_max_size'] = 262144
+        self.defaults['journal_max_age'] = 7
+        # storage of the categories' installed keys dbs, json or sqlite
+        self.defaults['installed_db_backend'] = 'json'
+        # list the keydirs' keys with the in-process keyring reader,
+        # off until its parity with gpg's colon listing is tested in CI
+        self.defaults['keyring_reader'] = 'no'
 
 
     def read_config(self, filename=None):
@@ -76,3 +76,8 @@ class UpdateDbError(GkeysException):
 
 
 
+
+
+class KeyringError(GkeysException):
+    '''Raised for a keyring the in-process reader can not list, the
+    listing is then left to gpg'''
@@ -0,0 +1,183 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - expiryindex.py
+
+    Persistent timeline of the installed primary keys' and subkeys'
+    expiry dates per keyring category
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import json
+import os
+import time
+
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from gkeys.checks import SECONDS_PER_DAY
+from gkeys.fileops import atomic_write, ensure_dirs
+
+
+EXPIRYINDEX_FILE = 'expiry.index'
+EXPIRYINDEX_VERSION = 1
+
+# the key validities left out of the timeline
+UNLISTED_VALIDITY = ['r', 'i']
+
+
+# an expiring primary key or subkey of an installed gkey
+ExpiryEntry = namedtuple('ExpiryEntry', ['expires', 'key', 'fingerprint',
+    'nick', 'keydir'])
+
+
+def expiry_entries(gkey, results):
+    '''Returns the ExpiryEntry of every expiring, unrevoked key listed
+
+    @param gkey: GKEY instance the keys are installed for
+    @param results: list of colon listing results of the gkey's keys
+    @returns list of ExpiryEntry instances
+    '''
+    entries = []
+    for result in results:
+        key = None
+        for data in result.status.data:
+            if data.name in ["PUB", "SUB"]:
+                key = None
+                if data.expiredate and data.validity not in UNLISTED_VALIDITY:
+                    key = [int(data.expiredate), data.name,
+                        '0x' + data.long_keyid, gkey.nick, gkey.keydir]
+                    entries.append(key)
+            elif data.name == "FPR" and key is not None:
+                key[2] = data.fingerprint
+                key = None
+    return [ExpiryEntry(*x) for x in entries]
+
+
+class ExpiryIndex(object):
+    '''Keeps every category's installed expiring keys in a list sorted
+    by their expiry timestamps, so the keys expiring in a date range
+    are found by bisection.
+
+    Keys without an expiry date, and revoked or invalid keys, are not
+    in the timeline.
+    '''
+
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.filename = os.path.join(config.get_key('gkeysdir'),
+            EXPIRYINDEX_FILE)
+        self.timelines = None
+
+
+    def load(self):
+        '''Load the index file, an absent or damaged index loads empty
+
+        @returns boolean, True if the index file was read
+        '''
+        self.timelines = {}
+        try:
+            with open(self.filename, 'r') as indexfile:
+                data = json.load(indexfile)
+        except (IOError, ValueError) as err:
+            self.logger.debug("ExpiryIndex: load; no usable index file %s: %s"
+                % (self.filename, str(err)))
+            return False
+        if data.get('version') != EXPIRYINDEX_VERSION:
+            self.logger.debug("ExpiryIndex: load; discarding index version %s"
+                % str(data.get('version')))
+            return False
+        for category, entries in data['timelines'].items():
+            self.timelines[category] = [ExpiryEntry(*x) for x in entries]
+        return True
+
+
+    def save(self):
+        '''Save the index file
+
+        @returns boolean
+        '''
+        data = {'version': EXPIRYINDEX_VERSION, 'timelines': self.timelines}
+        try:
+            ensure_dirs(os.path.dirname(self.filename),
+                mode=int(self.config.get_key('permissions', 'directories'), 0))
+            atomic_write(self.filename, json.dumps(data, sort_keys=True))
+        except (IOError, OSError) as err:
+            self.logger.debug("ExpiryIndex: save; failed to save %s: %s"
+                % (self.filename, str(err)))
+            return False
+        return True
+
+
+    def has_category(self, category):
+        '''Checks if the category's timeline was built
+
+        @param category: string, the keyring category
+        @returns boolean
+        '''
+        if self.timelines is None:
+            self.load()
+        return category in self.timelines
+
+
+    def update(self, category, gkey, results):
+        '''Replace the timeline entries for the gkey
+
+        @param category: string, the keyring category the gkey is installed in
+        @param gkey: GKEY instance
+        @param results: list of colon listing results of the gkey's keys
+        '''
+        self.remove(category, nick=gkey.nick)
+        # the timelines are built for a whole category by replace()
+        if category not in self.timelines:
+            return
+        timeline = self.timelines[category]
+        for entry in expiry_entries(gkey, results):
+            insort(timeline, entry)
+
+
+    def remove(self, category, nick=None, keydir=None):
+        '''Remove the timeline entries of a nick or of all nicks in a keydir
+
+        @param category: string, the keyring category
+        @param nick: optional string, the gkey nick to remove
+        @param keydir: optional string, remove all gkeys installed in keydir
+        '''
+        if self.timelines is None:
+            self.load()
+        if category not in self.timelines:
+            return
+        self.timelines[category] = [x for x in self.timelines[category]
+            if not ((nick is None or x.nick == nick)
+                and (keydir is None or x.keydir == keydir))]
+
+
+    def replace(self, category, timeline):
+        '''Replace the category's timeline
+
+        @param category: string, the keyring category
+        @param timeline: list of ExpiryEntry instances
+        '''
+        if self.timelines is None:
+            self.load()
+        self.timelines[category] = sorted(timeline)
+
+
+    def expiring(self, category, days, now=None):
+        '''Find the keys expiring within the next days
+
+        @param category: string, the keyring category
+        @param days: int, the number of days from now
+        @param now: optional timestamp, defaults to the current time
+        @returns list of ExpiryEntry instances, sorted by expiry date
+        '''
+        if self.timelines is None:
+            self.load()
+        now = int(now or time.time())
+        timeline = self.timelines.get(category, [])
+        start = bisect_left(timeline, (now + 1,))
+        end = bisect_left(timeline, (now + days * SECONDS_PER_DAY + 1,))
+        return timeline[start:end]
@@ -1,5 +1,6 @@
 import os
 import shutil
+import threading
 
 from snakeoil.osutils import (ensure_dirs as snakeoil_ensure_dirs)
 
@@ -86,6 +87,35 @@ def updateseeds(config, logger, src, dst):
     return True
 
 
+def atomic_write(filepath, data, mode='w'):
+    '''Writes data to a temporary file in the same directory,
+    fsyncs it, then renames it over filepath.  Readers only ever
+    see either the old or the complete new file.
+
+    @param filepath: string, the destination file path
+    @param data: string (or bytes for mode='wb') to write, or a function
+        taking the open file object which writes the data itself
+    @param mode: string, the open() mode to use
+    '''
+    dirname, basename = os.path.split(os.path.abspath(filepath))
+    tmppath = os.path.join(dirname, '.%s.%d.%d.tmp'
+        % (basename, os.getpid(), threading.current_thread().ident))
+    try:
+        with open(tmppath, mode) as tmpfile:
+            if callable(data):
+                data(tmpfile)
+            else:
+                tmpfile.write(data)
+            tmpfile.flush()
+            os.fsync(tmpfile.fileno())
+        os.rename(tmppath, filepath)
+    except Exception:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+    return True
+
+
 def rm_files(config, logger, files, lock=None):
     pass
 
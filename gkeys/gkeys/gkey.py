@@ -10,9 +10,20 @@
     @license: GNU GPL2, see COPYING for details.
 """
 
+import binascii
+import re
+import sys
 
+from array import array
 from collections import namedtuple
 
+if sys.version_info[0] >= 3:
+    from collections.abc import MutableMapping
+    _text_type = str
+else:
+    from collections import MutableMapping
+    _text_type = unicode
+
 
 GKEY_STRING = '''    ----------
     Name.........: %(name)s
@@ -31,23 +42,46 @@ GKEY_FINGERPRINTS = \
 
 
 class GKEY(namedtuple('GKEY', ['nick', 'name', 'keydir', 'keys', 'fingerprint', 'uid'])):
-    '''Class to hold the relavent info about a key'''
+    '''Class to hold the relavent info about a key
+
+    The keyid and pub_keyid values are derived from the fingerprint and
+    keys fields on their first use, and kept with the instance.  A tuple
+    subclass can not add __slots__, so they are kept in its __dict__,
+    which is only created then.
+    '''
 
     field_types = {'nick': str, 'name': str, 'keydir': str, 'keys': list,
         'fingerprint': list, 'uid': list}
-    __slots__ = ()
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError("can't set attribute")
+
+
+    def __getstate__(self):
+        # the derived keyids are not pickled
+        return None
+
+
+    def _keyids(self, name, fingerprints):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            keyids = tuple('0x' + x[-16:] for x in fingerprints or [])
+            self.__dict__[name] = keyids
+            return keyids
 
 
     @property
     def keyid(self):
         '''Keyid is a substring value of the fingerprint'''
-        return ['0x' + x[-16:] for x in self.fingerprint]
+        return list(self._keyids('_keyid', self.fingerprint))
 
 
     @property
     def pub_keyid(self):
         '''Keyid is a substring value of the keys fingerprints'''
-        return ['0x' + x[-16:] for x in self.keys]
+        return list(self._keyids('_pub_keyid', self.keys))
 
 
     @property
@@ -83,7 +117,169 @@ class GKEY(namedtuple('GKEY', ['nick', 'name', 'keydir', 'keys', 'fingerprint',
                     fingerprints.add(data.fingerprint)
                 elif data.name ==  "UID":
                     uids.add(data.user_ID)
-        return self._make([self.nick, self.name, self.keydir, self.keys, list(fingerprints), sorted(uids)])
+        return self._make([self.nick, self.name, self.keydir, self.keys, sorted(fingerprints), sorted(uids)])
+
+
+# fingerprints GKEYStore packs as 20 byte binaries,
+# any other form is kept as is
+PACKED_FPR_RE = re.compile('^[0-9A-F]{40}$')
+FPR_SIZE = 20
+
+
+class GKEYStore(MutableMapping):
+    '''Compact {nick: GKEY} mapping for large collections of seeds
+
+    The seeds are kept in columns instead of one namedtuple of lists per
+    seed.  The names and uids are packed as utf-8 text in one buffer, the
+    keydirs are interned, and the keys and fingerprints are packed as
+    20 byte binaries in another buffer.  Each lookup returns a new GKEY
+    view of the seed.
+
+    Replaced and deleted seeds leave their space in the columns until
+    enough of it has built up to repack them.
+    '''
+
+    def __init__(self, seeds=None):
+        self._pack(seeds or [])
+
+
+    def _pack(self, seeds):
+        '''Packs the seeds into new, empty columns
+
+        @param seeds: {nick: GKEY} mapping or list of (nick, GKEY) pairs
+        '''
+        # nick: row number, or the GKEY itself for a seed with
+        # a field the columns can not hold
+        self._rows = {}
+        self._keydirs = []
+        self._interned = {}
+        # per row: its start in _text_start (the name, then the uids)
+        # and in the _fprs entries (the keys, then the fingerprints),
+        # and its number of keys
+        self._str_start = array('L', [0])
+        self._fpr_start = array('L', [0])
+        self._nkeys = array('L')
+        self._text = bytearray()
+        self._text_start = array('L', [0])
+        self._fprs = bytearray()
+        # fpr entry number: fingerprint string, for the unpackable ones
+        self._raw = {}
+        self._garbage = 0
+        self.update(seeds)
+
+
+    @staticmethod
+    def _packable(gkey):
+        return (all(isinstance(getattr(gkey, field), list)
+                for field in ['keys', 'fingerprint', 'uid'])
+            and all(isinstance(x, _text_type) for x in [gkey.name] + gkey.uid))
+
+
+    def _pack_text(self, text):
+        self._text.extend(text.encode('utf_8'))
+        self._text_start.append(len(self._text))
+
+
+    def _unpack_text(self, index):
+        return self._text[self._text_start[index]:
+            self._text_start[index + 1]].decode('utf_8')
+
+
+    def _pack_fpr(self, fpr):
+        try:
+            packable = PACKED_FPR_RE.match(fpr)
+        except TypeError:
+            packable = False
+        if packable:
+            self._fprs.extend(binascii.unhexlify(fpr))
+        else:
+            self._raw[len(self._fprs) // FPR_SIZE] = fpr
+            self._fprs.extend(bytearray(FPR_SIZE))
+
+
+    def _unpack_fpr(self, entry):
+        if entry in self._raw:
+            return self._raw[entry]
+        start = entry * FPR_SIZE
+        fpr = binascii.hexlify(bytes(self._fprs[start:start + FPR_SIZE])).upper()
+        return fpr if isinstance(fpr, str) else fpr.decode('ascii')
+
+
+    def __setitem__(self, nick, gkey):
+        if isinstance(gkey, dict):
+            gkey = GKEY(**gkey)
+        # a replaced seed keeps its place in the order, as in a dict
+        if nick in self._rows:
+            self._discard(self._rows[nick])
+        if not self._packable(gkey):
+            self._rows[nick] = gkey
+            self._collect()
+            return
+        self._rows[nick] = len(self._keydirs)
+        # the keydir is most often the nick
+        if gkey.keydir == nick:
+            self._keydirs.append(nick)
+        else:
+            self._keydirs.append(self._interned.setdefault(gkey.keydir,
+                gkey.keydir))
+        for text in [gkey.name] + gkey.uid:
+            self._pack_text(text)
+        self._str_start.append(len(self._text_start) - 1)
+        for fpr in gkey.keys + gkey.fingerprint:
+            self._pack_fpr(fpr)
+        self._nkeys.append(len(gkey.keys))
+        self._fpr_start.append(len(self._fprs) // FPR_SIZE)
+        self._collect()
+
+
+    def __getitem__(self, nick):
+        row = self._rows[nick]
+        if isinstance(row, GKEY):
+            return row
+        start = self._fpr_start[row]
+        middle = start + self._nkeys[row]
+        name = self._str_start[row]
+        return GKEY(nick, self._unpack_text(name), self._keydirs[row],
+            [self._unpack_fpr(x) for x in range(start, middle)],
+            [self._unpack_fpr(x) for x in range(middle, self._fpr_start[row + 1])],
+            [self._unpack_text(x) for x in range(name + 1, self._str_start[row + 1])])
+
+
+    def __delitem__(self, nick):
+        self._discard(self._rows.pop(nick))
+        self._collect()
+
+
+    def _discard(self, row):
+        '''Counts the space a replaced or deleted row leaves unused'''
+        if not isinstance(row, GKEY):
+            self._garbage += 1
+
+
+    def _collect(self):
+        '''Repacks the columns once enough of them are unused'''
+        if self._garbage > 1024 and self._garbage > len(self._rows):
+            self._repack()
+
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+    def __len__(self):
+        return len(self._rows)
+
+
+    def __contains__(self, nick):
+        return nick in self._rows
+
+
+    def _repack(self):
+        self._pack([(nick, self[nick]) for nick in self._rows])
+
+
+    def __reduce__(self):
+        return (self.__class__, (list(self.items()),))
 
 
 class GKEY_CHECK(namedtuple('GKEY_CHECK', ['keyid', 'revoked', 'expired', 'invalid', 'sign'])):
@@ -3,6 +3,8 @@
 
 import os
 
+from argparse import Namespace
+
 from snakeoil.demandload import demandload
 
 from gkeys.config import GKeysConfig
@@ -10,6 +12,7 @@ from gkeys.gkey import GKEY
 
 demandload(
     "gkeys:log",
+    "gkeys.keyhandler:KeyHandler",
     "gkeys.lib:GkeysGPG",
     "gkeys.seedhandler:SeedHandler",
 )
@@ -38,6 +41,7 @@ class GkeysInterface(object):
             level=loglevel)
         self.gpg = None
         self.handler = None
+        self.keyhandler = None
 
 
     def keyid_search(self, keyid):
@@ -46,16 +50,13 @@ class GkeysInterface(object):
         @param keyid: string of the longkeyid to search for
         @returns dictionary of  {category: [GKEY, ...]}
         '''
-        results = {}
-        for cat in list(self.config.get_key('seeds')):
-            self.handler.load_category(cat)
-            found = self.handler.key_search({'keyid': keyid,}, ['keyid'])
-            if found:
-                if cat in results:
-                    results[cat].extend(found)
-                else:
-                    results[cat] = found
-        return results
+        # the KeyHandler tries the installed keyid index first and
+        # keeps the results of the repeated searches
+        if not self.keyhandler:
+            self.keyhandler = KeyHandler(self.config, self.logger)
+        args = Namespace(category=None, keyid=keyid, exact=False,
+            fuzzy=False, all=False)
+        return self.keyhandler.key_search(args)
 
 
     def verify_file(self, filepath, category='gentoo', nick='snapshot',
@@ -77,6 +78,8 @@ class GkeysInterface(object):
         if not keys:
             self.logger.warn('No installed keys found, try installing keys.')
             return False
+        # the handler holds on to the seeds between calls
+        keys.pack()
         key = self.handler.seeds.nick_search(nick)
         if not key:
             self.logger.debug("Failed to find.........: %s in category: %s"
@@ -90,7 +93,7 @@ class GkeysInterface(object):
         keyrings = self.config.get_key('keyring')
         catdir = os.path.join(keyrings, category)
         self.logger.debug("ACTIONS: verify; catdir = %s" % catdir)
-        self.gpg = GkeysGPG(self.config, catdir, self.logger)
+        self.gpg = GkeysGPG(self.config, catdir, self.logger, category)
         results = self.gpg.verify_file(key, None, filepath)
 
         (valid, trust) = results.verified
@@ -110,6 +113,7 @@ class GkeysInterface(object):
                 if key and key.nick:
                     if isinstance(key, GKEY):
                         self.gpg.basedir = os.path.join(keyrings, cat)
+                        self.gpg.category = cat
                         results = self.gpg.verify_file(key, None, filepath)
                         (valid, trust) = results.verified
                         if valid:
@@ -13,6 +13,7 @@ import os
 import sys
 import re
 
+from collections import OrderedDict, namedtuple
 from string import Template
 
 from snakeoil.demandload import demandload
@@ -26,10 +27,27 @@ from  gkeys.gkey import GKEY
 
 
 demandload(
+    "gkeys.keyindex:KeyIndex",
     "gkeys.seedhandler:SeedHandler",
 )
 
-KEY_OPTIONS = ['nick', 'name', 'keydir', 'fingerprint', 'keyid', 'uid']
+KEY_OPTIONS = ['nick', 'name', 'keydir', 'fingerprint', 'keyid', 'uid', 'regex']
+
+# number of per category key_search() results kept
+SEARCH_CACHE_SIZE = 256
+
+# the found GKEYs and the SeedHandler.category_state() of the seeds searched
+SearchResult = namedtuple('SearchResult', ['state', 'found'])
+
+
+def _search_value(value, exact):
+    '''Returns the cache key form of a search value, the substring
+    searches are case insensitive unless exact'''
+    if isinstance(value, (list, tuple)):
+        return tuple(_search_value(x, exact) for x in value)
+    if exact or not hasattr(value, 'lower'):
+        return value
+    return value.lower()
 
 
 class KeyHandler(object):
@@ -40,6 +58,9 @@ class KeyHandler(object):
         self.config = config
         self.logger = logger
         self._seedhandler = None
+        self._keyindex = None
+        # LRU of {(category, nicks, search): SearchResult}
+        self._search_cache = OrderedDict()
 
 
     @property
@@ -49,6 +70,13 @@ class KeyHandler(object):
         return self._seedhandler
 
 
+    @property
+    def keyindex(self):
+        if not self._keyindex:
+            self._keyindex = KeyIndex(self.config, self.logger)
+        return self._keyindex
+
+
     def autosearch_key(self, args, results):
         '''Search for the correct keyid from the GPGResult'''
         messages = []
@@ -87,16 +115,29 @@ class KeyHandler(object):
     def key_search(self, args, first_match=False):
         '''Search for a key's seed in the installed keys db'''
         results = {}
-        search_args = [x for x in KEY_OPTIONS if getattr(args, x)]
+        search_args = [x for x in KEY_OPTIONS if getattr(args, x, None)]
         if args.category:
             self.logger.debug(_unicode("KeyHandler: key_search; args.category = %s"), args.category)
-            self.seedhandler.load_category(args.category)
-            results[args.category] = self.seedhandler.key_search(args, search_args)
+            results[args.category] = self._category_search(args.category,
+                args, search_args)
         else:
-            for cat in sorted(self.config.get_key('seeds')):
+            indexed = rebuild_index = False
+            if search_args == ['keyid']:
+                results = self._keyindex_search(args, search_args, first_match)
+                indexed = bool(results)
+                rebuild_index = (not indexed and not first_match and
+                    not os.path.exists(self.keyindex.filename))
+            # fall back to searching every category
+            categories = [] if indexed else sorted(self.config.get_key('seeds'))
+            for cat in categories:
                 self.logger.debug(_unicode("KeyHandler: key_search; cat = %s"), cat)
-                self.seedhandler.load_category(cat)
-                found = self.seedhandler.key_search(args, search_args)
+                if rebuild_index:
+                    self.seedhandler.load_category(cat)
+                    for gkey in self.seedhandler.seeds.seeds.values():
+                        self.keyindex.update(cat, gkey)
+                    found = self.seedhandler.key_search(args, search_args)
+                else:
+                    found = self._category_search(cat, args, search_args)
                 if found:
                     if cat in results:
                         results[cat].extend(found)
@@ -104,17 +145,77 @@ class KeyHandler(object):
                         results[cat] = found
                     if first_match:
                         break
+            if rebuild_index:
+                self.keyindex.save()
         keys = {}
         for cat in results:
             keys[cat] = []
+            nicks = set()
             for result in results[cat]:
-                if result and result.nick not in keys[cat]:
+                if result and result.nick not in nicks:
                     if isinstance(result, GKEY):
+                        nicks.add(result.nick)
                         keys[cat].append(result)
 
-        self.logger.debug(_unicode("KeyHandler: key_search; keys = %s") % str(keys))
+        self.logger.debug(_unicode("KeyHandler: key_search; keys = %s"), keys)
         return keys
 
+    def _keyindex_search(self, args, search_args, first_match=False):
+        '''Search only the keydirs the keyid index lists for the keyid
+
+        @returns dictionary of {category: [GKEY, ...]}, empty if the
+            index has no confirmed match
+        '''
+        results = {}
+        located = self.keyindex.locate(args.keyid)
+        for cat in sorted(located):
+            self.logger.debug(_unicode("KeyHandler: _keyindex_search; cat = %s, keydirs = %s"),
+                cat, located[cat])
+            found = self._category_search(cat, args, search_args, located[cat])
+            if found:
+                results[cat] = found
+                if first_match:
+                    break
+        return results
+
+
+    def _category_search(self, category, args, search_args, nicks=None):
+        '''Loads and searches a category's seeds.  The results are
+        cached, a repeated search is answered from the cache while the
+        installed keys db and the keydirs' gkey.seeds have not changed
+        on disk.
+
+        @param category: string
+        @param args: argparse namespace instance
+        @param search_args: list of the KEY_OPTIONS searched
+        @param nicks: optional list of the keydirs to load
+        @returns list of GKEY instances
+        '''
+        exact = bool(getattr(args, 'exact', False))
+        key = (category, tuple(nicks or ()), exact,
+            bool(getattr(args, 'fuzzy', False)),
+            bool(getattr(args, 'all', False)),
+            tuple((x, getattr(args, x) if x == 'regex' else
+                _search_value(getattr(args, x), exact)) for x in sorted(search_args)))
+        try:
+            cached = self._search_cache.pop(key)
+        except KeyError:
+            cached = None
+        if cached is not None and cached.state == self.seedhandler.category_state(
+                category, nicks, keydirs=cached.state[0] == 'keydirs'):
+            self.logger.debug(_unicode("KeyHandler: _category_search; cached %s"),
+                category)
+            self._search_cache[key] = cached
+            return list(cached.found)
+        self.seedhandler.load_category(category, nicks)
+        found = self.seedhandler.key_search(args, search_args)
+        while len(self._search_cache) >= SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        self._search_cache[key] = SearchResult(self.seedhandler.loaded_state,
+            tuple(found))
+        return found
+
+
     @staticmethod
     def is_expiring(keys, days_limit=30):
         '''Check if any of the keys is within the days_limit'''
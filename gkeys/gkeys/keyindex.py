@@ -0,0 +1,154 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - keyindex.py
+
+    Persistent index of the installed keys' long keyids and fingerprints
+    across all keyring categories
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import json
+import os
+
+from gkeys.fileops import atomic_write, ensure_dirs
+
+
+KEYINDEX_FILE = 'keyid.index'
+KEYINDEX_VERSION = 1
+
+
+def index_key(keyid):
+    '''Returns the index key for a long keyid or fingerprint
+
+    @param keyid: string, long keyid (with or without the 0x prefix)
+        or a full fingerprint
+    @returns string
+    '''
+    key = keyid.replace(' ', '').upper()
+    if key.startswith('0X'):
+        key = key[2:]
+    return key
+
+
+class KeyIndex(object):
+    '''Maps every installed primary and subkey long keyid and fingerprint
+    to the category, nick and keydir it is installed in.
+
+    The index is only a shortcut, searches using it must still confirm
+    the match against the installed keys db and fall back to a full search.
+    '''
+
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.filename = os.path.join(config.get_key('gkeysdir'), KEYINDEX_FILE)
+        self.keys = None
+        self.owners = None
+
+
+    def load(self):
+        '''Load the index file, an absent or damaged index loads empty
+
+        @returns boolean, True if the index file was read
+        '''
+        self.keys = {}
+        self.owners = {}
+        try:
+            with open(self.filename, 'r') as indexfile:
+                data = json.load(indexfile)
+        except (IOError, ValueError) as err:
+            self.logger.debug("KeyIndex: load; no usable index file %s: %s"
+                % (self.filename, str(err)))
+            return False
+        if data.get('version') != KEYINDEX_VERSION:
+            self.logger.debug("KeyIndex: load; discarding index version %s"
+                % str(data.get('version')))
+            return False
+        self.keys = data['keys']
+        self.owners = data['owners']
+        return True
+
+
+    def save(self):
+        '''Save the index file
+
+        @returns boolean
+        '''
+        data = {'version': KEYINDEX_VERSION, 'keys': self.keys,
+            'owners': self.owners}
+        try:
+            ensure_dirs(os.path.dirname(self.filename),
+                mode=int(self.config.get_key('permissions', 'directories'), 0))
+            atomic_write(self.filename, json.dumps(data, sort_keys=True))
+        except (IOError, OSError) as err:
+            self.logger.debug("KeyIndex: save; failed to save %s: %s"
+                % (self.filename, str(err)))
+            return False
+        return True
+
+
+    def update(self, category, gkey):
+        '''Replace the index entries for the gkey
+
+        @param category: string, the keyring category the gkey is installed in
+        @param gkey: GKEY instance
+        '''
+        if self.keys is None:
+            self.load()
+        self.remove(category, nick=gkey.nick)
+        keys = set()
+        for fpr in set(gkey.fingerprint) | set(gkey.keys):
+            keys.add(index_key(fpr))
+            keys.add(index_key(fpr)[-16:])
+        owner = [category, gkey.nick, gkey.keydir]
+        for key in keys:
+            self.keys.setdefault(key, []).append(owner)
+        self.owners.setdefault(category, {})[gkey.nick] = {
+            'keydir': gkey.keydir, 'keys': sorted(keys)}
+
+
+    def remove(self, category, nick=None, keydir=None):
+        '''Remove the index entries for a nick or for all nicks in a keydir
+
+        @param category: string, the keyring category
+        @param nick: optional string, the gkey nick to remove
+        @param keydir: optional string, remove all gkeys installed in keydir
+        '''
+        if self.keys is None:
+            self.load()
+        cat_owners = self.owners.get(category, {})
+        if nick is not None:
+            nicks = [nick] if nick in cat_owners else []
+        else:
+            nicks = list(cat_owners)
+        for key_nick in nicks:
+            if keydir is not None and cat_owners[key_nick]['keydir'] != keydir:
+                continue
+            for key in cat_owners.pop(key_nick)['keys']:
+                owners = [x for x in self.keys.get(key, [])
+                    if not (x[0] == category and x[1] == key_nick)]
+                if owners:
+                    self.keys[key] = owners
+                else:
+                    self.keys.pop(key, None)
+
+
+    def locate(self, keyids):
+        '''Find the installed location of the keyids
+
+        @param keyids: string or list of long keyids or fingerprints
+        @returns dictionary of {category: [keydir, ...]}
+        '''
+        if self.keys is None:
+            self.load()
+        if not isinstance(keyids, list):
+            keyids = [keyids]
+        found = {}
+        for keyid in keyids:
+            for category, nick, keydir in self.keys.get(index_key(keyid), []):
+                if keydir not in found.setdefault(category, []):
+                    found[category].append(keydir)
+        return found
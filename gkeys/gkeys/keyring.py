@@ -0,0 +1,582 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - keyring.py
+
+    Pure python reader of the keydirs' OpenPGP keyrings, lists their
+    keys the way gpg's colon listing does without running gpg
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import binascii
+import hashlib
+import os
+import struct
+import time
+
+from collections import namedtuple
+
+from gkeys.exception import KeyringError
+from gkeys.listcache import ListingResult
+
+
+# the keyring files of a gpg homedir, in the order gpg picks them
+PUBRING_FILES = ['pubring.kbx', 'pubring.gpg']
+
+# gpg's --with-colons listing fields, field 10 holds the fingerprint of
+# the fpr records and the user id of the others
+COLON_FIELDS = ['name', 'validity', 'keylength', 'pubkey_algo', 'long_keyid',
+    'creation_date', 'expiredate', 'uid_hash', 'ownertrust', 'user_ID',
+    'signature_class', 'key_capabilities', 'issuer', 'flag',
+    'token_serial', 'hash_algo', 'curve_name']
+
+# KeyChecks.spec_check() sets the fingerprint of the key records,
+# it is not part of their colon line
+ColonRecord = namedtuple('ColonRecord', COLON_FIELDS + ['fingerprint'])
+FprRecord = namedtuple('FprRecord',
+    COLON_FIELDS[:9] + ['fingerprint'] + COLON_FIELDS[10:])
+
+# OpenPGP packet tags
+PKT_SIGNATURE = 2
+PKT_PUBLIC_KEY = 6
+PKT_USER_ID = 13
+PKT_PUBLIC_SUBKEY = 14
+PKT_USER_ATTRIBUTE = 17
+
+# signature types
+SIG_CERTS = (0x10, 0x11, 0x12, 0x13)
+SIG_SUBKEY_BINDING = 0x18
+SIG_DIRECT_KEY = 0x1f
+SIG_KEY_REVOCATION = 0x20
+SIG_SUBKEY_REVOCATION = 0x28
+SIG_CERT_REVOCATION = 0x30
+
+# key flags subpacket bits
+USAGE_CERT = 0x01
+USAGE_SIGN = 0x02
+USAGE_ENCRYPT = 0x04 | 0x08
+USAGE_AUTH = 0x20
+
+# gpg's usage of the keys without a key flags subpacket
+ALGO_USAGE = {
+    1: USAGE_CERT | USAGE_SIGN | USAGE_ENCRYPT | USAGE_AUTH,
+    2: USAGE_ENCRYPT,
+    3: USAGE_CERT | USAGE_SIGN,
+    16: USAGE_ENCRYPT,
+    17: USAGE_CERT | USAGE_SIGN | USAGE_AUTH,
+    18: USAGE_ENCRYPT,
+    19: USAGE_CERT | USAGE_SIGN | USAGE_AUTH,
+    22: USAGE_CERT | USAGE_SIGN | USAGE_AUTH,
+}
+
+# algorithms holding the key length in their first MPI
+MPI_ALGOS = (1, 2, 3, 16, 17)
+
+# hex encoded curve OIDs: (gpg's curve name, key length)
+CURVES = {
+    '2B06010401DA470F01': ('ed25519', 255),
+    '2B060104019755010501': ('cv25519', 255),
+    '2A8648CE3D030107': ('nistp256', 256),
+    '2B81040022': ('nistp384', 384),
+    '2B81040023': ('nistp521', 521),
+    '2B2403030208010107': ('brainpoolP256r1', 256),
+    '2B240303020801010B': ('brainpoolP384r1', 384),
+    '2B240303020801010D': ('brainpoolP512r1', 512),
+    '2B8104000A': ('secp256k1', 256),
+}
+
+KBX_MAGIC = b'KBXf'
+KBX_OPENPGP_BLOB = 2
+
+TRUSTDB_FILE = 'trustdb.gpg'
+TRUSTDB_RECORD_SIZE = 40
+TRUSTDB_TRUST_RECORD = 12
+
+
+Key = namedtuple('Key', ['version', 'created', 'algo', 'keylength', 'curve',
+    'fingerprint', 'keyid'])
+
+Signature = namedtuple('Signature', ['sigtype', 'created', 'issuer',
+    'expires', 'key_expires', 'key_flags', 'primary_uid'])
+
+
+def _unpack(fmt, data, pos):
+    size = struct.calcsize(fmt)
+    if pos + size > len(data):
+        raise KeyringError("Truncated OpenPGP data")
+    return struct.unpack(fmt, bytes(data[pos:pos + size]))
+
+
+def _hex(data):
+    return binascii.hexlify(bytes(data)).decode('ascii').upper()
+
+
+def iter_packets(data):
+    '''Yields the (tag, body) of each OpenPGP packet in data
+
+    @param data: bytearray
+    '''
+    pos = 0
+    end = len(data)
+    while pos < end:
+        ctb = data[pos]
+        pos += 1
+        if not ctb & 0x80:
+            raise KeyringError("Invalid OpenPGP packet header")
+        if ctb & 0x40:
+            tag = ctb & 0x3f
+            body = bytearray()
+            partial = True
+            while partial:
+                (first,) = _unpack('>B', data, pos)
+                pos += 1
+                partial = False
+                if first < 192:
+                    length = first
+                elif first < 224:
+                    length = ((first - 192) << 8) + _unpack('>B', data, pos)[0] + 192
+                    pos += 1
+                elif first == 255:
+                    (length,) = _unpack('>I', data, pos)
+                    pos += 4
+                else:
+                    length = 1 << (first & 0x1f)
+                    partial = True
+                body += data[pos:pos + length]
+                pos += length
+        else:
+            tag = (ctb >> 2) & 0x0f
+            length_type = ctb & 0x03
+            if length_type == 3:
+                length = end - pos
+            else:
+                fmt = ['>B', '>H', '>I'][length_type]
+                (length,) = _unpack(fmt, data, pos)
+                pos += struct.calcsize(fmt)
+            body = data[pos:pos + length]
+            pos += length
+        if pos > end:
+            raise KeyringError("Truncated OpenPGP packet")
+        yield tag, body
+
+
+def read_keyblocks(filename):
+    '''Reads the keyblocks of a pubring.gpg keyring or pubring.kbx keybox
+
+    @param filename: string
+    @returns list of keyblocks, each a list of (tag, body) packets
+    '''
+    with open(filename, 'rb') as ringfile:
+        data = bytearray(ringfile.read())
+    if data[8:12] == KBX_MAGIC:
+        return [list(iter_packets(block)) for block in _kbx_keyblocks(data)]
+    keyblocks = []
+    for tag, body in iter_packets(data):
+        if tag == PKT_PUBLIC_KEY:
+            keyblocks.append([])
+        if keyblocks:
+            keyblocks[-1].append((tag, body))
+    return keyblocks
+
+
+def _kbx_keyblocks(data):
+    '''Yields the OpenPGP keyblocks of the keybox data'''
+    pos = 0
+    while pos < len(data):
+        (length,) = _unpack('>I', data, pos)
+        if length < 6 or pos + length > len(data):
+            raise KeyringError("Damaged keybox blob")
+        if data[pos + 4] == KBX_OPENPGP_BLOB:
+            offset, size = _unpack('>II', data, pos + 8)
+            if offset + size > length:
+                raise KeyringError("Damaged keybox blob")
+            yield data[pos + offset:pos + offset + size]
+        pos += length
+
+
+def parse_key(body):
+    '''Parses a version 4 public key or subkey packet
+
+    @param body: bytearray, the packet body
+    @returns Key instance
+    '''
+    if not body or body[0] != 4:
+        raise KeyringError("Unsupported key version: %s"
+            % (body[0] if body else None))
+    created, algo = _unpack('>IB', body, 1)
+    curve = ''
+    if algo in MPI_ALGOS:
+        (bits,) = _unpack('>H', body, 6)
+        value = body[8:8 + (bits + 7) // 8]
+        keylength = int(_hex(value) or '0', 16).bit_length()
+    elif algo in (18, 19, 22):
+        (size,) = _unpack('>B', body, 6)
+        if 7 + size > len(body):
+            raise KeyringError("Truncated curve OID")
+        oid = _hex(body[7:7 + size])
+        if oid not in CURVES:
+            raise KeyringError("Unknown curve: %s" % oid)
+        curve, keylength = CURVES[oid]
+    else:
+        raise KeyringError("Unsupported key algorithm: %d" % algo)
+    fingerprint = hashlib.sha1(b'\x99' + struct.pack('>H', len(body))
+        + bytes(body)).hexdigest().upper()
+    return Key(4, created, algo, keylength, curve, fingerprint,
+        fingerprint[-16:])
+
+
+def _subpackets(data):
+    pos = 0
+    while pos < len(data):
+        first = data[pos]
+        if first < 192:
+            length = first
+            pos += 1
+        elif first < 255:
+            length = ((first - 192) << 8) + _unpack('>B', data, pos + 1)[0] + 192
+            pos += 2
+        else:
+            (length,) = _unpack('>I', data, pos + 1)
+            pos += 5
+        if not length or pos + length > len(data):
+            raise KeyringError("Damaged signature subpacket")
+        yield data[pos] & 0x7f, data[pos + 1:pos + length]
+        pos += length
+
+
+def parse_signature(body):
+    '''Parses the self-signature data of a signature packet, without
+    verifying it
+
+    @param body: bytearray, the packet body
+    @returns Signature instance or None for an unknown version
+    '''
+    if body and body[0] == 3:
+        sigtype, created = _unpack('>BI', body, 2)
+        return Signature(sigtype, created, _hex(_unpack('>8s', body, 7)[0]),
+            0, None, None, False)
+    if not body or body[0] != 4:
+        return None
+    (sigtype,) = _unpack('>B', body, 1)
+    (hashed_len,) = _unpack('>H', body, 4)
+    hashed = body[6:6 + hashed_len]
+    (unhashed_len,) = _unpack('>H', body, 6 + hashed_len)
+    unhashed = body[8 + hashed_len:8 + hashed_len + unhashed_len]
+    if 8 + hashed_len + unhashed_len > len(body):
+        raise KeyringError("Truncated signature packet")
+    created = 0
+    sig_expires = key_expires = key_flags = issuer = None
+    primary_uid = False
+    for subtype, data in _subpackets(hashed):
+        if subtype == 2:
+            (created,) = _unpack('>I', data, 0)
+        elif subtype == 3:
+            (sig_expires,) = _unpack('>I', data, 0)
+        elif subtype == 9:
+            (key_expires,) = _unpack('>I', data, 0)
+        elif subtype == 27:
+            key_flags = data[0] if data else 0
+        elif subtype == 25:
+            primary_uid = bool(data and data[0])
+        elif subtype == 16:
+            issuer = _hex(data)
+        elif subtype == 33 and issuer is None:
+            issuer = _hex(data[1:])[-16:]
+    if issuer is None:
+        for subtype, data in _subpackets(unhashed):
+            if subtype == 16:
+                issuer = _hex(data)
+            elif subtype == 33 and issuer is None:
+                issuer = _hex(data[1:])[-16:]
+    expires = created + sig_expires if sig_expires else 0
+    return Signature(sigtype, created, issuer, expires, key_expires,
+        key_flags, primary_uid)
+
+
+def _newest(sigs):
+    newest = None
+    for sig in sigs:
+        if newest is None or sig.created >= newest.created:
+            newest = sig
+    return newest
+
+
+def _capabilities(usage, primary=False):
+    '''Returns gpg's capability letters of a key's usage'''
+    caps = ''
+    if usage & USAGE_ENCRYPT:
+        caps += 'e'
+    if usage & USAGE_SIGN:
+        caps += 's'
+        if primary:
+            caps += 'c'
+    if usage & USAGE_CERT and 'c' not in caps:
+        caps += 'c'
+    if usage & USAGE_AUTH:
+        caps += 'a'
+    return caps
+
+
+def _colon_escape(data):
+    '''Escapes a user id the way gpg's colon listing does'''
+    out = bytearray()
+    for char in bytearray(data):
+        if char < 0x20 or char == 0x7f or char in (0x3a, 0x5c):
+            out += ('\\x%02x' % char).encode('ascii')
+        else:
+            out.append(char)
+    return bytes(out).decode('utf_8', 'replace')
+
+
+def _uid_hash(data):
+    try:
+        return hashlib.new('ripemd160', bytes(data)).hexdigest().upper()
+    except ValueError:
+        return ''
+
+
+def _timestamp(value):
+    return str(value) if value else ''
+
+
+class Keyblock(object):
+    '''A keyring's primary key with its user ids and subkeys, evaluated
+    from the self-signatures the way gpg does.
+
+    The signatures are not verified, the keyrings are only written by
+    gpg, which drops the invalid self-signatures on import.
+    '''
+
+    def __init__(self, packets, now=None):
+        self.now = now or time.time()
+        self.primary = None
+        self.direct = []
+        self.uids = []
+        self.subkeys = []
+        sigs = None
+        for tag, body in packets:
+            if tag == PKT_PUBLIC_KEY:
+                if self.primary is not None:
+                    raise KeyringError("Keyblock with two primary keys")
+                self.primary = parse_key(body)
+                sigs = self.direct
+            elif tag == PKT_USER_ID:
+                self.uids.append((body, []))
+                sigs = self.uids[-1][1]
+            elif tag == PKT_PUBLIC_SUBKEY:
+                self.subkeys.append((parse_key(body), []))
+                sigs = self.subkeys[-1][1]
+            elif tag == PKT_USER_ATTRIBUTE:
+                sigs = None
+            elif tag == PKT_SIGNATURE and sigs is not None:
+                sig = parse_signature(body)
+                if sig is not None and sig.issuer == self.primary.keyid:
+                    sigs.append(sig)
+        if self.primary is None:
+            raise KeyringError("Keyblock without a primary key")
+
+
+    def fingerprints(self):
+        '''Returns the fingerprints of the primary key and the subkeys'''
+        return [self.primary.fingerprint] + [x[0].fingerprint for x in self.subkeys]
+
+
+    def _expired(self, created, seconds):
+        expires = created + seconds if seconds else 0
+        return expires, bool(expires and expires <= self.now)
+
+
+    def records(self):
+        '''Returns the key's colon listing records'''
+        key = self.primary
+        revoked = any(x.sigtype == SIG_KEY_REVOCATION for x in self.direct)
+        direct = _newest([x for x in self.direct if x.sigtype == SIG_DIRECT_KEY])
+        uids = []
+        for data, sigs in self.uids:
+            selfsig = _newest([x for x in sigs if x.sigtype in SIG_CERTS])
+            uid_revoked = selfsig is not None and any(
+                x.sigtype == SIG_CERT_REVOCATION and x.created >= selfsig.created
+                for x in sigs)
+            uids.append((data, selfsig, uid_revoked))
+        candidates = [x for x in uids if x[1] is not None and not x[2]]
+        flagged = [x for x in candidates if x[1].primary_uid]
+        primary_sig = _newest(x[1] for x in flagged or candidates)
+        valid = bool(candidates or direct)
+        usage = key_expires = None
+        for sig in [primary_sig, direct]:
+            if sig is not None and usage is None:
+                usage = sig.key_flags
+            if sig is not None and key_expires is None:
+                key_expires = sig.key_expires
+        if usage is None:
+            usage = ALGO_USAGE.get(key.algo, 0)
+        expires, expired = self._expired(key.created, key_expires)
+        validity = ('i' if not valid else 'r' if revoked else
+            'e' if expired else '-')
+
+        subkeys = []
+        for subkey, sigs in self.subkeys:
+            binding = _newest([x for x in sigs if x.sigtype == SIG_SUBKEY_BINDING])
+            sub_revoked = revoked or any(x.sigtype == SIG_SUBKEY_REVOCATION
+                for x in sigs)
+            sub_usage = binding.key_flags if binding is not None else None
+            if sub_usage is None:
+                sub_usage = ALGO_USAGE.get(subkey.algo, 0)
+            sub_expires, sub_expired = self._expired(subkey.created,
+                binding.key_expires if binding is not None else None)
+            sub_valid = valid and binding is not None
+            subkeys.append((subkey, sub_usage, sub_expires,
+                'i' if not sub_valid else 'r' if sub_revoked else
+                'e' if sub_expired or expired else '-'))
+
+        caps = _capabilities(usage, primary=True)
+        usable = 0
+        if validity == '-':
+            usable = usage | (USAGE_CERT if usage & USAGE_SIGN else 0)
+        for subkey, sub_usage, sub_expires, sub_validity in subkeys:
+            if sub_validity == '-':
+                usable |= sub_usage
+        caps += _capabilities(usable).upper()
+
+        records = [
+            ColonRecord('PUB', validity, str(key.keylength), str(key.algo),
+                key.keyid, str(key.created), _timestamp(expires), '', '-', '',
+                '', caps, '', '', '', '', key.curve, ''),
+            FprRecord('FPR', '', '', '', '', '', '', '', '', key.fingerprint,
+                '', '', '', '', '', '', ''),
+        ]
+        # the primary user id is listed first
+        uids.sort(key=lambda x: x[1] is None or x[1] is not primary_sig)
+        for data, selfsig, uid_revoked in uids:
+            sig_expires = selfsig.expires if selfsig is not None else 0
+            if uid_revoked:
+                uid_validity = 'r'
+            elif sig_expires and sig_expires <= self.now:
+                uid_validity = 'e'
+            else:
+                uid_validity = validity
+            created = selfsig.created if selfsig is not None and not uid_revoked else 0
+            records.append(ColonRecord('UID', uid_validity, '', '', '',
+                _timestamp(created), _timestamp(sig_expires), _uid_hash(data),
+                '', _colon_escape(data), '', '', '', '', '', '', '', ''))
+        for subkey, sub_usage, sub_expires, sub_validity in subkeys:
+            records.append(ColonRecord('SUB', sub_validity,
+                str(subkey.keylength), str(subkey.algo), subkey.keyid,
+                str(subkey.created), _timestamp(sub_expires), '', '', '', '',
+                _capabilities(sub_usage), '', '', '', '', subkey.curve, ''))
+            records.append(FprRecord('FPR', '', '', '', '', '', '', '', '',
+                subkey.fingerprint, '', '', '', '', '', '', ''))
+        return records
+
+
+def colon_line(record):
+    '''Returns the gpg --with-colons line of a record'''
+    fields = list(record[1:len(COLON_FIELDS)])
+    return ':'.join([record[0].lower()] + fields) + ':'
+
+
+def has_ownertrust(keydir):
+    '''Checks if the keydir's trustdb holds any owner trust values, which
+    make gpg's key validity depend on the web of trust'''
+    try:
+        with open(os.path.join(keydir, TRUSTDB_FILE), 'rb') as trustdb:
+            data = bytearray(trustdb.read())
+    except IOError:
+        return False
+    for pos in range(0, len(data) - TRUSTDB_RECORD_SIZE + 1, TRUSTDB_RECORD_SIZE):
+        if data[pos] == TRUSTDB_TRUST_RECORD and data[pos + 22] & 0x0f:
+            return True
+    return False
+
+
+class KeyringReader(object):
+    '''Lists a keydir's keys as gpg --with-colons --fingerprint would.
+
+    Only the keydirs whose listing gpg does not base on a web of trust
+    are read, any other keydir or keyring content raises KeyringError
+    and is left for gpg to list.
+    '''
+
+    def __init__(self, keydir, trust_model=None, now=None):
+        '''@param keydir: string, the gpg homedir
+        @param trust_model: optional string, gpg's --trust-model option
+        @param now: optional timestamp to evaluate the key validities at,
+                    defaults to the time of each listing
+        '''
+        self.keydir = keydir
+        self.trust_model = trust_model
+        self.now = now
+
+
+    def keyring(self):
+        '''Returns the path of the keydir's keyring
+
+        @raises KeyringError if the keydir can not be read without gpg
+        '''
+        if os.path.exists(os.path.join(self.keydir, 'gpg.conf')):
+            raise KeyringError("gpg.conf options in %s" % self.keydir)
+        if self.trust_model != 'always' and has_ownertrust(self.keydir):
+            raise KeyringError("Owner trust values in %s" % self.keydir)
+        for name in PUBRING_FILES:
+            filename = os.path.join(self.keydir, name)
+            if os.path.exists(filename):
+                return filename
+        raise KeyringError("No keyring in %s" % self.keydir)
+
+
+    def list_keys(self, targets=None):
+        '''Returns the colon listing records of the keys
+
+        @param targets: optional list of the fingerprints or long keyids
+                        of the keys or subkeys to list, defaults to all
+        @returns list of ColonRecord and FprRecord instances
+        '''
+        wanted = None
+        if targets:
+            wanted = set()
+            for target in targets:
+                key = target.replace(' ', '').upper()
+                if key.startswith('0X'):
+                    key = key[2:]
+                if len(key) not in (16, 40) or not all(x in '0123456789ABCDEF'
+                        for x in key):
+                    raise KeyringError("Unsupported key specification: %s"
+                        % target)
+                wanted.add(key)
+        try:
+            keyblocks = read_keyblocks(self.keyring())
+        except (IOError, OSError, IndexError, ValueError, struct.error) as err:
+            raise KeyringError("Failed to read the keyring of %s: %s"
+                % (self.keydir, str(err)))
+        now = self.now or time.time()
+        records = []
+        for packets in keyblocks:
+            # a damaged keyblock the parsers' own checks missed
+            try:
+                keyblock = Keyblock(packets, now)
+                if wanted is not None:
+                    keys = set(keyblock.fingerprints())
+                    keys.update([x[-16:] for x in keys])
+                    if not wanted & keys:
+                        continue
+                records.extend(keyblock.records())
+            except (IndexError, ValueError, struct.error) as err:
+                raise KeyringError("Damaged keyblock in the keyring of %s: %s"
+                    % (self.keydir, str(err)))
+        return records
+
+
+    def listing(self, targets=None):
+        '''Returns the colon listing as gpg's result would hold it
+
+        @param targets: optional string or list of fingerprints or long keyids
+        @returns listcache.ListingResult instance
+        '''
+        if targets and not isinstance(targets, (list, tuple)):
+            targets = [targets]
+        records = self.list_keys(targets)
+        returncode = 0 if records or not targets else 2
+        output = '\n'.join(colon_line(x) for x in records)
+        return ListingResult(records, returncode, output)
@@ -20,35 +20,98 @@ with gentoo-keys specific convienience functions.
 # for py 2.6 compatibility
 from __future__ import print_function
 
+import copy
 import os
+import threading
+import time
 
+from collections import namedtuple
 from os.path import abspath, pardir
 from os.path import join as pjoin
 from shutil import rmtree
 
 from pyGPG.gpg import GPG
-from gkeys.checks import KeyChecks
+from gkeys.checks import KeyChecks, SpecBatch, refresh_speccheck
+from gkeys.exception import KeyringError
+from gkeys.expiryindex import ExpiryIndex
 from gkeys.fileops import ensure_dirs
-from gkeys.seed import Seeds
+from gkeys.keyindex import KeyIndex
+from gkeys.keyring import KeyringReader
+from gkeys.listcache import ListingCache
+from gkeys.seed import (Seeds, installed_current, installed_db,
+    keydirs_state, save_installed_state)
+from gkeys.specstore import SpecCheckStore
+from gkeys.utils import config_flag
+
+
+# serializes the read-modify-write updates of the files shared by all
+# keydirs (the installed keys dbs and the keyid index) between the
+# GkeysGPG instances of concurrent worker threads
+SHARED_DB_LOCK = threading.RLock()
+
+
+# The complete, immutable gpg command line settings of a single task run
+GPGContext = namedtuple('GPGContext', ['task', 'homedir', 'keyring',
+    'keyserver', 'gpg_defaults', 'task_options'])
+
+
+class KeyImportResult(object):
+    '''The outcome for one fingerprint of a batched --recv-keys run
+
+    Proxies the pyGPG.output.GPGResult instance of the gpg run it was
+    part of, with the fingerprint and failed attributes set from that
+    key's IMPORT_OK status record.
+    '''
+
+    def __init__(self, result, fingerprint, imported):
+        self.result = result
+        self.fingerprint = fingerprint if imported else None
+        self.failed = not imported
+
+
+    def __getattr__(self, name):
+        return getattr(self.result, name)
 
 
 class GkeysGPG(GPG):
     '''Gentoo-keys primary gpg class'''
 
 
-    def __init__(self, config, basedir, logger):
+    def __init__(self, config, basedir, logger, category=None):
         '''class init function
 
         @param config: GKeysConfig config instance to use
         @param keydir: string, the path to the keydir to be used
                         for all operations.
+        @param category: optional string, the keyring category of basedir
         '''
         GPG.__init__(self, config, logger)
         self.config = config
         self.basedir = basedir
         self.logger = logger
+        self.category = category
         self.keydir = None
         self.server = None
+        self._keyindex = None
+        self._expiryindex = None
+        self.listing_hits = 0
+        self.listing_misses = 0
+
+
+    @property
+    def keyindex(self):
+        '''Holds the installed keys KeyIndex instance'''
+        if not self._keyindex:
+            self._keyindex = KeyIndex(self.config, self.logger)
+        return self._keyindex
+
+
+    @property
+    def expiryindex(self):
+        '''Holds the installed keys' ExpiryIndex instance'''
+        if not self._expiryindex:
+            self._expiryindex = ExpiryIndex(self.config, self.logger)
+        return self._expiryindex
 
 
     def set_keyserver(self, server=None):
@@ -102,6 +165,66 @@ class GkeysGPG(GPG):
         return
 
 
+    def gpg_context(self, task, keydir=None, keyring=None, keyserver=False,
+            fingerprint=True, importkey=False, no_permission_warning=False,
+            options=None):
+        '''Build the gpg command line settings for a single task run.
+        Unlike set_keydir(), set_keyring() and set_keyserver(), this leaves
+        the shared config untouched so that tasks can run concurrently.
+
+        @param task: string, the gpg task to run
+        @param keydir: optional string, the gpg homedir relative to basedir
+        @param keyring: optional string, the keyring to use in place of
+                        the default keyring
+        @param keyserver: boolean, add the --keyserver option
+        @param fingerprint: boolean, add the --fingerprint option
+        @param importkey: boolean, add the import-clean import options
+        @param no_permission_warning: boolean, silence gpg's homedir
+                        permission warnings
+        @param options: optional list of additional task options
+        @returns GPGContext instance
+        '''
+        gpg_defaults = list(self.config.defaults['gpg_defaults'])
+        if no_permission_warning and '--no-permission-warning' not in gpg_defaults:
+            gpg_defaults.append('--no-permission-warning')
+        server = None
+        if keyserver:
+            server = self.server or self.config['keyserver']
+            gpg_defaults.extend(['--keyserver', server])
+        task_options = list(self.config.defaults['tasks'][task])
+        homedir = None
+        if keydir:
+            homedir = pjoin(self.basedir, keydir)
+            if fingerprint:
+                task_options.append('--fingerprint')
+            task_options.extend(['--homedir', homedir])
+        if importkey:
+            task_options.extend(['--import-options', 'import-clean'])
+        if keyring:
+            task_options.extend(['--no-default-keyring', '--keyring', keyring])
+        if options:
+            task_options.extend(options)
+        return GPGContext(task, homedir, keyring, server, tuple(gpg_defaults),
+            tuple(task_options))
+
+
+    def _run_gpg(self, ctx, **kwargs):
+        '''Run gpg for the task described by ctx, the remaining keyword
+        arguments are passed on to runGPG()
+
+        @param ctx: GPGContext instance
+        @returns pyGPG.output.GPGResult instance
+        '''
+        config = copy.copy(self.config)
+        config.options = dict(self.config.options)
+        config.options['tasks'] = dict(self.config.options.get('tasks', {}))
+        config.options['tasks'][ctx.task] = list(ctx.task_options)
+        config.options['gpg_defaults'] = list(ctx.gpg_defaults)
+        runner = copy.copy(self)
+        runner.config = config
+        return GPG.runGPG(runner, task=ctx.task, **kwargs)
+
+
     def add_to_keyring(self, gkey, keydir, keyring):
         '''Add the specified key to the specified keyring
 
@@ -110,15 +233,15 @@ class GkeysGPG(GPG):
         @param keydir: path with the specified keydir
         @param keyring: string with the specified keyring
         '''
-        self.set_keydir(keydir, 'import', reset=True)
-        self.set_keyring(keyring, 'import', importkey=True, reset=False)
+        ctx = self.gpg_context('import', keydir, keyring=keyring, importkey=True)
+        ensure_dirs(abspath(pjoin(keyring, pardir)),
+            mode=int(self.config.get_key('permissions', 'directories'),0))
         results = []
         self.logger.debug("LIB: import_to_keyring; name: " + gkey.name)
         self.logger.debug("** Calling runGPG with Running: gpg %s --import' for: %s"
-                     % (' '.join(self.config.get_key('tasks', 'import')),
-                        gkey.name))
-        pubring_path = pjoin(self.keydir, gkey.keydir, 'pubring.gpg')
-        result = self.runGPG(task='import', inputfile=pubring_path)
+                     % (' '.join(ctx.task_options), gkey.name))
+        pubring_path = pjoin(ctx.homedir, gkey.keydir, 'pubring.gpg')
+        result = self._run_gpg(ctx, inputfile=pubring_path)
         self.logger.info('GPG return code: ' + str(result.returncode))
         results.append(result)
         print(result.stderr_out)
@@ -131,62 +254,68 @@ class GkeysGPG(GPG):
         @param gkey: GKEY namedtuple with
             (name, nick, keydir, fingerprint)
         '''
-        self.config.defaults['gpg_defaults'].append('--no-permission-warning')
-        self.set_keyserver()
-        self.set_keydir(gkey.keydir, 'recv-keys', reset=True)
-        self.set_keyring('pubring.gpg', 'recv-keys', reset=False)
-        self.logger.debug("LIB: add_key; ensure dirs: " + self.keydir)
+        ctx = self.gpg_context('recv-keys', gkey.keydir, keyring='pubring.gpg',
+            keyserver=True, no_permission_warning=True)
+        self.logger.debug("LIB: add_key; ensure dirs: " + ctx.homedir)
         mode = int(self.config.get_key('permissions', 'directories'),0)
-        ensure_dirs(str(self.keydir), mode=mode)
-        self.set_keyseedfile(trap_errors=True)
+        ensure_dirs(str(ctx.homedir), mode=mode)
+        seedfile = self.keyseedfile(gkey.keydir, trap_errors=True)
+        fingerprints = list(gkey.keys)
+        self.logger.debug("LIB: add_key; adding fingerprints " + ' '.join(fingerprints))
+        self.logger.debug("** Calling runGPG with Running 'gpg %s --recv-keys %s' for: %s"
+            % (' '.join(ctx.task_options), ' '.join(fingerprints), gkey.name))
+        result = self._run_gpg(ctx, inputfile=fingerprints)
+        self.logger.info('GPG return code: ' + str(result.returncode))
+        imported = self._imported_fingerprints(result)
         results = []
-        for fingerprint in gkey.keys:
-            self.logger.debug("LIB: add_key; adding fingerprint " + fingerprint)
-            self.logger.debug("** Calling runGPG with Running 'gpg %s --recv-keys %s' for: %s"
-                % (' '.join(self.config.get_key('tasks', 'recv-keys')),
-                    fingerprint, gkey.name))
-            result = self.runGPG(task='recv-keys', inputfile=fingerprint)
-            self.logger.info('GPG return code: ' + str(result.returncode))
-            self.logger.debug("LIB: add_key; fingerprint: %s. type: %s", fingerprint, type(fingerprint))
-            self.logger.debug("LIB: add_key; gkey.keys: %s. type: %s", gkey.keys, [type(key) for key in gkey.keys])
-            if result.fingerprint in gkey.keys:
-                result.failed = False
+        for fingerprint in fingerprints:
+            success = fingerprint.upper() in imported
+            results.append(KeyImportResult(result, fingerprint, success))
+            if success:
                 message = "Fingerprints match... Import successful: "
                 message += "%s, fingerprint: %s" % (gkey.nick, fingerprint)
-                message += "\n result len: %s, %s" % (len(result.fingerprint), result.fingerprint)
-                message += "\n gkey len: %s, %s" % (len(gkey.fingerprint[0]), gkey.fingerprint[0])
                 self.logger.info(message)
             else:
-                result.failed = True
                 message = "Fingerprints do not match... Import failed for "
                 message += "%s, fingerprint: %s" % (gkey.nick, fingerprint)
-                message += "\n result: %s" % (result.fingerprint)
+                message += "\n imported: %s" % (sorted(imported))
                 message += "\n gkey..: %s" % (str(gkey.fingerprint))
                 self.logger.error(message)
-            # Save the gkey seed to the installed db
-            success = self.update_gkey(gkey, save=True)
-            if not success:
-                return []
-            results.append(result)
+        # Save the gkey seed to the installed db
+        success = self.update_gkey(gkey, save=True, seedfile=seedfile)
+        if not success:
+            return []
         return results
 
 
+    @staticmethod
+    def _imported_fingerprints(result):
+        '''Returns the set of the fingerprints gpg reported as imported
+        (new or unchanged) in the result's IMPORT_OK status records'''
+        imported = set()
+        for data in result.status.data:
+            if data.name == "IMPORT_OK":
+                imported.add(data.fingerprint.upper())
+        if not imported and result.fingerprint:
+            imported.add(result.fingerprint.upper())
+        return imported
+
+
     def del_key(self, gkey, key):
         '''Delete the specified key
 
         @param gkey: GKEY namedtuple with (name, nick, keydir, fingerprint)
         @param key: Fingerprint of the primary key to delete
         '''
-        self.set_keydir(gkey.keydir, 'del-key', reset=True)
-        self.set_keyring('pubring.gpg', 'del-key', reset=False)
-        self.set_keyseedfile(refresh=True)
+        ctx = self.gpg_context('delete-keys', gkey.keydir, keyring='pubring.gpg')
+        seedfile = self.keyseedfile(gkey.keydir, refresh=True)
         self.logger.debug("LIB: del_key, gkey: %s" % str(gkey))
         self.logger.debug("LIB: del_key, key: %s" % key)
         self.logger.debug("** Calling runGPG with: 'gpg %s --delete-keys' for: %s"
-            % (' '.join(self.config.get_key('tasks', 'delete-keys')), str(gkey)))
-        result = self.runGPG(task='delete-keys', inputfile=key)
+            % (' '.join(ctx.task_options), str(gkey)))
+        result = self._run_gpg(ctx, inputfile=key)
         self.logger.info('GPG return code: ' + str(result.returncode))
-        self.update_gkey(gkey, save=True)
+        self.update_gkey(gkey, save=True, seedfile=seedfile)
         return (False, [])
 
 
@@ -202,6 +331,10 @@ class GkeysGPG(GPG):
             rmtree(rm_candidate)
             messages.append("Done removing %s key." % gkey.nick)
             success = True
+            if self.category:
+                self.update_keyindex(keydir=gkey.keydir)
+                self.update_expiryindex(keydir=gkey.keydir)
+            self.update_installed_db(keydir=gkey.keydir)
         except OSError:
             messages.append("%s directory does not exist or is a symbolic link." % rm_candidate)
         return (success, messages)
@@ -213,43 +346,144 @@ class GkeysGPG(GPG):
         @param key: tuple of (name, nick, keydir, fingerprint)
         @param keydir: the keydir to add the key to
         '''
-        self.config.defaults['gpg_defaults'].append('--no-permission-warning')
-        self.set_keyserver()
-        self.set_keydir(gkey.keydir, 'refresh-keys', reset=True)
-        self.set_keyring('pubring.gpg', 'refresh-keys', reset=False)
-        self.set_keyseedfile(refresh=True)
+        ctx = self.gpg_context('refresh-keys', gkey.keydir, keyring='pubring.gpg',
+            keyserver=True, no_permission_warning=True)
+        seedfile = self.keyseedfile(gkey.keydir, refresh=True)
         self.logger.debug("LIB: refresh_key, gkey: %s" % str(gkey))
         self.logger.debug("** Calling runGPG with Running 'gpg %s --refresh-keys' for: %s"
-            % (' '.join(self.config.get_key('tasks', 'refresh-keys')), str(gkey)))
-        result = self.runGPG(task='refresh-keys', inputfile='')
+            % (' '.join(ctx.task_options), str(gkey)))
+        result = self._run_gpg(ctx, inputfile='')
         self.logger.info('GPG return code: ' + str(result.returncode))
-        self.update_gkey(gkey, save=True)
+        self.update_gkey(gkey, save=True, seedfile=seedfile)
         return result
 
 
-    def update_gkey(self, gkey, save=False):
+    def update_gkey(self, gkey, save=False, seedfile=None):
         '''Update the specified key in the specified keydir
 
         @param key: tuple of (name, nick, keydir, fingerprint)
-        @param keydir: the keydir to add the key to
+        @param save: boolean, save the updated gkey seed
+        @param seedfile: optional Seeds instance of the keydir's gkey.seeds,
+                         defaults to the one loaded by set_keyseedfile()
         '''
+        if seedfile is None:
+            seedfile = self.seedfile
         # Update the gkey seed and save it to the installed db
         lresults = []
-        for fpr in gkey.keys:
-            lresults.append(self.list_keys(gkey.keydir, fpr, colons=True))
-        self.seedfile.update(gkey.update(lresults))
-        if save and not self.seedfile.save():
-            self.logger.error("GkeysGPG.update_gkey(); failed to save seed: " + gkey.nick)
-            return False
+        if gkey.keys:
+            lresults.append(self.list_keys(gkey.keydir, list(gkey.keys),
+                colons=True))
+        gkey = gkey.update(lresults)
+        seedfile.update(gkey)
+        if save:
+            if not seedfile.save():
+                self.logger.error("GkeysGPG.update_gkey(); failed to save seed: " + gkey.nick)
+                return False
+            self.update_installed_db(gkey)
+            if self.category:
+                self.update_keyindex(gkey)
+                self.update_expiryindex(gkey, lresults)
+            else:
+                self.logger.debug("GkeysGPG.update_gkey(); no category set, "
+                    "keyid and expiry indexes not updated for: " + gkey.nick)
         return True
 
 
+    def update_keyindex(self, gkey=None, keydir=None):
+        '''Update a gkey's keyid index entries, or remove the entries
+        of all the gkeys installed in keydir.  The index file is re-read
+        first so that other instances' changes to it are kept.
+
+        @param gkey: GKEY instance to add or replace
+        @param keydir: string, the keydir to remove the entries of
+        @returns boolean
+        '''
+        with SHARED_DB_LOCK:
+            self.keyindex.load()
+            if gkey:
+                self.keyindex.update(self.category, gkey)
+            else:
+                self.keyindex.remove(self.category, keydir=keydir)
+            return self.keyindex.save()
+
+
+    def update_expiryindex(self, gkey=None, results=None, keydir=None):
+        '''Update a gkey's expiry timeline entries from the listing
+        results of its keys, or remove the entries of all the gkeys
+        installed in keydir.  The index file is re-read first so that
+        other instances' changes to it are kept.
+
+        @param gkey: GKEY instance to add or replace
+        @param results: list of the colon listing results of gkey's keys
+        @param keydir: string, the keydir to remove the entries of
+        @returns boolean
+        '''
+        with SHARED_DB_LOCK:
+            self.expiryindex.load()
+            if gkey:
+                self.expiryindex.update(self.category, gkey, results or [])
+            else:
+                self.expiryindex.remove(self.category, keydir=keydir)
+            return self.expiryindex.save()
+
+
+    def update_installed_db(self, gkey=None, keydir=None):
+        '''Update a gkey's entry in the category's installed keys db,
+        or remove all the entries installed in keydir.
+
+        A missing db, or one that other keydir changes have made stale,
+        is left for SeedHandler.load_category() to rebuild.
+
+        @param gkey: GKEY instance to add or replace
+        @param keydir: string, the keydir to remove the entries of
+        @returns boolean
+        '''
+        with SHARED_DB_LOCK:
+            return self._update_installed_db(gkey, keydir)
+
+
+    def _update_installed_db(self, gkey, keydir):
+        dbpath = pjoin(self.basedir, installed_db(self.config))
+        target = gkey.keydir if gkey else keydir
+        # taken before the db is checked, a keydir changed meanwhile
+        # leaves the updated db stale
+        try:
+            keydirs = keydirs_state(self.basedir)
+        except OSError:
+            return False
+        # the target's gkey.seeds was just saved, the others must
+        # still match the db
+        if not installed_current(dbpath, self.basedir, exclude=target):
+            self.logger.debug("GkeysGPG.update_installed_db(); "
+                "missing or stale db, not updated: %s" % dbpath)
+            return False
+        installed = Seeds(dbpath, self.config, self.logger)
+        if not installed.load(refresh=True):
+            return False
+        try:
+            if gkey:
+                installed.update(gkey)
+            else:
+                for old in list(installed.seeds.values()):
+                    if old.keydir == keydir:
+                        installed.delete(old)
+            if not installed.save():
+                return False
+            save_installed_state(dbpath, keydirs)
+        except (IOError, OSError) as err:
+            self.logger.debug("GkeysGPG.update_installed_db(); failed to update %s: %s"
+                % (dbpath, str(err)))
+            return False
+        return True
+
 
     def list_keys(self, keydir, fingerprint=None, colons=False):
         '''List all keys in the specified keydir or
         all keys in all keydir if keydir=None
 
         @param keydir: the keydir to list the keys for
+        @param fingerprint: optional string or list of the fingerprints
+                            to list in a single gpg run
         @param colons: bool to enable colon listing
         '''
         if not keydir:
@@ -257,39 +491,89 @@ class GkeysGPG(GPG):
                 % str(keydir))
             return []
         self.logger.debug("LIB: list_keys(), keydir parameter: %s"% str(keydir))
-        if fingerprint:
+        if isinstance(fingerprint, (list, tuple)):
+            task = 'list-key'
+            target = list(fingerprint)
+        elif fingerprint:
             task = 'list-key'
             target = fingerprint
-            self.set_keydir(keydir, task, fingerprint=True)
         else:
             task = 'list-keys'
             target = ''
-            self.set_keydir(keydir, task, fingerprint=False)
-        self.config.options['tasks'][task].extend(['--keyid-format', 'long', '--fingerprint'])
+        options = ['--keyid-format', 'long', '--fingerprint']
         if colons:
-            task_value = ['--with-colons']
-            self.config.options['tasks'][task].extend(task_value)
+            options.append('--with-colons')
+        ctx = self.gpg_context(task, keydir, fingerprint=bool(fingerprint),
+            options=options)
+        cache = None
+        cache_key = ' '.join(target) if isinstance(target, list) else target
+        if colons and config_flag(self.config, 'keyring_reader'):
+            result = self._read_keyring(ctx, target)
+            if result:
+                return result
+        if colons:
+            cache = ListingCache(ctx.homedir, self.logger)
+            result = cache.get(cache_key)
+            if result:
+                self._count_listing(True)
+                return result
+            self._count_listing(False)
         self.logger.debug("** Calling runGPG with Running 'gpg %s --%s %s'"
-            % (' '.join(self.config['tasks'][task]), task, target)
+            % (' '.join(ctx.task_options), task, cache_key)
             )
-        result = self.runGPG(task=task, inputfile=target)
+        result = self._run_gpg(ctx, inputfile=target)
         self.logger.info('GPG return code: ' + str(result.returncode))
+        if cache:
+            cache.put(cache_key, result)
         return result
 
+
+    def _read_keyring(self, ctx, target):
+        '''Lists the keys of the task's keydir without running gpg
+
+        @param ctx: GPGContext instance
+        @param target: string or list of the fingerprints to list
+        @returns listcache.ListingResult instance or None if the keydir
+                 needs to be listed by gpg
+        '''
+        options = list(ctx.gpg_defaults) + list(ctx.task_options)
+        trust_model = None
+        if '--trust-model' in options[:-1]:
+            trust_model = options[options.index('--trust-model') + 1]
+        reader = KeyringReader(ctx.homedir, trust_model)
+        try:
+            result = reader.listing(target)
+        except KeyringError as err:
+            self.logger.debug("GkeysGPG.list_keys(); keyring reader unused: %s"
+                % str(err))
+            return None
+        self.logger.debug("GkeysGPG.list_keys(); read %d records from %s, "
+            "return code: %d" % (len(result.status.data), ctx.homedir,
+            result.returncode))
+        return result
+
+
+    def _count_listing(self, hit):
+        if hit:
+            self.listing_hits += 1
+        else:
+            self.listing_misses += 1
+        total = self.listing_hits + self.listing_misses
+        self.logger.debug("GkeysGPG.list_keys(); listing cache %s, hit ratio: "
+            "%d/%d (%.1f%%)" % ('hit' if hit else 'miss', self.listing_hits,
+            total, 100.0 * self.listing_hits / total))
+
     def send_keys(self, gkey):
         '''Send gkey to keyserver
         @param gkey: the gkey to be sent to the server
         @return: GKEY_CHECK instance
         '''
-        self.config.defaults['gpg_defaults'].append('--no-permission-warning')
-        self.set_keyserver()
-        self.set_keydir(gkey.keydir, 'send-keys', reset=True)
-        self.set_keyring('pubring.gpg', 'send-keys', reset=False)
-        self.set_keyseedfile(refresh=True)
+        ctx = self.gpg_context('send-keys', gkey.keydir, keyring='pubring.gpg',
+            keyserver=True, no_permission_warning=True)
         self.logger.debug("LIB: send-keys, gkey: %s" % str(gkey))
         self.logger.debug("** Calling runGPG with Running 'gpg %s --send-keys' for: %s"
-            % (' '.join(self.config.get_key('tasks', 'send-keys')), str(gkey)))
-        result = self.runGPG(task='send-keys', inputfile='')
+            % (' '.join(ctx.task_options), str(gkey)))
+        result = self._run_gpg(ctx, inputfile='')
         self.logger.info('GPG return code: ' + str(result.returncode))
         return result
 
@@ -323,6 +607,47 @@ class GkeysGPG(GPG):
         return specchecks
 
 
+    def speccheck_batch(self, keys):
+        '''Check that the specified keys meet the specifications
+        in a single pass over all their listings
+
+        The results of the keys whose keyrings are unchanged, and which
+        did not expire, since their last check are read from their
+        keydir's SpecCheckStore with only their date dependent fields
+        recomputed.
+
+        @param keys: list of (keydir, keyid) tuples
+        @returns: list of the speccheck() results, in the order of keys
+        '''
+        now = time.time()
+        stores = {}
+        results = [None] * len(keys)
+        listed = []
+        batch = SpecBatch(self.logger, qualified_id_check=True)
+        for index, (keydir, keyid) in enumerate(keys):
+            if keydir not in stores:
+                stores[keydir] = SpecCheckStore(pjoin(self.basedir, keydir),
+                    self.logger)
+            stored = stores[keydir].get(keyid, now)
+            if stored:
+                results[index] = refresh_speccheck(stored[0], stored[1], now)
+                continue
+            listing = self.list_keys(keydir, fingerprint=keyid, colons=True)
+            listed.append((index, not listing.returncode))
+            batch.add(keyid, listing)
+        for (index, store), checks, times in zip(listed, batch.evaluate(),
+                batch.times):
+            results[index] = checks
+            if store:
+                keydir, keyid = keys[index]
+                stores[keydir].put(keyid, checks, times, now)
+        for store in stores.values():
+            store.save()
+        self.logger.debug("GkeysGPG.speccheck_batch(); %d stored results "
+            "refreshed, %d keys checked" % (len(keys) - len(listed), len(listed)))
+        return results
+
+
     def list_keydirs(self):
         '''List all available keydirs
         '''
@@ -344,10 +669,10 @@ class GkeysGPG(GPG):
         @param text: string of the of the text to verify
         @param filepath: optional string with the path or url of the signed file
         '''
-        self.set_keydir(gkey.keydir, 'verify', fingerprint=False, reset=True)
+        ctx = self.gpg_context('verify', gkey.keydir, fingerprint=False)
         self.logger.debug("** Calling runGPG with Running 'gpg %s --verify %s'"
-                % (' '.join(self.config['tasks']['verify']), filepath))
-        results = self.runGPG(task='verify', inputfile=filepath, inputtxt=text)
+                % (' '.join(ctx.task_options), filepath))
+        results = self._run_gpg(ctx, inputfile=filepath, inputtxt=text)
         self._log_result('verification', gkey, results)
         return results
 
@@ -360,15 +685,15 @@ class GkeysGPG(GPG):
         @param filepath: string with the path or url of the signed file
         '''
         if signature:
-            self.set_keydir(gkey.keydir, 'verify', reset=True)
+            ctx = self.gpg_context('verify', gkey.keydir)
             self.logger.debug("** Calling runGPG with Running 'gpg %s --verify %s and %s'"
-                    % (' '.join(self.config['tasks']['verify']), signature, filepath))
-            results = self.runGPG(task='verify', inputfile=[signature,filepath])
+                    % (' '.join(ctx.task_options), signature, filepath))
+            results = self._run_gpg(ctx, inputfile=[signature,filepath])
         else:
-            self.set_keydir(gkey.keydir, 'decrypt', reset=True)
+            ctx = self.gpg_context('decrypt', gkey.keydir)
             self.logger.debug("** Calling runGPG with Running 'gpg %s --decrypt %s'"
-                    % (' '.join(self.config['tasks']['decrypt']), filepath))
-            results = self.runGPG(task='decrypt', inputfile=filepath)
+                    % (' '.join(ctx.task_options), filepath))
+            results = self._run_gpg(ctx, inputfile=filepath)
         self._log_result('verification', gkey, results)
         return results
 
@@ -376,8 +701,18 @@ class GkeysGPG(GPG):
     def set_keyseedfile(self, trap_errors=True, refresh=False):
         if not self.keydir:
             self.logger.debug("GkeysGPG.set_keyseedfile(); self.keydir error")
-        self.seedfile = Seeds(pjoin(self.keydir, 'gkey.seeds'), self.config, self.logger)
-        self.seedfile.load(trap_errors=trap_errors, refresh=refresh)
+        self.seedfile = self.keyseedfile(self.keydir, trap_errors, refresh)
+
+
+    def keyseedfile(self, keydir, trap_errors=True, refresh=False):
+        '''Load a keydir's gkey.seeds file
+
+        @param keydir: string, the keydir path, relative to basedir
+        @returns Seeds instance
+        '''
+        seedfile = Seeds(pjoin(self.basedir, keydir, 'gkey.seeds'), self.config, self.logger)
+        seedfile.load(trap_errors=trap_errors, refresh=refresh)
+        return seedfile
 
 
     def sign_file(self, gkey, mode, fingerprint, filepath):
@@ -388,10 +723,10 @@ class GkeysGPG(GPG):
         @param fingerprint: string of the fingerprint to sign with
         @param filepath: string with the path of the file to sign
         '''
-        self.set_keydir(gkey.keydir, mode, reset=True)
+        ctx = self.gpg_context(mode, gkey.keydir)
         self.logger.debug("** Calling runGPG with Running 'gpg %s --%s %s %s'"
-                % (' '.join(self.config['tasks'][mode]), mode, fingerprint, filepath))
-        results = self.runGPG(task=mode, inputfile=filepath)
+                % (' '.join(ctx.task_options), mode, fingerprint, filepath))
+        results = self._run_gpg(ctx, inputfile=filepath)
         self._log_result('signing', gkey, results)
         return results
 
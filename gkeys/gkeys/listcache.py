@@ -0,0 +1,128 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - listcache.py
+
+    Persistent per keydir cache of parsed gpg colon listings
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import os
+import sys
+
+from collections import namedtuple
+
+if sys.version_info[0] >= 3:
+    import pickle
+else:
+    import cPickle as pickle
+
+from gkeys.fileops import atomic_write
+
+
+LISTING_CACHE = '.gkeys-listing.cache'
+
+# the files whose changes invalidate a keydir's cached listings,
+# the trustdb is included as it sets the reported key validity
+KEYRING_FILES = ['pubring.gpg', 'pubring.kbx', 'trustdb.gpg']
+
+
+def keyring_identity(keydir):
+    '''Returns the identity of the keydir's keyring files
+
+    @param keydir: string, path of the gpg homedir
+    @returns tuple of (filename, mtime, size, inode) tuples
+    '''
+    identity = []
+    for name in KEYRING_FILES:
+        try:
+            stat = os.stat(os.path.join(keydir, name))
+        except OSError:
+            continue
+        identity.append((name, stat.st_mtime, stat.st_size, stat.st_ino))
+    return tuple(identity)
+
+
+ListingStatus = namedtuple('ListingStatus', ['data'])
+
+
+class ListingResult(object):
+    '''Holds a cached colon listing in place of the
+    pyGPG.output.GPGResult it was parsed from'''
+
+    def __init__(self, data, returncode=0, output=''):
+        self.status = ListingStatus(data)
+        self.returncode = returncode
+        self.output = output
+        self.stderr_out = []
+
+
+class ListingCache(object):
+    '''Cache of a keydir's parsed gpg colon listings
+
+    The cache is discarded whenever the (mtime, size, inode) of any
+    of the keydir's keyring files changes.
+    '''
+
+    def __init__(self, keydir, logger):
+        self.keydir = keydir
+        self.logger = logger
+        self.filename = os.path.join(keydir, LISTING_CACHE)
+        self.identity = keyring_identity(keydir)
+        self.listings = None
+
+
+    def _load(self):
+        self.listings = {}
+        if not self.identity:
+            return
+        try:
+            with open(self.filename, 'rb') as cachefile:
+                identity, listings = pickle.load(cachefile)
+        except (IOError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, pickle.UnpicklingError) as err:
+            self.logger.debug("ListingCache: load; no usable cache %s: %s"
+                % (self.filename, str(err)))
+            return
+        if identity == self.identity:
+            self.listings = listings
+
+
+    def get(self, target):
+        '''Returns the cached listing for target
+
+        @param target: string, the listed fingerprint(s)
+        @returns ListingResult instance or None
+        '''
+        if self.listings is None:
+            self._load()
+        if target not in self.listings:
+            return None
+        returncode, output, data = self.listings[target]
+        return ListingResult(data, returncode, output)
+
+
+    def put(self, target, result):
+        '''Stores a successful colon listing result for target
+
+        @param target: string, the listed fingerprint(s)
+        @param result: pyGPG.output.GPGResult instance
+        @returns boolean
+        '''
+        if result.returncode or not self.identity:
+            return False
+        if self.listings is None:
+            self._load()
+        self.listings[target] = (result.returncode, result.output,
+            list(result.status.data))
+        try:
+            data = pickle.dumps((self.identity, self.listings), 2)
+            atomic_write(self.filename, data, mode='wb')
+        except (IOError, OSError, TypeError, AttributeError,
+                pickle.PicklingError) as err:
+            self.logger.debug("ListingCache: put; failed to save %s: %s"
+                % (self.filename, str(err)))
+            return False
+        return True
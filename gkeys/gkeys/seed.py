@@ -19,27 +19,508 @@ with gentoo-keys specific convienience functions.
 '''
 
 import codecs
+import hashlib
 import json
 import os
+import re
 import sys
+import time
+
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
 
 from snakeoil.demandload import demandload
 
-from gkeys.gkey import GKEY
+from gkeys.gkey import GKEY, GKEYStore
+from gkeys.utils import config_flag
 
 demandload(
     "gkeys.log:logger",
     "gkeys.exception:UpdateDbError",
+    "gkeys.fileops:atomic_write",
     "gkeys.fileops:ensure_dirs",
+    "gkeys.seedstore:SqliteSeedStore",
 )
 
 if sys.version_info[0] >= 3:
+    import pickle
+
     def decoder(text, enc='utf_8'):
         return text
+
+    def casefold(text):
+        return text.casefold()
 else:
+    import cPickle as pickle
+
     def decoder(text, enc='utf_8'):
         return unicode(text)
 
+    def casefold(text):
+        return text.lower()
+
+
+# category level installed keys db, a seed file of all the
+# installed gkeys kept in the category's keyring directory
+INSTALLED_DB = 'installed.seeds'
+INSTALLED_SQLITE_DB = 'installed.db'
+
+# json record kept next to the installed keys db of the disk state of
+# the db and of each keydir's gkey.seeds it was built from, the db is
+# current while they all still match it
+INSTALLED_STATE = '.keydirs'
+INSTALLED_STATE_VERSION = 1
+
+# seed files kept in a SqliteSeedStore database instead of json
+SQLITE_SUFFIX = '.db'
+
+# GKEY fields and derived values held in the Seeds lookup indexes
+INDEX_FIELDS = ['nick', 'fingerprint', 'keys', 'keyid', 'uid', 'email']
+
+# the trigram index of each field with one, for the field_search()
+# substring and the fuzzy_search() searches
+TRIGRAM_FIELDS = {'name': 'name_trigrams', 'uid': 'uid_trigrams'}
+
+# a trigram index costs a few dozen substring scans of its field to
+# build, field_search() builds it once the field was scanned this often
+TRIGRAM_BUILD_SCANS = 32
+
+# fuzzy_search() allows one edit per this many characters searched for
+FUZZY_RATIO = 4
+
+EMAIL_RE = re.compile(r'[\w\.\+-]+@[\w\.-]+')
+FPR_RE = re.compile('^[0-9A-Fa-f]{40}$')
+KEYID_RE = re.compile('^(0[xX])?[0-9A-Fa-f]{16}$')
+
+# parsed seed file cache, kept next to seed files of at least
+# SEED_CACHE_MIN_SIZE bytes, smaller files load faster without it
+SEED_CACHE = '.cache'
+SEED_CACHE_VERSION = 1
+SEED_CACHE_MIN_SIZE = 32768
+
+# append-only log of the changes saved since the seed file was last
+# written, one json record per line.  The first record names the
+# seed_digest() of the seed file the changes apply to.
+SEED_JOURNAL = '.journal'
+
+# characters read at a time by the streaming seed file parser
+SEED_CHUNK_SIZE = 65536
+
+# number of compiled regex_search() patterns kept
+REGEX_CACHE_SIZE = 64
+_regex_cache = OrderedDict()
+
+# query planner ranks of the search predicates, the index lookups run
+# first and the substring and per seed pattern tests last
+PLAN_INDEX = 0
+PLAN_TRIGRAM = 1
+PLAN_SUBSTRING = 2
+PLAN_SCAN = 3
+
+# candidates left after which the planner tests them rather than
+# looking up (and possibly building) the next index
+PLAN_FEW_CANDIDATES = 8
+
+# GKEY fields compared by diff_seeds(), list fields compare unordered
+DIFF_FIELDS = ['name', 'keydir', 'keys', 'fingerprint', 'uid']
+
+
+def installed_db(config):
+    '''Returns the file name of the categories' installed keys dbs
+    for the configured installed_db_backend'''
+    if config.get_key('installed_db_backend') == 'sqlite':
+        return INSTALLED_SQLITE_DB
+    return INSTALLED_DB
+
+
+def seedfile_state(filename):
+    '''Returns the disk state of a seed file and its journal, any change
+    to either of them changes it
+
+    @param filename: string, path of the seed file
+    @returns list of [size, mtime, inode] lists, None for the missing ones
+    '''
+    state = []
+    for path in [filename, filename + SEED_JOURNAL]:
+        try:
+            stat = os.stat(path)
+            state.append([stat.st_size, stat.st_mtime, stat.st_ino])
+        except OSError:
+            state.append(None)
+    return state
+
+
+def keydirs_state(catdir):
+    '''Returns the seedfile_state() of the gkey.seeds of each keydir
+    in a category's keyring directory
+
+    @param catdir: string, the category's keyring directory
+    @returns dictionary of {keydir: state}
+    @raises OSError for a missing catdir
+    '''
+    state = {}
+    for name in os.listdir(catdir):
+        path = os.path.join(catdir, name)
+        if os.path.isdir(path):
+            state[name] = seedfile_state(os.path.join(path, 'gkey.seeds'))
+    return state
+
+
+def installed_current(dbpath, catdir, exclude=None):
+    '''Checks if the installed keys db still holds the gkeys of all the
+    keydirs, by the INSTALLED_STATE record saved with it
+
+    @param dbpath: string, path of the installed keys db
+    @param catdir: string, the category's keyring directory
+    @param exclude: optional keydir name to leave out of the check
+    @returns boolean
+    '''
+    try:
+        with open(dbpath + INSTALLED_STATE, 'r') as statefile:
+            recorded = json.load(statefile)
+        if recorded.get('version') != INSTALLED_STATE_VERSION:
+            return False
+        if recorded['db'] != seedfile_state(dbpath):
+            return False
+        keydirs = keydirs_state(catdir)
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        return False
+    recorded = recorded['keydirs']
+    if exclude is not None:
+        keydirs.pop(exclude, None)
+        recorded.pop(exclude, None)
+    return keydirs == recorded
+
+
+def save_installed_state(dbpath, keydirs):
+    '''Saves the INSTALLED_STATE record of the installed keys db just saved
+
+    @param dbpath: string, path of the installed keys db
+    @param keydirs: keydirs_state() of the catdir, taken before the
+                    keydirs' gkey.seeds were read for the db
+    '''
+    data = {'version': INSTALLED_STATE_VERSION, 'db': seedfile_state(dbpath),
+        'keydirs': keydirs}
+    atomic_write(dbpath + INSTALLED_STATE, json.dumps(data, sort_keys=True))
+
+
+def normalize_fpr(fpr):
+    '''Returns the index form of a fingerprint'''
+    return fpr.replace(' ', '').upper()
+
+
+def normalize_keyid(keyid):
+    '''Returns the index form of a long keyid (or of a fingerprint's keyid)
+
+    Leading zeros are dropped to match the lstrip('0x') comparisons
+    used by Seeds.list()
+    '''
+    keyid = keyid.replace(' ', '').upper()
+    if keyid.startswith('0X'):
+        keyid = keyid[2:]
+    return keyid[-16:].lstrip('0')
+
+
+def _get_field(gkey, field):
+    if isinstance(gkey, dict):
+        return gkey.get(field)
+    return getattr(gkey, field)
+
+
+def trigrams(text):
+    '''Returns the set of the lower cased text's three character substrings'''
+    text = text.lower()
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def substring_distance(find, text):
+    '''Returns the least edit distance between find and any substring
+    of text
+
+    @param find: string
+    @param text: string
+    @returns int
+    '''
+    # distances for find against the substrings ending at each character
+    # of text, a substring may start anywhere so the top row stays 0
+    previous = list(range(len(find) + 1))
+    best = previous[-1]
+    for char in text:
+        current = [0]
+        for i, find_char in enumerate(find):
+            current.append(min(previous[i + 1] + 1, current[i] + 1,
+                previous[i] + (find_char != char)))
+        if current[-1] < best:
+            best = current[-1]
+        previous = current
+    return best
+
+
+def index_keys(field, gkey):
+    '''Returns the normalized index keys of a GKEY (or seed dict) for field
+
+    @param field: string, one of INDEX_FIELDS or TRIGRAM_FIELDS' indexes
+    @param gkey: GKEY instance or dict
+    @returns list
+    '''
+    if field in TRIGRAM_FIELDS.values():
+        values = _get_field(gkey, field[:-len('_trigrams')]) or []
+        keys = set()
+        for value in values if isinstance(values, list) else [values]:
+            keys.update(trigrams(value))
+        return keys
+    if field == 'nick':
+        return [(_get_field(gkey, 'nick') or '').lower()]
+    if field in ['fingerprint', 'keys']:
+        return [normalize_fpr(x) for x in _get_field(gkey, field) or []]
+    if field == 'keyid':
+        return [normalize_keyid(x) for x in _get_field(gkey, 'fingerprint') or []]
+    uids = _get_field(gkey, 'uid') or []
+    if field == 'uid':
+        return [x.lower() for x in uids]
+    emails = []
+    for uid in uids:
+        emails.extend(x.lower() for x in EMAIL_RE.findall(uid))
+    return emails
+
+
+def _has_upper(pattern):
+    '''Checks a pattern for characters casefolding changes, other than
+    the escapes such as \\S'''
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif casefold(char) != char:
+            return True
+    return False
+
+
+def compile_search(pattern):
+    '''Returns the compiled regex_search() pattern, the most recently
+    used REGEX_CACHE_SIZE patterns are kept compiled
+
+    @param pattern: string, the regular expression
+    @returns compiled regular expression
+    '''
+    try:
+        regex = _regex_cache.pop(pattern)
+    except KeyError:
+        flags = re.MULTILINE
+        # the search text is casefolded, only a pattern with upper case
+        # letters needs the (much slower) case insensitive matching
+        if _has_upper(pattern):
+            flags |= re.IGNORECASE
+        regex = re.compile(pattern, flags)
+        while len(_regex_cache) >= REGEX_CACHE_SIZE:
+            _regex_cache.popitem(last=False)
+    _regex_cache[pattern] = regex
+    return regex
+
+
+def search_text(gkey):
+    '''Returns the casefolded regex_search() text of a GKEY (or seed dict),
+    its nick, name, uids and fingerprints one per line
+
+    @param gkey: GKEY instance or dict
+    @returns string
+    '''
+    lines = [_get_field(gkey, 'nick'), _get_field(gkey, 'name')]
+    for field in ['uid', 'keys', 'fingerprint']:
+        lines.extend(_get_field(gkey, field) or [])
+    return casefold(decoder('\n'.join(x for x in lines if x)))
+
+
+class SeedChanges(namedtuple('SeedChanges',
+        ['added', 'changed', 'removed', 'fields'])):
+    '''The changeset between an old and a new set of seeds
+
+    added, changed and removed are nick sorted lists of GKEYs, changed
+    holding the new GKEYs.  fields maps each changed nick to the list
+    of its changed DIFF_FIELDS.
+    '''
+
+    __slots__ = ()
+
+    def to_dict(self):
+        '''Returns the changeset as a json serializable dictionary'''
+        return {
+            'added': [x.nick for x in self.added],
+            'changed': dict((x.nick, self.fields[x.nick]) for x in self.changed),
+            'removed': [x.nick for x in self.removed],
+            }
+
+
+def seed_digest(text):
+    '''Returns the hex digest used to validate a seed file's cache'''
+    if not isinstance(text, bytes):
+        text = text.encode('utf_8')
+    return hashlib.sha1(text).hexdigest()
+
+
+class _SeedfileReader(object):
+    '''Chunked reader holding the unparsed remainder of a json seed file'''
+
+    json_decoder = json.JSONDecoder()
+    whitespace = ' \t\n\r'
+
+    def __init__(self, seedfile, digest, chunk_size):
+        self.seedfile = seedfile
+        self.digest = digest
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+
+    def _more(self):
+        chunk = self.seedfile.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.digest is not None:
+            self.digest.update(chunk if isinstance(chunk, bytes)
+                else chunk.encode('utf_8'))
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+
+    def peek(self):
+        '''Returns the next non whitespace character, '' at end of file'''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ''
+
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Seed file: expecting one of %r, found %r"
+                % (chars, char))
+        self.pos += 1
+        return char
+
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._more():
+                    continue
+                raise
+            # a value ending the buffer may continue in the next chunk
+            if end == len(self.buf) and self._more():
+                continue
+            self.pos = end
+            return value
+
+
+def read_journal(filename, digest):
+    '''Reads the journal of a seed file
+
+    @param filename: string, path of the seed file
+    @param digest: string, the seed_digest() of the seed file
+    @returns (created, records) tuple, None if the seed file has no
+             journal or the journal is not for this seed file's text.
+             A damaged record, such as the last line of an interrupted
+             append, is skipped.
+    '''
+    try:
+        journal = open(filename + SEED_JOURNAL, 'r')
+    except IOError:
+        return None
+    records = []
+    with journal:
+        header = None
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if header is None:
+                if record.get('op') != 'base':
+                    return None
+                header = record
+            elif record.get('op') in ['add', 'delete']:
+                records.append(record)
+    if header is None or header.get('digest') != digest:
+        return None
+    return header.get('created', 0), records
+
+
+def iter_seedfile(seedfile, digest=None, chunk_size=SEED_CHUNK_SIZE):
+    '''Yields the (nick, seed dictionary) pairs of a json seed file one
+    at a time, without decoding the whole document into memory
+
+    @param seedfile: file object open for reading
+    @param digest: optional hashlib object to update with the text read
+    @param chunk_size: int, the number of characters to read at a time
+    '''
+    reader = _SeedfileReader(seedfile, digest, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        nick = reader.decode()
+        reader.expect(':')
+        yield nick, reader.decode()
+        if reader.expect(',}') == '}':
+            return
+
+
+def _by_nick(seeds):
+    if not seeds:
+        return {}
+    if isinstance(seeds, Seeds):
+        return seeds.seeds
+    if isinstance(seeds, dict):
+        return seeds
+    return dict((gkey.nick, gkey) for gkey in seeds)
+
+
+def _field_value(gkey, field):
+    value = _get_field(gkey, field)
+    if isinstance(value, list):
+        return sorted(value)
+    return value
+
+
+def diff_seeds(old, new):
+    '''Compares two sets of seeds by nick in linear time
+
+    @param old: Seeds instance, {nick: GKEY} dictionary or list of GKEYs
+    @param new: Seeds instance, {nick: GKEY} dictionary or list of GKEYs
+    @returns SeedChanges instance
+    '''
+    old = _by_nick(old)
+    new = _by_nick(new)
+    added = []
+    changed = []
+    fields = {}
+    for nick in sorted(new):
+        gkey = new[nick]
+        if nick not in old:
+            added.append(gkey)
+            continue
+        if gkey == old[nick]:
+            continue
+        diffs = [field for field in DIFF_FIELDS
+            if _field_value(gkey, field) != _field_value(old[nick], field)]
+        if diffs:
+            changed.append(gkey)
+            fields[nick] = diffs
+    removed = [old[nick] for nick in sorted(old) if nick not in new]
+    return SeedChanges(added, changed, removed, fields)
+
 
 class Seeds(object):
     '''Handles all seed key file operations'''
@@ -53,7 +534,69 @@ class Seeds(object):
         self.filename = filepath
         self.config = config
         self.logger = _logger or logger
+        # the SqliteSeedStore of a SQLITE_SUFFIX seed file
+        self.store = None
+        # bumped by every change to and reload of the seeds, the holders
+        # of search results compare it to tell if theirs are still current
+        self.version = 0
         self.seeds = {}
+        # the lookup indexes, each field's built on its first use
+        self._index = {}
+        self._searches = 0
+        self._scans = {}
+        # {nick: search_text()} column, built on the first regex_search(),
+        # and the (nicks, starts, text) of the column joined for searching
+        self._texts = None
+        self._joined = None
+        # {nick: position} of the seeds, built on the first field_search()
+        # which has index candidates to put back in the seeds' order
+        self._order = None
+        # disk state of the seed file and its journal when they last
+        # held the seeds, see _file_state()
+        self._clean = None
+        # seed_digest() of the seed file last loaded or written
+        self._digest = None
+        # journal mode, the changes not yet appended to the journal
+        self.journaled = config_flag(self.config, 'seed_journal')
+        self._pending = []
+        self._journal_created = None
+
+
+    @property
+    def seeds(self):
+        '''The {nick: GKEY} dictionary of the seeds, a seed store's
+        seeds are read on first use'''
+        if self._seeds is None:
+            self._seeds = self._read_store()
+        return self._seeds
+
+
+    @seeds.setter
+    def seeds(self, seeds):
+        self._seeds = seeds
+        self.version += 1
+
+
+    def _read_store(self):
+        try:
+            return self.store.load()
+        except self.store.errors as err:
+            self._error(err)
+            return {}
+
+
+    def _open_store(self):
+        '''Returns the seed file's SqliteSeedStore, None for a json seed file'''
+        if not self.filename.endswith(SQLITE_SUFFIX):
+            self.store = None
+        elif self.store is None or self.store.filename != self.filename:
+            self.store = SqliteSeedStore(self.filename, self.logger)
+        return self.store
+
+
+    def _unread(self):
+        '''Checks if the seeds are still unread from the seed store'''
+        return self._seeds is None and not self._pending
 
 
     def load(self, filename=None, trap_errors=True, refresh=False):
@@ -64,11 +607,47 @@ class Seeds(object):
             self.logger.debug("Seed: load; Not a valid filename: '%s'" % str(self.filename))
             return False
         self.logger.debug("Seeds: load; Begin loading seed file %s" % self.filename)
-        seedlines = None
         self.seeds = {}
+        self._reindex()
+        self._clean = None
+        self._pending = []
+        self._journal_created = None
+        if self._open_store() is not None:
+            if not self.store.exists():
+                self.logger.debug("Seed: load; no seed store: %s" % self.filename)
+                if not trap_errors:
+                    self._error(IOError("No such file: %s" % self.filename))
+                return False
+            # the seeds are read on first use, searches query the store
+            self.seeds = None
+            self._clean = self.filename
+            self.logger.debug("Seed: load; opened seed store %s" % self.filename)
+            return True
+        if self._load_cache(refresh):
+            self._replay_journal()
+            self._mark_clean()
+            self._reindex()
+            self.logger.debug("Seed: load; Completed loading seed file cache %s"
+                % self.filename)
+            return True
+        digest = hashlib.sha1()
+        migrated = False
         try:
             with open(self.filename, "r+") as seedfile:
-                seedlines = json.load(seedfile)
+                stat = os.fstat(seedfile.fileno())
+                for seed in iter_seedfile(seedfile, digest):
+                    # GKEY class change auto-update
+                    if not 'uid' in seed[1]:
+                        if not refresh:
+                            raise UpdateDbError(filename)
+                        seed[1]['uid'] = []
+                        migrated = True
+                    if not 'keys' in seed[1]:
+                        if not refresh:
+                            raise UpdateDbError(filename)
+                        seed[1]['keys'] = seed[1]['fingerprint'][:]
+                        migrated = True
+                    self.seeds[seed[0]] = GKEY(**seed[1])
         except IOError as err:
             self.logger.debug("Seed: load; IOError occurred while loading file")
             if trap_errors:
@@ -76,30 +655,115 @@ class Seeds(object):
             else:
                 self._error(err)
             return False
-        for seed in list(seedlines.items()):
-            # GKEY class change auto-update
-            if not 'uid' in list(seed[1]):
-                if not refresh:
-                    raise UpdateDbError(filename)
-                seed[1]['uid'] = []
-            if not 'keys' in list(seed[1]):
-                if not refresh:
-                    raise UpdateDbError(filename)
-                seed[1]['keys'] = seed[1]['fingerprint'][:]
-
-            #try:
-            self.seeds[seed[0]] = GKEY(**seed[1])
-            #except Exception as err:
-                #self.logger.debug("Seed: load; Error splitting seed: %s" % seed)
-                #self.logger.debug("Seed: load; ...............parts: %s" % str(parts))
-                #self._error(err)
+        self._digest = digest.hexdigest()
+        # the cache holds the seed file alone, save it before the replay
+        if stat.st_size >= SEED_CACHE_MIN_SIZE:
+            self._save_cache(stat, self._digest, migrated)
+        self._replay_journal()
+        self._reindex()
+        if not migrated:
+            self._mark_clean(stat)
         self.logger.debug("Seed: load; Completed loading seed file %s" % self.filename)
         return True
 
 
+    def _load_cache(self, refresh):
+        '''Loads the seeds from the seed file's cache if it is still valid.
+        The cache is valid for a seed file of the same size and mtime,
+        or failing the mtime, the same digest.
+
+        @param refresh: boolean, allow a cache of a seed file that
+                        needed the GKEY class change auto-update
+        @returns boolean
+        '''
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        if stat.st_size < SEED_CACHE_MIN_SIZE:
+            return False
+        cachepath = self.filename + SEED_CACHE
+        try:
+            with open(cachepath, 'rb') as cachefile:
+                (version, fields, size, mtime, digest, migrated,
+                    seeds) = pickle.load(cachefile)
+        except (IOError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, pickle.UnpicklingError) as err:
+            self.logger.debug("Seed: _load_cache; no usable cache %s: %s"
+                % (cachepath, str(err)))
+            return False
+        if (version != SEED_CACHE_VERSION or fields != GKEY._fields
+                or size != stat.st_size or (migrated and not refresh)):
+            return False
+        if mtime != stat.st_mtime:
+            try:
+                with open(self.filename, 'r') as seedfile:
+                    if seed_digest(seedfile.read()) != digest:
+                        return False
+            except IOError:
+                return False
+        self.seeds = seeds
+        self._digest = digest
+        if mtime != stat.st_mtime:
+            # re-stamp it, the next loads need not digest the seed file
+            self._save_cache(stat, digest, migrated)
+        return True
+
+
+    def _replay_journal(self):
+        '''Applies the seed file's journal to the loaded seeds'''
+        journal = read_journal(self.filename, self._digest)
+        if journal is None:
+            return
+        self._journal_created, records = journal
+        for record in records:
+            if record['op'] == 'delete':
+                self.seeds.pop(record['nick'], None)
+                continue
+            try:
+                self.seeds[record['nick']] = GKEY(**record['seed'])
+            except (KeyError, TypeError) as err:
+                self.logger.debug("Seed: load; skipping bad journal record: %s"
+                    % str(err))
+        self.logger.debug("Seed: load; replayed %d journal records for %s"
+            % (len(records), self.filename))
+
+
+    def _save_cache(self, stat, digest, migrated):
+        '''Saves the seeds to the seed file's cache, a read only seeds
+        directory just goes without one
+
+        @param stat: os.stat_result of the seed file loaded
+        @param digest: string, the seed_digest() of the seed file loaded
+        @param migrated: boolean, the seeds needed the GKEY class change
+                         auto-update
+        '''
+        seeds = self.seeds
+        cachepath = self.filename + SEED_CACHE
+        data = (SEED_CACHE_VERSION, GKEY._fields, stat.st_size, stat.st_mtime,
+            digest, migrated, seeds)
+
+        def write(cachefile):
+            pickler = pickle.Pickler(cachefile, 2)
+            # no memo, the seeds hold no shared or recursive references
+            # worth keeping and the memo would double the peak memory
+            pickler.fast = True
+            pickler.dump(data)
+
+        try:
+            atomic_write(cachepath, write, mode='wb')
+        except (IOError, OSError, TypeError, AttributeError,
+                pickle.PicklingError) as err:
+            self.logger.debug("Seed: _save_cache; failed to save %s: %s"
+                % (cachepath, str(err)))
+
+
     def save(self, filename=None):
         '''Save the seeds to the file'''
         if filename:
+            if self._seeds is None and filename != self.filename:
+                # read them before leaving the seed store
+                self._seeds = self._read_store()
             self.filename = filename
         if not self.filename:
             self.logger.debug("Seed: save; Not a valid filename: '%s'" % str(self.filename))
@@ -109,20 +773,182 @@ class Seeds(object):
             mode=int(self.config.get_key('permissions', "directories"),0),
             fatal=True)
         os.umask(int(self.config.get_key("permissions", "files"),0))
+        if self._open_store() is not None:
+            return self._save_store()
+        if self._clean and self._clean == self._file_state():
+            if not self._pending:
+                self.logger.debug("Seed: save; seeds unchanged, not rewritten: %s"
+                    % self.filename)
+                return True
+            if not self._compact_due() and self._append_journal():
+                return True
+        return self._write()
+
+
+    def compact(self):
+        '''Folds the journal into the seed file, rewriting it
+
+        @returns boolean
+        '''
+        if not self.filename:
+            self.logger.debug("Seed: compact; Not a valid filename: '%s'" % str(self.filename))
+            return False
+        self.logger.debug("Seed: compact; compacting seed file %s" % self.filename)
+        return self._write()
+
+
+    def _save_store(self):
+        '''Saves the changes to the seed store, or all the seeds to a
+        store they were not loaded from'''
         try:
-            with open(self.filename, 'w') as seedfile:
-                seedfile.write(self._seeds2json(self.seeds))
-                seedfile.write("\n")
-        except IOError as err:
+            if self._clean == self.filename:
+                if self._pending:
+                    self.store.apply(self._pending)
+            else:
+                self.store.replace(self.seeds)
+        except self.store.errors as err:
             self._error(err)
             return False
+        self._pending = []
+        self._clean = self.filename
         return True
 
 
+    def _write(self):
+        '''Writes the seeds to the seed file and drops its journal'''
+        text = self._seeds2json(self.seeds) + "\n"
+        if self._unchanged(text):
+            self.logger.debug("Seed: save; seed file unchanged, not rewritten: %s"
+                % self.filename)
+        else:
+            try:
+                atomic_write(self.filename, text)
+            except (IOError, OSError) as err:
+                self._error(err)
+                return False
+        try:
+            os.unlink(self.filename + SEED_JOURNAL)
+        except OSError:
+            pass
+        self._digest = seed_digest(text)
+        self._pending = []
+        self._journal_created = None
+        self._mark_clean()
+        return True
+
+
+    def _append_journal(self):
+        '''Appends the pending changes to the seed file's journal
+
+        @returns boolean
+        '''
+        journalpath = self.filename + SEED_JOURNAL
+        records = []
+        text = ''
+        try:
+            # a journal not replayed on load is stale, rewrite instead
+            if os.path.exists(journalpath):
+                if self._journal_created is None:
+                    return False
+                # start on a new line after an interrupted append
+                with open(journalpath, 'rb') as journal:
+                    journal.seek(-1, os.SEEK_END)
+                    if journal.read(1) != b"\n":
+                        text = "\n"
+            else:
+                self._journal_created = int(time.time())
+                records.append({'op': 'base', 'digest': self._digest,
+                    'created': self._journal_created})
+            records.extend(self._pending)
+            text += ''.join(json.dumps(x, sort_keys=True) + "\n" for x in records)
+            with open(journalpath, 'a') as journal:
+                journal.write(text)
+                journal.flush()
+                os.fsync(journal.fileno())
+        except (IOError, OSError) as err:
+            self.logger.debug("Seed: save; failed to append to journal %s: %s"
+                % (journalpath, str(err)))
+            return False
+        self.logger.debug("Seed: save; appended %d changes to journal %s"
+            % (len(self._pending), journalpath))
+        self._pending = []
+        self._mark_clean()
+        return True
+
+
+    def _compact_due(self):
+        '''Checks if the journal is over the configured size or age'''
+        try:
+            size = os.path.getsize(self.filename + SEED_JOURNAL)
+        except OSError:
+            return False
+        max_size = self._config_number('journal_max_size')
+        if max_size and size >= max_size:
+            return True
+        max_age = self._config_number('journal_max_age')
+        return bool(max_age and self._journal_created is not None
+            and time.time() - self._journal_created >= max_age * 86400)
+
+
+    def _config_number(self, key):
+        try:
+            return float(self.config.get_key(key))
+        except (TypeError, ValueError):
+            return 0
+
+
+    def _file_state(self, stat=None):
+        if stat is None:
+            try:
+                stat = os.stat(self.filename)
+            except OSError:
+                return None
+        try:
+            jstat = os.stat(self.filename + SEED_JOURNAL)
+            journal = (jstat.st_size, jstat.st_mtime)
+        except OSError:
+            journal = None
+        return (self.filename, stat.st_size, stat.st_mtime, journal)
+
+
+    def _mark_clean(self, stat=None):
+        '''Records that the seed file and its journal hold the seeds
+        in memory'''
+        self._clean = self._file_state(stat)
+
+
+    def _unchanged(self, text):
+        '''Checks if the seed file already holds exactly text'''
+        data = text if isinstance(text, bytes) else text.encode('utf_8')
+        try:
+            if os.path.getsize(self.filename) != len(data):
+                return False
+            with open(self.filename, 'rb') as seedfile:
+                return seedfile.read() == data
+        except (IOError, OSError):
+            return False
+
+
+    def pack(self):
+        '''Repacks the seeds into a GKEYStore, for long lived holders of
+        large seed files.  It needs about a third of the memory of the
+        GKEY namedtuples, each lookup building a new GKEY view.'''
+        if not isinstance(self.seeds, GKEYStore):
+            self.seeds = GKEYStore(self.seeds)
+
+
     def add(self, dev, gkey):
         '''Add a new seed key to memory'''
         if isinstance(gkey, dict) or isinstance(gkey, GKEY):
+            if dev in self.seeds:
+                if self.seeds[dev] == gkey:
+                    return True
+                self._unindex(dev, self.seeds[dev])
+            self._changed({'op': 'add', 'nick': dev, 'seed': dict(
+                gkey._asdict() if isinstance(gkey, GKEY) else gkey)})
             self.seeds[dev] = gkey
+            self._index_seed(dev, gkey)
+            self.version += 1
             return True
         return False
 
@@ -138,12 +964,27 @@ class Seeds(object):
             elif isinstance(gkey, GKEY):
                 nick = gkey.nick
             try:
-                self.seeds.pop(nick, None)
+                oldkey = self.seeds.pop(nick, None)
             except ValueError:
                 return False
+            if oldkey is not None:
+                self._changed({'op': 'delete', 'nick': nick})
+                self._unindex(nick, oldkey)
+                self.version += 1
             return True
 
 
+    def _changed(self, record):
+        '''Records a change to the seeds in memory
+
+        @param record: dictionary, the change's journal record
+        '''
+        if self.journaled or self.store is not None:
+            self._pending.append(record)
+        else:
+            self._clean = None
+
+
     def list(self, **kwargs):
         '''List the key or keys matching the kwargs argument or all
 
@@ -154,36 +995,241 @@ class Seeds(object):
             return sorted(self.seeds.values())
         # proceed with the search
         # discard any invalid keys
-        keys = kwargs
-        result = self.seeds
-        for key in keys:
-            if not kwargs[key]:
+        nicks, predicates = self._plan(self._search_keys(kwargs),
+            self._list_candidates)
+        if nicks is None:
+            seeds = self.seeds.values()
+        else:
+            seeds = [self.seeds[nick] for nick in nicks if nick in self.seeds]
+        return sorted(gkey for gkey in seeds if self._matches(gkey, predicates))
+
+
+    def stream(self, **kwargs):
+        '''Yields the seed file's keys matching the kwargs argument or all,
+        one at a time in file order, without loading the seed file
+
+        @param kwargs: dict of GKEY._fields and values
+        '''
+        if not self.filename:
+            self.logger.debug("Seed: stream; Not a valid filename: '%s'" % str(self.filename))
+            return
+        if 'nick' in kwargs and kwargs['nick'] == '*':
+            kwargs = {}
+        predicates = self._plan(self._search_keys(kwargs))[1]
+        if self._open_store() is not None:
+            try:
+                for nick, seed in self.store.iter_seeds():
+                    gkey = GKEY(**seed)
+                    if self._matches(gkey, predicates):
+                        yield gkey
+            except self.store.errors as err:
+                self.logger.debug("Seed: stream; %s" % str(err))
+            return
+        try:
+            changes = self._journal_changes()
+            with open(self.filename, "r") as seedfile:
+                for nick, seed in iter_seedfile(seedfile):
+                    if nick in changes:
+                        seed = changes.pop(nick)
+                        if seed is None:
+                            continue
+                    # GKEY class change auto-update
+                    if not 'uid' in seed:
+                        seed['uid'] = []
+                    if not 'keys' in seed:
+                        seed['keys'] = seed['fingerprint'][:]
+                    gkey = GKEY(**seed)
+                    if self._matches(gkey, predicates):
+                        yield gkey
+            for seed in changes.values():
+                if seed is not None:
+                    gkey = GKEY(**seed)
+                    if self._matches(gkey, predicates):
+                        yield gkey
+        except IOError as err:
+            self.logger.debug("Seed: stream; IOError occurred while loading file")
+            self.logger.debug("Seed: stream; %s" % str(err))
+
+
+    def _journal_changes(self):
+        '''Returns the seed file journal's changes for stream()
+
+        @returns OrderedDict of {nick: seed dictionary or None if deleted}
+        '''
+        changes = OrderedDict()
+        if not os.path.exists(self.filename + SEED_JOURNAL):
+            return changes
+        # the journal applies to the seed file text it names the digest of
+        digest = hashlib.sha1()
+        with open(self.filename, "r") as seedfile:
+            for chunk in iter(lambda: seedfile.read(SEED_CHUNK_SIZE), ''):
+                digest.update(chunk if isinstance(chunk, bytes)
+                    else chunk.encode('utf_8'))
+        journal = read_journal(self.filename, digest.hexdigest())
+        if journal:
+            for record in journal[1]:
+                changes[record['nick']] = record.get('seed')
+        return changes
+
+
+    @staticmethod
+    def _search_keys(kwargs):
+        '''Returns the list() search predicates of the kwargs, the
+        kwargs and their values are left as they are
+
+        @returns list of (rank, key, value) tuples
+        '''
+        predicates = []
+        for key in kwargs:
+            value = kwargs[key]
+            if not value:
                 continue
             if key in ['fingerprint', 'keys', 'keyid']:
-                kwargs[key] = [x.replace(' ', '').upper() for x in kwargs[key]]
-            if key in ['fingerprint', 'keys', 'uid']:
-                result = {dev: gkey for dev, gkey in list(result.items()) if kwargs[key][0] in getattr(gkey, key)}
-            elif key in ['keyid']:
-                searchids = [x.lstrip('0X') for x in kwargs[key]]
-                res = {}
-                for dev, gkey in list(result.items()):
-                    keyids = [x.lstrip("0x") for x in getattr(gkey, key)]
-                    for keyid in searchids:
-                        if keyid in keyids:
-                            res[dev] = gkey
-                            break
-                result = res
+                value = [normalize_fpr(x) for x in value]
+                rank = (PLAN_INDEX, 0)
+            elif key in ['uid']:
+                rank = (PLAN_INDEX, 1)
             else:
-                result = {dev: gkey for dev, gkey in list(result.items())
-                    if kwargs[key].lower()
-                    in getattr(gkey, key).lower()
-                    }
-        return sorted(result.values())
+                # the longer substring is the more selective
+                rank = (PLAN_SUBSTRING, -len(value))
+            predicates.append((rank, key, value))
+        return predicates
+
+
+    def _plan(self, predicates, candidates=None):
+        '''Query planner of the searches for the seeds matching all
+        of the predicates
+
+        Orders the predicates most selective first, so the cheap index
+        tests reject most seeds before any substring test runs, and
+        intersects the candidate nicks of the predicates an index can
+        answer, stopping as soon as none are left.
+
+        @param predicates: list of (rank, field, value) tuples, the lower
+                           ranks being the more selective
+        @param candidates: optional function of (field, value) returning
+                           the nicks which can possibly match, or None
+                           if the predicate can only be scanned for
+        @returns (nicks, predicates) tuple of the set of candidate nicks,
+                 None to scan all the seeds, and the ordered predicates
+        '''
+        predicates = sorted(predicates, key=lambda x: x[0])
+        nicks = None
+        if candidates is not None:
+            for rank, field, value in predicates:
+                if nicks is not None and len(nicks) <= PLAN_FEW_CANDIDATES:
+                    break
+                found = candidates(field, value)
+                if found is None:
+                    continue
+                nicks = set(found) if nicks is None else nicks.intersection(found)
+        self.logger.debug("Seed: _plan; %s, %s candidates"
+            % (', '.join(x[1] for x in predicates),
+            'all' if nicks is None else len(nicks)))
+        return nicks, predicates
+
+
+    def _list_candidates(self, field, value):
+        if field in ['fingerprint', 'keys', 'uid']:
+            return self._index_candidates(field, value[:1])
+        if field in ['keyid']:
+            return self._index_candidates(field, value)
+        return None
+
+
+    def _matches(self, gkey, predicates):
+        return all(self._match(gkey, key, value) for rank, key, value in predicates)
+
+
+    @staticmethod
+    def _match(gkey, key, value):
+        if key in ['fingerprint', 'keys', 'uid']:
+            return value[0] in getattr(gkey, key)
+        if key in ['keyid']:
+            keyids = [x.lstrip("0x") for x in getattr(gkey, key)]
+            for keyid in value:
+                if keyid.lstrip('0X') in keyids:
+                    return True
+            return False
+        return value.lower() in getattr(gkey, key).lower()
+
+
+    def lookup(self, field, value):
+        '''Exact, case insensitive index lookup
+
+        @param field: string, one of INDEX_FIELDS
+        @param value: string, the nick, fingerprint, long keyid,
+            uid or email address to find
+        @returns sorted list of matching GKEY instances
+        '''
+        if field in ['fingerprint', 'keys']:
+            key = normalize_fpr(value)
+        elif field == 'keyid':
+            key = normalize_keyid(value)
+        else:
+            key = value.lower()
+        if self._unread():
+            try:
+                return sorted(self.store.get(self.store.lookup(field, key)).values())
+            except self.store.errors as err:
+                self._error(err)
+                return []
+        nicks = self._field_index(field).get(key, ())
+        return sorted(self.seeds[nick] for nick in nicks)
 
 
     def regex_search(self, pattern):
-        '''Search for the keys matching the regular expression pattern'''
-        pass
+        '''Search for the keys matching the regular expression pattern
+
+        The pattern is matched case insensitively against each seed's
+        casefolded nick, name, uids and fingerprints, one per line,
+        so ^ and $ anchor to a single value.
+
+        @param pattern: string
+        @returns sorted list of matching GKEY instances
+        '''
+        try:
+            regex = compile_search(pattern)
+        except re.error as err:
+            self.logger.error("Seed: regex_search; invalid pattern %s: %s"
+                % (pattern, str(err)))
+            return []
+        if not self.seeds:
+            return []
+        if self._texts is None:
+            self._texts = dict((nick, search_text(gkey))
+                for nick, gkey in self.seeds.items())
+        if '\\A' in pattern or '\\Z' in pattern:
+            # anchored to the whole seed text, search them one by one
+            return sorted(self.seeds[nick] for nick, text in self._texts.items()
+                if regex.search(text))
+        if self._joined is None:
+            nicks = list(self._texts)
+            starts = []
+            pos = 0
+            for nick in nicks:
+                starts.append(pos)
+                pos += len(self._texts[nick]) + 1
+            self._joined = (nicks, starts,
+                '\n'.join(self._texts[nick] for nick in nicks))
+        nicks, starts, text = self._joined
+        # one search over the joined column finds the next matching seed,
+        # the seed's own text confirms a match that ran on into the next
+        found = []
+        pos = 0
+        while pos <= len(text):
+            match = regex.search(text, pos)
+            if not match:
+                break
+            row = bisect_right(starts, match.start()) - 1
+            if row < 0:
+                break
+            if regex.search(self._texts[nicks[row]]):
+                found.append(self.seeds[nicks[row]])
+            if row + 1 == len(starts):
+                break
+            pos = starts[row + 1]
+        return sorted(found)
 
 
     def nick_search(self, nick):
@@ -192,6 +1238,12 @@ class Seeds(object):
         @param nick: string
         @returns GKEY instance or None
         '''
+        if self._unread():
+            try:
+                return self.store.get([nick]).get(nick, [])
+            except self.store.errors as err:
+                self._error(err)
+                return []
         try:
             return self.seeds[nick]
         except KeyError:
@@ -209,22 +1261,183 @@ class Seeds(object):
         results = []
         if field == 'nick' and exact:
             return self.nick_search(value)
-        for nick in self.seeds:
-            seed = self.seeds[nick]
-            val = getattr(seed, field)
-            if isinstance(val, list) or isinstance(value, list):
-                if  self._list_search(value, val, exact):
-                    results.append(seed)
-            elif exact:
-                if decoder(value) in val:
-                    results.append(seed)
-            else:
-                if decoder(value).lower() in val.lower():
-                    results.append(seed)
+        seeds = self._store_candidates(field, value)
+        if seeds is None:
+            seeds = self.seeds
+            nicks = self._token_candidates(field, value)
+            if nicks is not None:
+                # the results come in the seeds' order, as a scan finds them
+                nicks = self._seed_order(nicks)
+        else:
+            # the store's seeds are read in nick order
+            nicks = sorted(seeds)
+        if nicks is None:
+            nicks = seeds
+        find = None
+        if not isinstance(value, list):
+            find = decoder(value) if exact else decoder(value).lower()
+        for nick in nicks:
+            seed = seeds[nick]
+            if self._field_match(seed, field, value, exact, find):
+                results.append(seed)
 
         return results
 
 
+    def _seed_order(self, nicks):
+        '''Returns the nicks sorted in the order of the seeds'''
+        if self._order is None:
+            self._order = dict((nick, pos) for pos, nick in enumerate(self.seeds))
+        return sorted(nicks, key=self._order.__getitem__)
+
+
+    def _field_match(self, seed, field, value, exact, find=None):
+        '''Tests a seed for a field_search() match
+
+        @param find: the decoded (and lower cased unless exact) value,
+                     if the caller has it
+        '''
+        val = getattr(seed, field)
+        if isinstance(val, list) or isinstance(value, list):
+            return self._list_search(value, val, exact)
+        if find is None:
+            find = decoder(value) if exact else decoder(value).lower()
+        if exact:
+            return find in val
+        return find in val.lower()
+
+
+    def search(self, field, value, exact=False, fuzzy=False):
+        '''Searches the seeds for one of the key_search() args
+
+        @param field: string, a GKEY field or 'regex'
+        @param value: string or list of strings
+        @param exact: Boolean
+        @param fuzzy: Boolean, fuzzy search the TRIGRAM_FIELDS
+        @returns list of GKEY instances
+        '''
+        if field == 'regex':
+            return self.regex_search(value)
+        if fuzzy and field in TRIGRAM_FIELDS:
+            seeds = []
+            for find in value if isinstance(value, list) else [value]:
+                for seed in self.fuzzy_search(field, find):
+                    if seed not in seeds:
+                        seeds.append(seed)
+            return seeds
+        if field == 'nick' and exact:
+            seed = self.nick_search(value)
+            return [seed] if seed else []
+        return self.field_search(field, value, exact)
+
+
+    def search_all(self, searches, exact=False, fuzzy=False):
+        '''Searches the seeds for the ones matching all of the searches
+
+        The query planner orders the searches, the candidates of the
+        indexed ones are then tested against all of them.
+
+        @param searches: list of (field, value) key_search() args
+        @param exact: Boolean
+        @param fuzzy: Boolean, fuzzy search the TRIGRAM_FIELDS
+        @returns sorted list of GKEY instances
+        '''
+        predicates = []
+        for field, value in searches:
+            if field == 'regex':
+                try:
+                    value = compile_search(value)
+                except re.error as err:
+                    self.logger.error("Seed: search_all; invalid pattern %s: %s"
+                        % (value, str(err)))
+                    return []
+            predicates.append((self._search_rank(field, value, exact, fuzzy),
+                field, value))
+        nicks, predicates = self._plan(predicates, lambda field, value:
+            self._search_candidates(field, value, exact, fuzzy))
+        seeds = None
+        if nicks is not None and self._unread():
+            try:
+                seeds = self.store.get(nicks)
+            except self.store.errors as err:
+                self._error(err)
+        if seeds is None:
+            seeds = self.seeds
+        if nicks is None:
+            nicks = list(seeds)
+        found = []
+        for nick in nicks:
+            seed = seeds.get(nick)
+            if seed is not None and all(self._search_match(seed, field, value,
+                    exact, fuzzy) for rank, field, value in predicates):
+                found.append(seed)
+        return sorted(found)
+
+
+    @staticmethod
+    def _search_rank(field, value, exact, fuzzy):
+        '''Returns the query planner rank of a key_search() arg'''
+        if field == 'regex':
+            return (PLAN_SCAN, 0)
+        if fuzzy and field in TRIGRAM_FIELDS:
+            # the edit distances cost the most to test
+            return (PLAN_SCAN, 1)
+        if field == 'nick' and exact:
+            return (PLAN_INDEX, 0)
+        values = [x or '' for x in value] if isinstance(value, list) else [value or '']
+        shortest = min(len(x) for x in values or [''])
+        if field in ['fingerprint', 'keys'] and all(FPR_RE.match(x) for x in values):
+            return (PLAN_INDEX, 1)
+        if field == 'keyid' and all(KEYID_RE.match(x) for x in values):
+            return (PLAN_INDEX, 1)
+        if field in TRIGRAM_FIELDS and shortest >= 3:
+            return (PLAN_TRIGRAM, -shortest)
+        return (PLAN_SUBSTRING, -shortest)
+
+
+    def _search_candidates(self, field, value, exact, fuzzy):
+        '''Returns the nicks which can possibly match a key_search() arg,
+        or None if the arg has to be scanned for'''
+        values = value if isinstance(value, list) else [value]
+        if field == 'regex':
+            return None
+        if field == 'nick' and exact:
+            return [value]
+        if fuzzy and field in TRIGRAM_FIELDS:
+            nicks = set()
+            for find in values:
+                find = decoder(find).lower()
+                found = self._fuzzy_candidates(field, find,
+                    len(find) // FUZZY_RATIO)
+                if found is None:
+                    return None
+                nicks.update(found)
+            return nicks
+        if self._unread():
+            try:
+                return self.store.candidates(field, [decoder(x) for x in values])
+            except self.store.errors as err:
+                self._error(err)
+                return None
+        return self._token_candidates(field, value)
+
+
+    def _search_match(self, seed, field, value, exact, fuzzy):
+        '''Tests a seed for a key_search() arg match'''
+        if field == 'regex':
+            return value.search(search_text(seed)) is not None
+        if fuzzy and field in TRIGRAM_FIELDS:
+            for find in value if isinstance(value, list) else [value]:
+                find = decoder(find).lower()
+                distance = len(find) // FUZZY_RATIO
+                if self._fuzzy_distance(seed, field, find, distance) <= distance:
+                    return True
+            return False
+        if field == 'nick' and exact:
+            return seed.nick == value
+        return self._field_match(seed, field, value, exact)
+
+
     def _list_search(self, find, values, exact):
         if isinstance(find, list):
             found = []
@@ -242,6 +1455,190 @@ class Seeds(object):
         return False
 
 
+    def _index_seed(self, nick, gkey, fields=None):
+        if fields is None:
+            self._order = None
+        if fields is None and self._texts is not None:
+            self._texts[nick] = search_text(gkey)
+            self._joined = None
+        for field in fields or list(self._index):
+            index = self._index[field]
+            for key in index_keys(field, gkey):
+                index.setdefault(key, set()).add(nick)
+
+
+    def _unindex(self, nick, gkey):
+        self._order = None
+        if self._texts is not None:
+            self._texts.pop(nick, None)
+            self._joined = None
+        for field in list(self._index):
+            index = self._index[field]
+            for key in index_keys(field, gkey):
+                nicks = index.get(key)
+                if nicks:
+                    nicks.discard(nick)
+                    if not nicks:
+                        del index[key]
+
+
+    def _reindex(self):
+        self.version += 1
+        self._index = {}
+        self._searches = 0
+        self._scans = {}
+        self._texts = None
+        self._joined = None
+        self._order = None
+
+
+    def _field_index(self, field):
+        if field not in self._index:
+            self._index[field] = {}
+            for nick, gkey in self.seeds.items():
+                self._index_seed(nick, gkey, [field])
+        return self._index[field]
+
+
+    def _index_candidates(self, field, values):
+        '''Returns the set of index candidate nicks for any of values,
+        or None to leave the search to the caller's scan.
+        The caller still applies its own match test to the candidates.
+        A first search is left to the caller's scan, which costs less
+        than building the field's index.'''
+        if field not in self._index:
+            self._searches += 1
+            if self._searches < 2:
+                return None
+        index = self._field_index(field)
+        if field in ['fingerprint', 'keys']:
+            keys = [normalize_fpr(x) for x in values]
+        elif field == 'keyid':
+            keys = [normalize_keyid(x) for x in values]
+        else:
+            keys = [x.lower() for x in values]
+        nicks = set()
+        for key in keys:
+            nicks.update(index.get(key, ()))
+        return nicks
+
+
+    def _store_candidates(self, field, value):
+        '''Reads only the seeds the seed store finds can possibly match
+        a field_search() for value, while the seeds are still unread
+
+        @returns {nick: GKEY} dictionary or None
+        '''
+        if not self._unread():
+            return None
+        values = value if isinstance(value, list) else [value]
+        try:
+            nicks = self.store.candidates(field, [decoder(x) for x in values])
+            if nicks is None:
+                return None
+            return self.store.get(nicks)
+        except self.store.errors as err:
+            self._error(err)
+            return None
+
+
+    def _token_candidates(self, field, value):
+        '''Returns the nicks which can possibly match a field_search()
+        for value, or None if the index can not answer the search.
+
+        Substring searches can only be answered from the index when every
+        search value is a complete fingerprint or long keyid, or from the
+        name and uid trigram indexes when every search value has a trigram.
+        '''
+        if field in TRIGRAM_FIELDS:
+            values = value if isinstance(value, list) else [value]
+            return self._trigram_candidates(TRIGRAM_FIELDS[field], values)
+        if field in ['fingerprint', 'keys']:
+            token_re = FPR_RE
+        elif field == 'keyid':
+            token_re = KEYID_RE
+        else:
+            return None
+        values = value if isinstance(value, list) else [value]
+        if not values or not all(token_re.match(x or '') for x in values):
+            return None
+        return self._index_candidates(field, values)
+
+
+    def _trigram_candidates(self, index_field, values):
+        '''Returns the nicks with all the trigrams of any of values,
+        or None if the trigram index can not answer the search'''
+        grams = [trigrams(decoder(x)) for x in values if x]
+        if not grams or not all(grams) or len(grams) != len(values):
+            return None
+        if index_field not in self._index:
+            self._scans[index_field] = self._scans.get(index_field, 0) + 1
+            if self._scans[index_field] < TRIGRAM_BUILD_SCANS:
+                return None
+        index = self._field_index(index_field)
+        nicks = set()
+        for value_grams in grams:
+            postings = sorted((index.get(x, set()) for x in value_grams), key=len)
+            nicks.update(postings[0].intersection(*postings[1:]))
+        return list(nicks)
+
+
+    def fuzzy_search(self, field, value, distance=None):
+        '''Searches a name or uid field for the values containing value
+        give or take a few typos.  It always uses the field's trigram
+        index, a scan would compute the edit distance of every value.
+
+        @param field: string, one of TRIGRAM_FIELDS
+        @param value: string
+        @param distance: int, the most edits allowed, defaults to one
+                         per FUZZY_RATIO characters of value
+        @returns list of GKEY instances, the closest matches first
+        '''
+        find = decoder(value).lower()
+        if distance is None:
+            distance = len(find) // FUZZY_RATIO
+        nicks = self._fuzzy_candidates(field, find, distance)
+        if nicks is None:
+            nicks = list(self.seeds)
+        self.logger.debug("Seed: fuzzy_search; %d candidates for %s"
+            % (len(nicks), find))
+        found = []
+        for nick in nicks:
+            seed = self.seeds[nick]
+            best = self._fuzzy_distance(seed, field, find, distance)
+            if best <= distance:
+                found.append((best, seed))
+        return [seed for best, seed in sorted(found)]
+
+
+    def _fuzzy_candidates(self, field, find, distance):
+        '''Returns the nicks which can be within distance of find,
+        or None if every seed can be'''
+        grams = trigrams(find)
+        # an edit changes at most three of the value's trigrams, a match
+        # keeps all the others
+        needed = len(grams) - 3 * distance
+        if needed <= 0:
+            return None
+        counts = {}
+        index = self._field_index(TRIGRAM_FIELDS[field])
+        for gram in grams:
+            for nick in index.get(gram, ()):
+                counts[nick] = counts.get(nick, 0) + 1
+        return [nick for nick in counts if counts[nick] >= needed]
+
+
+    @staticmethod
+    def _fuzzy_distance(seed, field, find, distance):
+        '''Returns the edit distance of find from the closest of the
+        seed's field values, distance + 1 if it has none'''
+        values = getattr(seed, field) or []
+        if not isinstance(values, list):
+            values = [values]
+        return min([substring_distance(find, x.lower()) for x in values]
+            or [distance + 1])
+
+
     def _error(self, err, debug=False):
         '''Class error logging function'''
         if debug:
@@ -253,12 +1650,16 @@ class Seeds(object):
 
 
     def _seeds2json(self, seeds):
+        '''Returns the canonical json serialization of the seeds,
+        equal seeds always serialize to the same text'''
         if not seeds:
             seeds = {}
+        data = {}
         for dev, value in list(seeds.items()):
             if isinstance(value, GKEY):
-                seeds[dev] = dict(value._asdict())
-        return json.dumps(seeds, sort_keys=True, indent=4)
+                value = dict(value._asdict())
+            data[dev] = value
+        return json.dumps(data, sort_keys=True, indent=4)
 
 
     def update(self, gkey):
@@ -267,6 +1668,7 @@ class Seeds(object):
         @param gkey: GKEY instance
         '''
         oldkey = self.nick_search(gkey.nick)
-        if oldkey:
-            self.delete(oldkey)
+        if oldkey == gkey:
+            return
+        # add() replaces the old key
         self.add(gkey.nick, gkey)
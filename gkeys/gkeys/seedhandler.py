@@ -18,11 +18,10 @@ from snakeoil.demandload import demandload
 
 from gkeys.gkey import GKEY
 from gkeys.lock import LockDir
-from gkeys.seed import Seeds, decoder
+from gkeys.seed import (Seeds, decoder, diff_seeds, installed_current,
+    installed_db, keydirs_state, save_installed_state, seedfile_state)
 
 demandload(
-    "json:load",
-    "gkeys.exception:UpdateDbError",
     "gkeys.fileops:ensure_dirs",
     "gkeys.fileops:updateseeds",
     "gkeys.fetch:Fetch",
@@ -38,6 +37,8 @@ class SeedHandler(object):
         self.fingerprint_re = re.compile('[0-9A-Fa-f]{40}')
         self.finerprint_re2 = re.compile('[0-9A-Fa-f]{4}( [0-9A-Fa-f]{4}){9}')
         self.seeds = None
+        # category_state() of the installed keys load_category() last loaded
+        self.loaded_state = None
         self.seedsdir_lock = None
         self.update_lock = None
 
@@ -86,56 +87,21 @@ class SeedHandler(object):
         @return changed_gkeys: list of keys that are included in seed1 and seed2 but have been altered
         @return removed_gkeys: list of keys that are included in seed1 but not in seed2
         '''
-        old_gkeys = seeds1[1]
-        new_gkeys = seeds2[1]
-        changed_gkeys = []
-        old_changed_gkeys = []
-        removed_gkeys = []
-        added_gkeys = []
-        if old_gkeys:
-            for new_gkey in new_gkeys:
-                for old_gkey in old_gkeys:
-                    if new_gkey.nick == old_gkey.nick and new_gkey != old_gkey:
-                        changed_gkeys.append(new_gkey)
-                        old_changed_gkeys.append(old_gkey)
-                if new_gkey not in old_gkeys and new_gkey not in changed_gkeys:
-                    added_gkeys.append(new_gkey)
-            for old_gkey in old_gkeys:
-                if old_gkey not in new_gkeys and old_gkey not in old_changed_gkeys:
-                    removed_gkeys.append(old_gkey)
-        else:
-            added_gkeys = new_gkeys
-        return(added_gkeys, changed_gkeys, removed_gkeys)
+        changes = self.diff_seeds(seeds1[1], seeds2[1])
+        return(changes.added, changes.changed, changes.removed)
 
-    def compare_seeds(self, seeds1, seeds2) :
-        '''Compares two seed lists and returns the differences
 
-        @param seeds1: set of seeds to be compared
-        @param seeds2: set of seeds to be compared
-        @return added_gkeys: list of keys that are included in seed2 but not seed1
-        @return changed_gkeys: list of keys that are included in seed1 and seed2 but have been altered
-        @return removed_gkeys: list of keys that are included in seed1 but not in seed2
+    def diff_seeds(self, old, new):
+        '''Compares two sets of seeds
+
+        @param old: Seeds instance, {nick: GKEY} dictionary or list of GKEYs
+        @param new: Seeds instance, {nick: GKEY} dictionary or list of GKEYs
+        @returns SeedChanges instance
         '''
-        old_gkeys = seeds1[1]
-        new_gkeys = seeds2[1]
-        changed_gkeys = []
-        old_changed_gkeys = []
-        removed_gkeys = []
-        added_gkeys = []
-        if old_gkeys:
-            for new_gkey in new_gkeys:
-                for old_gkey in old_gkeys:
-                    if new_gkey.nick == old_gkey.nick and new_gkey != old_gkey:
-                        changed_gkeys.append(new_gkey)
-                        old_changed_gkeys.append(old_gkey)
-                if new_gkey not in old_gkeys and new_gkey not in changed_gkeys:
-                    added_gkeys.append(new_gkey)
-            for old_gkey in old_gkeys:
-                if old_gkey not in new_gkeys and old_gkey not in old_changed_gkeys:
-                    removed_gkeys.append(old_gkey)
-        else:
-            added_gkeys = new_gkeys
-        return(added_gkeys, changed_gkeys, removed_gkeys)
+        changes = diff_seeds(old, new)
+        self.logger.debug("SeedHandler: diff_seeds; %d added, %d changed, %d removed"
+            % (len(changes.added), len(changes.changed), len(changes.removed)))
+        return changes
 
     def load_seeds(self, seedfile=None, filepath=None, refresh=False):
         '''Load seed file
@@ -167,46 +133,43 @@ class SeedHandler(object):
         @param nicks: list of string nick ids to load
         @return Seeds class object
         '''
-        seeds = Seeds(config=self.config, _logger=self.logger)
-        if category == 'sign':
-            catdir = self.config.get_key('sign-keydir')
-        else:
-            #keyrings = self.config.get_key('keyring')
-            #catdir = os.path.join(keyrings, category)
-            catdir = self.config.get_key('keyrings', category)
+        catdir = self._catdir(category)
         self.logger.debug("SeedHandler: load_category; catdir = %s", catdir)
+        # the states are taken before the reads, a change meanwhile
+        # leaves the loaded seeds (and the db rebuilt from them) stale
+        self.loaded_state = self.category_state(category)
+        seeds = self.load_installed_db(catdir, refresh=refresh)
+        if seeds is not None:
+            if nicks:
+                selected = Seeds(config=self.config, _logger=self.logger)
+                for nick in sorted(seeds.seeds):
+                    if seeds.seeds[nick].keydir in nicks:
+                        selected.add(nick, seeds.seeds[nick])
+                seeds = selected
+            self.seeds = seeds
+            self.logger.debug("SeedHandler: load_category; seeds loaded: %s", seeds)
+            return seeds
+        seeds = Seeds(config=self.config, _logger=self.logger)
+        self.loaded_state = ('keydirs', ())
         try:
-            if not nicks:
-                nicks = os.listdir(catdir)
-            for nick in nicks:
+            rebuild = not nicks
+            keydirs = self._keydirs_state(catdir, nicks)
+            self.loaded_state = ('keydirs', tuple(sorted(keydirs.items())))
+            for nick in sorted(keydirs):
                 seed_path = os.path.join(catdir, nick)
                 if not os.path.isdir(seed_path):
                     continue
                 gkey_path = os.path.join(seed_path, 'gkey.seeds')
-                seed = None
-                try:
-                    with open(gkey_path, 'r') as fileseed:
-                        seed = load(fileseed)
+                # loaded through Seeds to replay any journaled changes,
+                # it does the GKEY class change auto-update too
+                seed = Seeds(config=self.config, _logger=self.logger)
+                if seed.load(gkey_path, refresh=refresh):
                     self.logger.debug("SeedHandler: load_category; loaded seed file %s.",
                                       gkey_path)
-                except IOError as error:
-                    self.logger.debug("SeedHandler: load_category; IOError loading seed file %s.",
-                                      gkey_path)
-                    self.logger.debug("Error was: %s" % str(error))
-                if seed:
-                    self.logger.debug("SeedHandler: load_category; processing seeds: %s", seed)
-                    for nick in sorted(seed):
-                        key = seed[nick]
-                        # GKEY class change auto-update
-                        if not 'uid' in list(key):
-                            if not refresh:
-                                raise UpdateDbError(category)
-                            key['uid'] = []
-                        if not 'keys' in list(key):
-                            if not refresh:
-                                raise UpdateDbError(category)
-                            key['keys'] = key['fingerprint'][:]
-                        seeds.add(nick, GKEY(**key))
+                    for nick in sorted(seed.seeds):
+                        seeds.add(nick, seed.seeds[nick])
+            if rebuild and seeds.seeds:
+                self.save_installed_db(catdir, seeds, keydirs)
         except OSError as error:
             self.logger.debug("SeedHandler: load_category; OSError for %s" % catdir)
             self.logger.exception("Error was: %s" % str(error))
@@ -214,6 +177,90 @@ class SeedHandler(object):
         self.logger.debug("SeedHandler: load_category; seeds loaded: %s", seeds)
         return seeds
 
+    def _catdir(self, category):
+        if category == 'sign':
+            return self.config.get_key('sign-keydir')
+        #keyrings = self.config.get_key('keyring')
+        #catdir = os.path.join(keyrings, category)
+        return self.config.get_key('keyrings', category)
+
+    def category_state(self, category, nicks=None, keydirs=False):
+        '''Returns the disk state of the category's installed keys that
+        load_category() reads, any change to them changes it
+
+        @param category: string
+        @param nicks: optional list of the keydirs loaded
+        @param keydirs: boolean, the state of the keydirs' gkey.seeds
+            read when the installed keys db is stale, rather than of the db
+        @return tuple, ('db', state) or ('keydirs', state).  The db's state
+            holds all the keydirs' too, a change to a gkey.seeds makes
+            the db stale without changing it.
+        '''
+        catdir = self._catdir(category)
+        try:
+            # the db holds the gkeys of all the keydirs
+            state = self._keydirs_state(catdir, nicks if keydirs else None)
+        except OSError:
+            state = {}
+        state = tuple(sorted(state.items()))
+        if keydirs:
+            return ('keydirs', state)
+        return ('db', (seedfile_state(os.path.join(catdir,
+            installed_db(self.config))), state))
+
+    @staticmethod
+    def _keydirs_state(catdir, nicks=None):
+        '''Returns the seed.keydirs_state() of the nicks' keydirs,
+        of all the catdir's keydirs by default'''
+        if not nicks:
+            return keydirs_state(catdir)
+        return dict((nick, seedfile_state(os.path.join(catdir, nick, 'gkey.seeds')))
+            for nick in nicks)
+
+    def load_installed_db(self, catdir, refresh=False):
+        '''Loads the category's installed keys db in one read
+
+        @param catdir: string, the category's keyring directory
+        @param refresh: boolean, passed through to Seeds.load()
+        @return Seeds class object or None if the db is missing or any
+            keydir's gkey.seeds changed since it was saved
+        '''
+        dbpath = os.path.join(catdir, installed_db(self.config))
+        if not installed_current(dbpath, catdir):
+            self.logger.debug("SeedHandler: load_installed_db; missing or stale db %s"
+                % dbpath)
+            return None
+        seeds = Seeds(config=self.config, _logger=self.logger)
+        if not seeds.load(dbpath, refresh=refresh):
+            return None
+        return seeds
+
+    def save_installed_db(self, catdir, seeds, keydirs=None):
+        '''Saves the seeds as the category's installed keys db
+
+        @param catdir: string, the category's keyring directory
+        @param seeds: Seeds class object of all the category's installed gkeys
+        @param keydirs: optional keydirs_state() of catdir taken before
+            the seeds were read, defaults to the current one
+        @return boolean
+        '''
+        dbpath = os.path.join(catdir, installed_db(self.config))
+        db = Seeds(dbpath, config=self.config, _logger=self.logger)
+        for nick in seeds.seeds:
+            db.add(nick, seeds.seeds[nick])
+        try:
+            if keydirs is None:
+                keydirs = keydirs_state(catdir)
+            if not db.save():
+                return False
+            save_installed_state(dbpath, keydirs)
+        except (IOError, OSError) as error:
+            self.logger.debug("SeedHandler: save_installed_db; failed to save %s: %s"
+                % (dbpath, str(error)))
+            return False
+        self.logger.debug("SeedHandler: save_installed_db; saved %s" % dbpath)
+        return True
+
     def fetch_seeds(self, seeds, args, verified_dl=None):
         '''Fetch new seed files
 
@@ -322,33 +369,27 @@ class SeedHandler(object):
 
     def key_search(self, args, search_args):
         '''Performs a search for all listed args in the seeds'''
-        search_args.sort()
         self.logger.debug("SeedHandler.key_search() search_args: %s" % str(search_args))
         self.logger.debug("SeedHandler.key_search() search_args values: %s" % str(args))
-        results = []
-        found = {}
         if isinstance(args, dict):
             exact = args.get('exact', False)
+            fuzzy = args.get('fuzzy', False)
             _all = args.get('all', False)
         else:
             exact = getattr(args, 'exact', False)
+            fuzzy = getattr(args, 'fuzzy', False)
             _all = getattr(args, 'all', False)
+        searches = []
         for arg in search_args:
             if isinstance(args, dict):
                 value = args.get(arg, '')
             else:
                 value = getattr(args, arg)
-            seeds = self.seeds.field_search(arg, value, exact)
-            for seed in seeds:
-                if seed.nick in found:
-                    found[seed.nick]['args'].append(arg)
-                else:
-                    found[seed.nick] = {'args': [arg], 'seed': seed}
+            searches.append((arg, value))
         if _all:
-            for possible in sorted(found):
-                if search_args == found[possible]['args']:
-                    results.append(found[possible]['seed'])
-        else:
-            for nick in sorted(found):
-                results.append(found[nick]['seed'])
-        return results
+            return self.seeds.search_all(searches, exact, fuzzy)
+        found = {}
+        for arg, value in searches:
+            for seed in self.seeds.search(arg, value, exact, fuzzy):
+                found.setdefault(seed.nick, seed)
+        return [found[nick] for nick in sorted(found)]
@@ -0,0 +1,226 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - seedstore.py
+
+    SQLite storage backend for seed files and installed keys dbs
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import json
+import os
+import re
+import sqlite3
+
+from contextlib import closing
+
+from gkeys.gkey import GKEY
+from gkeys.seed import index_keys, normalize_fpr
+
+
+SCHEMA_VERSION = 1
+
+# index_keys() fields kept in the seed_index table
+STORE_INDEX_FIELDS = ['nick', 'fingerprint', 'keys', 'keyid', 'uid', 'email']
+
+# fields also kept in the seed_index table, lower cased, for the
+# field_search() substring searches
+STORE_TEXT_FIELDS = ['name', 'keydir']
+
+SCHEMA = [
+    '''CREATE TABLE seeds (
+        nick TEXT PRIMARY KEY,
+        data TEXT NOT NULL)''',
+    '''CREATE TABLE seed_index (
+        nick TEXT NOT NULL,
+        field TEXT NOT NULL,
+        value TEXT NOT NULL)''',
+    'CREATE INDEX seed_index_value ON seed_index (field, value)',
+    'CREATE INDEX seed_index_nick ON seed_index (nick)',
+    'PRAGMA user_version = %d' % SCHEMA_VERSION,
+]
+
+# seconds to wait on another process's write lock
+STORE_TIMEOUT = 30
+
+HEX_RE = re.compile('^[0-9A-F]*$')
+
+# sqlite's default limit of host parameters per statement is 999
+QUERY_CHUNK = 500
+
+
+def _chunks(items, size=QUERY_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SqliteSeedStore(object):
+    '''Keeps the seeds in a SQLite database, one row per seed holding the
+    same seed dictionary the json seed files hold, plus a table of the
+    normalized fingerprint, long keyid, uid and email lookup keys.
+
+    Every operation uses its own short lived connection and transaction,
+    so other gkeys processes can read the database between the writes.
+    '''
+
+    # the exceptions of a damaged or unreadable database
+    errors = (sqlite3.Error, ValueError, TypeError)
+
+    def __init__(self, filename, logger):
+        self.filename = filename
+        self.logger = logger
+
+
+    def exists(self):
+        return os.path.isfile(self.filename)
+
+
+    def _connect(self):
+        '''Returns a connection to the database, creating its schema'''
+        conn = sqlite3.connect(self.filename, timeout=STORE_TIMEOUT)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+        elif version != SCHEMA_VERSION:
+            conn.close()
+            raise sqlite3.DatabaseError("Unsupported seed store version %d: %s"
+                % (version, self.filename))
+        return conn
+
+
+    @staticmethod
+    def _gkey(data):
+        return GKEY(**json.loads(data))
+
+
+    def load(self):
+        '''Reads all the seeds
+
+        @returns dictionary of {nick: GKEY}
+        '''
+        with closing(self._connect()) as conn:
+            return dict((nick, self._gkey(data)) for nick, data in
+                conn.execute('SELECT nick, data FROM seeds'))
+
+
+    def get(self, nicks):
+        '''Reads the seeds of the nicks
+
+        @param nicks: iterable of nick strings
+        @returns dictionary of {nick: GKEY} of the nicks found
+        '''
+        seeds = {}
+        with closing(self._connect()) as conn:
+            for chunk in _chunks(nicks):
+                seeds.update((nick, self._gkey(data)) for nick, data in
+                    conn.execute('SELECT nick, data FROM seeds WHERE nick IN (%s)'
+                        % ','.join('?' * len(chunk)), chunk))
+        return seeds
+
+
+    def iter_seeds(self):
+        '''Yields the (nick, seed dictionary) pairs in nick order'''
+        with closing(self._connect()) as conn:
+            for nick, data in conn.execute(
+                    'SELECT nick, data FROM seeds ORDER BY nick'):
+                yield nick, json.loads(data)
+
+
+    def replace(self, seeds):
+        '''Replaces the stored seeds with seeds in one transaction
+
+        @param seeds: dictionary of {nick: GKEY or seed dictionary}
+        '''
+        with closing(self._connect()) as conn:
+            with conn:
+                conn.execute('DELETE FROM seed_index')
+                conn.execute('DELETE FROM seeds')
+                for nick in sorted(seeds):
+                    self._insert(conn, nick, seeds[nick])
+        self.logger.debug("SqliteSeedStore: replace; stored %d seeds in %s"
+            % (len(seeds), self.filename))
+
+
+    def apply(self, records):
+        '''Applies the Seeds change records in one transaction
+
+        @param records: list of {'op': 'add', 'nick': nick, 'seed': dict}
+                        and {'op': 'delete', 'nick': nick} dictionaries
+        '''
+        with closing(self._connect()) as conn:
+            with conn:
+                for record in records:
+                    self._delete(conn, record['nick'])
+                    if record['op'] == 'add':
+                        self._insert(conn, record['nick'], record['seed'])
+        self.logger.debug("SqliteSeedStore: apply; applied %d changes to %s"
+            % (len(records), self.filename))
+
+
+    @staticmethod
+    def _delete(conn, nick):
+        conn.execute('DELETE FROM seed_index WHERE nick = ?', (nick,))
+        conn.execute('DELETE FROM seeds WHERE nick = ?', (nick,))
+
+
+    @staticmethod
+    def _insert(conn, nick, gkey):
+        seed = dict(gkey._asdict()) if isinstance(gkey, GKEY) else gkey
+        conn.execute('INSERT INTO seeds (nick, data) VALUES (?, ?)',
+            (nick, json.dumps(seed, sort_keys=True)))
+        rows = []
+        for field in STORE_INDEX_FIELDS:
+            rows.extend((nick, field, key)
+                for key in set(index_keys(field, seed)))
+        for field in STORE_TEXT_FIELDS:
+            if seed.get(field):
+                rows.append((nick, field, seed[field].lower()))
+        conn.executemany('INSERT INTO seed_index (nick, field, value) '
+            'VALUES (?, ?, ?)', rows)
+
+
+    def lookup(self, field, key):
+        '''Exact lookup of a normalized Seeds.lookup() key
+
+        @param field: string, one of INDEX_FIELDS
+        @param key: string, the normalized key
+        @returns list of nicks
+        '''
+        with closing(self._connect()) as conn:
+            return [row[0] for row in conn.execute('SELECT DISTINCT nick '
+                'FROM seed_index WHERE field = ? AND value = ?', (field, key))]
+
+
+    def candidates(self, field, values):
+        '''Returns the nicks which can possibly match a Seeds.field_search()
+        for any of values, a superset the caller still has to match
+
+        @param field: string, the GKEY field searched
+        @param values: list of strings
+        @returns set of nicks or None if the store can not answer the search
+        '''
+        if field in ['nick', 'uid'] + STORE_TEXT_FIELDS:
+            keys = [x.lower() for x in values]
+        elif field in ['fingerprint', 'keys']:
+            keys = [normalize_fpr(x) for x in values]
+        elif field == 'keyid':
+            # a long keyid is the tail of its fingerprint
+            field = 'fingerprint'
+            keys = [normalize_fpr(x) for x in values]
+            keys = [x[2:] if x.startswith('0X') else x for x in keys]
+            if not all(HEX_RE.match(x) for x in keys):
+                return None
+        else:
+            return None
+        nicks = set()
+        with closing(self._connect()) as conn:
+            for key in keys:
+                nicks.update(row[0] for row in conn.execute('SELECT DISTINCT '
+                    'nick FROM seed_index WHERE field = ? AND instr(value, ?) > 0',
+                    (field, key)))
+        return nicks
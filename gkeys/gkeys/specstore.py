@@ -0,0 +1,115 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - specstore.py
+
+    Persistent per keydir store of spec check results
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import os
+import sys
+
+if sys.version_info[0] >= 3:
+    import pickle
+else:
+    import cPickle as pickle
+
+from gkeys.fileops import atomic_write
+from gkeys.listcache import keyring_identity
+
+
+SPECCHECK_STORE = '.gkeys-speccheck.cache'
+
+# bump whenever the stored results or the spec check rules change
+SPECCHECK_STORE_VERSION = 1
+
+
+class SpecCheckStore(object):
+    '''Store of a keydir's spec check results and the SpecTimes of
+    their date dependent fields
+
+    The stored results are discarded whenever the (mtime, size, inode)
+    of any of the keydir's keyring files changes.
+    '''
+
+    def __init__(self, keydir, logger):
+        self.keydir = keydir
+        self.logger = logger
+        self.filename = os.path.join(keydir, SPECCHECK_STORE)
+        self.identity = keyring_identity(keydir)
+        self.checks = None
+        self.changed = False
+
+
+    def _load(self):
+        self.checks = {}
+        if not self.identity:
+            return
+        try:
+            with open(self.filename, 'rb') as storefile:
+                version, identity, checks = pickle.load(storefile)
+        except (IOError, EOFError, ValueError, TypeError, AttributeError,
+                ImportError, pickle.UnpicklingError) as err:
+            self.logger.debug("SpecCheckStore: load; no usable store %s: %s"
+                % (self.filename, str(err)))
+            return
+        if version == SPECCHECK_STORE_VERSION and identity == self.identity:
+            self.checks = checks
+
+
+    def get(self, keyid, now):
+        '''Returns the stored spec check of keyid, unless any of its keys
+        expired since, which changes their listed validity
+
+        @param keyid: string, the checked keyid
+        @param now: timestamp the results are refreshed for
+        @returns (results, times) tuple or None
+        '''
+        if self.checks is None:
+            self._load()
+        if keyid not in self.checks:
+            return None
+        results, times, checked = self.checks[keyid]
+        for spec_times in times.values():
+            if any(checked < x.expires <= now for x in spec_times):
+                return None
+        return results, times
+
+
+    def put(self, keyid, results, times, checked):
+        '''Stores the spec check of keyid until save()
+
+        @param keyid: string, the checked keyid
+        @param results: dict of {pub keyid: list of SpecCheck}
+        @param times: dict of {pub keyid: list of SpecTimes}
+        @param checked: timestamp of the check
+        '''
+        if not self.identity:
+            return
+        if self.checks is None:
+            self._load()
+        self.checks[keyid] = (results, times, checked)
+        self.changed = True
+
+
+    def save(self):
+        '''Writes the stored spec checks if any were added
+
+        @returns boolean
+        '''
+        if not self.changed:
+            return True
+        try:
+            data = pickle.dumps((SPECCHECK_STORE_VERSION, self.identity,
+                self.checks), 2)
+            atomic_write(self.filename, data, mode='wb')
+        except (IOError, OSError, TypeError, AttributeError,
+                pickle.PicklingError) as err:
+            self.logger.debug("SpecCheckStore: save; failed to save %s: %s"
+                % (self.filename, str(err)))
+            return False
+        self.changed = False
+        return True
@@ -163,6 +163,21 @@ def path(path_elements):
     return pathname
 
 
+def config_flag(config, key):
+    '''Reads a boolean config option, set by a yes/no string or a boolean
+
+    @param config: GKeysConfig instance or None
+    @param key: string, the option name
+    @returns boolean, False without a config
+    '''
+    if config is None:
+        return False
+    value = config.get_key(key)
+    if isinstance(value, str):
+        return value.lower() in ['yes', 'true', 'on', '1']
+    return bool(value)
+
+
 def get_ack(prompt_msg, accepted=Y_N):
     ack = None
     while ack not in accepted:
@@ -0,0 +1,141 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_checks.py
+
+    Checks that the SpecBatch spec checks of many keys pass and fail the
+    same keys as the per key KeyChecks.spec_check()
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import logging
+import random
+import time
+import unittest
+
+from gkeys.keyring import ColonRecord, FprRecord
+from gkeys.listcache import ListingResult
+
+try:
+    from gkeys.checks import KeyChecks, SpecBatch
+except ImportError:
+    # pyGPG is not installed
+    KeyChecks = SpecBatch = None
+
+
+DAY = 86400
+
+PUB_KEYS = [('1', '4096'), ('1', '2048'), ('1', '1024'), ('17', '1024'),
+    ('17', '3072'), ('22', '255'), ('3', '2048')]
+SUB_KEYS = [('1', '4096'), ('1', '1024'), ('16', '2048'), ('18', '255'),
+    ('22', '255')]
+PUB_CAPS = ['scSC', 'scESC', 'escaESCA', 'cESCA', 'sc', 'cSC']
+SUB_CAPS = ['s', 'e', 'a', 'sa', 'es', 'c', 'se', 'ea', 'esa']
+UIDS = ['Larry <larry@gentoo.org>', 'Larry <larry@example.org>',
+    'larry@gentoo.org']
+
+
+def record(name, **values):
+    fields = dict.fromkeys(ColonRecord._fields, '')
+    fields['name'] = name
+    fields.update(values)
+    return ColonRecord(**fields)
+
+
+def fpr_record(fingerprint):
+    fields = dict.fromkeys(FprRecord._fields, '')
+    fields['name'] = 'FPR'
+    fields['fingerprint'] = fingerprint
+    return FprRecord(**fields)
+
+
+class Listings(object):
+    '''Synthetic colon listings of keys, passing and failing each
+    of the spec checks'''
+
+    def __init__(self, seed, now):
+        self.rng = random.Random(seed)
+        self.now = now
+
+
+    def hex(self, length):
+        return ''.join(self.rng.choice('0123456789ABCDEF') for x in range(length))
+
+
+    def expires(self):
+        return self.rng.choice(['', str(self.now - 5 * DAY),
+            str(self.now + 3600), str(self.now + 10 * DAY),
+            str(self.now + 200 * DAY), str(self.now + 900 * DAY),
+            str(self.now + 2000 * DAY)])
+
+
+    def key(self, name, keys, caps, validity, created):
+        fingerprint = self.hex(self.rng.choice([40, 40, 40, 32]))
+        algo, bits = self.rng.choice(keys)
+        records = [record(name, validity=self.rng.choice(validity),
+            keylength=bits, pubkey_algo=algo, long_keyid=fingerprint[-16:],
+            creation_date=self.rng.choice(created), expiredate=self.expires(),
+            key_capabilities=self.rng.choice(caps))]
+        if self.rng.random() < 0.95:
+            records.append(fpr_record(fingerprint))
+        return records
+
+
+    def listing(self):
+        records = []
+        # most listings hold one primary key, some a second one
+        for primary in range(self.rng.choice([1, 1, 1, 2])):
+            records.extend(self.key('PUB', PUB_KEYS, PUB_CAPS, '--rrefiuuuu',
+                [str(self.now - 1000), str(self.now + 100000), '']))
+            for uid in range(self.rng.choice([0, 1, 2, 3])):
+                records.append(record('UID', validity=self.rng.choice('-r'),
+                    user_ID=self.rng.choice(UIDS)))
+            for sub in range(self.rng.choice([0, 1, 2, 3])):
+                records.extend(self.key('SUB', SUB_KEYS, SUB_CAPS, '--reifuuuu',
+                    [str(self.now - 10)]))
+        return ListingResult(records)
+
+
+    def listings(self, count):
+        return [('0x' + self.hex(16), self.listing()) for x in range(count)]
+
+
+@unittest.skipIf(KeyChecks is None, "pyGPG is not installed")
+class TestSpecBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('gkeys.tests')
+        self.listings = Listings(22, int(time.time())).listings(300)
+
+
+    def test_parity(self):
+        for check_id in [True, False]:
+            checks = KeyChecks(self.logger, qualified_id_check=check_id)
+            expected = [checks.spec_check('keydir', keyid, result)
+                for keyid, result in self.listings]
+            batch = SpecBatch(self.logger, check_id)
+            for keyid, result in self.listings:
+                batch.add(keyid, result)
+            found = batch.evaluate()
+            self.assertEqual(len(found), len(expected))
+            for (keyid, result), old, new in zip(self.listings, expected, found):
+                self.assertEqual(new, old, keyid)
+            self.assertEqual(checks.spec_check_batch(self.listings), expected)
+            if check_id:
+                # some keys pass and some fail
+                self.assertEqual(set(x.passed_spec for specs in expected
+                    for key in specs.values() for x in key), set([True, False]))
+
+
+    def test_empty(self):
+        checks = KeyChecks(self.logger)
+        self.assertEqual(checks.spec_check_batch([]), [])
+        result = ListingResult([])
+        self.assertEqual(checks.spec_check_batch([('0x' + '0' * 16, result)]),
+            [checks.spec_check('keydir', '0x' + '0' * 16, result)])
+
+
+if __name__ == '__main__':
+    unittest.main()
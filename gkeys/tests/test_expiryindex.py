@@ -0,0 +1,258 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_expiryindex.py
+
+    Checks the expiry timeline's bisection over the days window, and
+    the expiring action answered from it
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gkeys.gkey import GKEY
+from gkeys.keyring import ColonRecord, FprRecord
+from gkeys.listcache import ListingResult
+from gkeys.seed import Seeds
+
+try:
+    from gkeys.actions import Actions
+    from gkeys.expiryindex import (EXPIRYINDEX_FILE, ExpiryEntry, ExpiryIndex,
+        expiry_entries)
+    from gkeys.seedhandler import SeedHandler
+except ImportError:
+    # pyGPG is not installed
+    ExpiryIndex = None
+
+
+DAY = 86400
+NOW = 1790000000
+CATEGORY = 'gentoo'
+
+
+class Config(object):
+    '''The configuration keys the expiry index and actions use'''
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.defaults = {'gpg_defaults': []}
+
+
+    def get_key(self, key, subkey=None):
+        if key == 'gkeysdir':
+            return self.tmpdir
+        if key == 'keyrings':
+            return os.path.join(self.tmpdir, 'keyrings', subkey)
+        if key == 'permissions':
+            return {'directories': '0o755', 'files': '0o022'}[subkey]
+        if key == 'days_limit':
+            return '30'
+        return None
+
+
+def record(name, long_keyid, expires='', validity='u'):
+    fields = dict.fromkeys(ColonRecord._fields, '')
+    fields.update({'name': name, 'long_keyid': long_keyid,
+        'expiredate': str(expires), 'validity': validity})
+    return ColonRecord(**fields)
+
+
+def fpr_record(fingerprint):
+    fields = dict.fromkeys(FprRecord._fields, '')
+    fields.update({'name': 'FPR', 'fingerprint': fingerprint})
+    return FprRecord(**fields)
+
+
+def listing(keys):
+    '''Returns the colon listing of keys, a list of
+    (name, fingerprint, expires, validity) tuples'''
+    records = []
+    for name, fingerprint, expires, validity in keys:
+        records.append(record(name, fingerprint[-16:], expires, validity))
+        records.append(fpr_record(fingerprint))
+    return ListingResult(records)
+
+
+def fingerprint(number):
+    return '%040X' % (number * 2654435761)
+
+
+@unittest.skipIf(ExpiryIndex is None, "pyGPG is not installed")
+class TestExpiryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.logger = logging.getLogger('gkeys.tests')
+        self.config = Config(self.tmpdir)
+        self.index = ExpiryIndex(self.config, self.logger)
+        self.gkey = GKEY('larry', 'Larry', 'larry', [], [], [])
+
+
+    def entry(self, expires, number):
+        return ExpiryEntry(expires, 'PUB', fingerprint(number), 'dev%d' % number,
+            'dev%d' % number)
+
+
+    def test_entries(self):
+        result = listing([
+            ('PUB', fingerprint(1), NOW + DAY, 'u'),
+            ('SUB', fingerprint(2), NOW + 2 * DAY, 'u'),
+            # never expiring, revoked and invalid keys are left out
+            ('SUB', fingerprint(3), '', 'u'),
+            ('SUB', fingerprint(4), NOW + 3 * DAY, 'r'),
+            ('SUB', fingerprint(5), NOW + 4 * DAY, 'i'),
+            # an expired key is still listed
+            ('SUB', fingerprint(6), NOW - DAY, 'e'),
+            ])
+        self.assertEqual(expiry_entries(self.gkey, [result]), [
+            ExpiryEntry(NOW + DAY, 'PUB', fingerprint(1), 'larry', 'larry'),
+            ExpiryEntry(NOW + 2 * DAY, 'SUB', fingerprint(2), 'larry', 'larry'),
+            ExpiryEntry(NOW - DAY, 'SUB', fingerprint(6), 'larry', 'larry'),
+            ])
+        # a key without its fingerprint record keeps the keyid
+        records = [record('PUB', fingerprint(7)[-16:], NOW + DAY)]
+        self.assertEqual([x.fingerprint for x in expiry_entries(self.gkey,
+            [ListingResult(records)])], ['0x' + fingerprint(7)[-16:]])
+
+
+    def test_window(self):
+        days = 30
+        end = NOW + days * DAY
+        entries = [self.entry(x, i) for i, x in enumerate([
+            NOW - 10 * DAY, NOW - 1, NOW,   # already expired
+            NOW + 1, NOW + DAY, end - 1, end,   # within the window
+            end + 1, end + DAY])]
+        self.index.replace(CATEGORY, reversed(entries))
+        self.assertEqual(self.index.expiring(CATEGORY, days, NOW), entries[3:7])
+        self.assertEqual(self.index.expiring(CATEGORY, 0, NOW), [])
+        self.assertEqual(self.index.expiring(CATEGORY, 1, NOW), entries[3:5])
+        self.assertEqual(self.index.expiring(CATEGORY, 365, NOW), entries[3:])
+        # the window moves with now
+        self.assertEqual(self.index.expiring(CATEGORY, days, end), entries[7:])
+        self.assertEqual(self.index.expiring(CATEGORY, 10, NOW - 20 * DAY),
+            entries[:1])
+        self.assertEqual(self.index.expiring('other', days, NOW), [])
+        # equal expiry dates are all found
+        same = [self.entry(NOW + DAY, i) for i in range(20, 25)]
+        self.index.replace(CATEGORY, entries + same)
+        self.assertEqual(self.index.expiring(CATEGORY, 1, NOW),
+            sorted(entries[3:5] + same))
+
+
+    def test_never_expiring(self):
+        result = listing([('PUB', fingerprint(1), '', 'u'),
+            ('SUB', fingerprint(2), '', 'u')])
+        self.index.replace(CATEGORY, expiry_entries(self.gkey, [result]))
+        self.assertEqual(self.index.timelines[CATEGORY], [])
+        self.assertEqual(self.index.expiring(CATEGORY, 100000, NOW), [])
+
+
+    def test_update(self):
+        result = listing([('PUB', fingerprint(1), NOW + DAY, 'u')])
+        # only a built timeline is updated
+        self.index.update(CATEGORY, self.gkey, [result])
+        self.assertFalse(self.index.has_category(CATEGORY))
+        self.index.replace(CATEGORY, [self.entry(NOW + 2 * DAY, 2),
+            self.entry(NOW + 5 * DAY, 5)])
+        self.index.update(CATEGORY, self.gkey, [result])
+        self.assertEqual([x.nick for x in self.index.expiring(CATEGORY, 3, NOW)],
+            ['larry', 'dev2'])
+        result = listing([('PUB', fingerprint(1), NOW + 4 * DAY, 'u')])
+        self.index.update(CATEGORY, self.gkey, [result])
+        self.assertEqual([x.nick for x in self.index.expiring(CATEGORY, 10, NOW)],
+            ['dev2', 'larry', 'dev5'])
+        self.index.remove(CATEGORY, keydir='dev5')
+        self.index.remove(CATEGORY, nick='larry')
+        self.assertEqual([x.nick for x in self.index.expiring(CATEGORY, 10, NOW)],
+            ['dev2'])
+
+
+    def test_save(self):
+        self.index.replace(CATEGORY, [self.entry(NOW + DAY, 1)])
+        self.assertTrue(self.index.save())
+        index = ExpiryIndex(self.config, self.logger)
+        self.assertTrue(index.has_category(CATEGORY))
+        self.assertEqual(index.expiring(CATEGORY, 2, NOW), [self.entry(NOW + DAY, 1)])
+        for data in ['', '{"version": 0, "timelines": {}}']:
+            with open(os.path.join(self.tmpdir, EXPIRYINDEX_FILE), 'w') as indexfile:
+                indexfile.write(data)
+            index = ExpiryIndex(self.config, self.logger)
+            self.assertFalse(index.load())
+            self.assertFalse(index.has_category(CATEGORY))
+
+
+class FakeGPG(object):
+    '''Lists the keys of the keydirs' listings'''
+
+    def __init__(self, index, listings):
+        self.expiryindex = index
+        self.listings = listings
+        self.listed = []
+
+
+    def list_keys(self, keydir, fingerprints, colons=False):
+        self.listed.append(keydir)
+        return listing(self.listings[keydir])
+
+
+@unittest.skipIf(ExpiryIndex is None, "pyGPG is not installed")
+class TestExpiringAction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.logger = logging.getLogger('gkeys.tests')
+        self.config = Config(self.tmpdir)
+        self.now = int(time.time())
+        hour = 3600
+        keys = {
+            'alice': [('PUB', fingerprint(1), self.now + 10 * DAY, 'u'),
+                ('SUB', fingerprint(2), self.now + 40 * DAY, 'u')],
+            'bob': [('PUB', fingerprint(3), self.now - DAY, 'e')],
+            'carol': [('PUB', fingerprint(4), '', 'u')],
+            'dave': [('PUB', fingerprint(5), self.now + 30 * DAY - hour, 'u'),
+                ('SUB', fingerprint(6), self.now + 30 * DAY + hour, 'u')],
+            }
+        catdir = self.config.get_key('keyrings', CATEGORY)
+        for nick in sorted(keys):
+            fingerprints = [x[1] for x in keys[nick]]
+            seeds = Seeds(os.path.join(catdir, nick, 'gkey.seeds'),
+                self.config, self.logger)
+            seeds.add(nick, GKEY(nick, nick.title(), nick, fingerprints,
+                fingerprints, []))
+            self.assertTrue(seeds.save())
+        self.actions = Actions(self.config, logger=self.logger)
+        self.actions._seedhandler = SeedHandler(self.logger, self.config)
+        self.actions._gpg = FakeGPG(ExpiryIndex(self.config, self.logger), keys)
+
+
+    def expiring(self, within=None):
+        args = argparse.Namespace(category=CATEGORY, within=within)
+        success, messages = self.actions.expiring(args)
+        self.assertTrue(success)
+        return [x.split(':')[0] for x in messages[1]]
+
+
+    def test_expiring(self):
+        self.assertEqual(self.expiring(), ['alice', 'dave'])
+        self.assertEqual(self.actions._gpg.listed, ['alice', 'bob', 'carol', 'dave'])
+        # the next searches are answered from the saved timeline
+        self.assertEqual(self.expiring(31), ['alice', 'dave', 'dave'])
+        self.assertEqual(self.expiring(1), [])
+        self.assertEqual(self.expiring(365), ['alice', 'dave', 'dave', 'alice'])
+        self.actions._gpg.expiryindex = ExpiryIndex(self.config, self.logger)
+        self.assertEqual(self.expiring(11), ['alice'])
+        self.assertEqual(len(self.actions._gpg.listed), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_gkey.py
+
+    Checks the GKEYStore's compact {nick: GKEY} mapping against a dict
+    of the same GKEYs
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import pickle
+import unittest
+
+from gkeys.gkey import GKEY, GKEYStore
+
+
+def make_gkeys():
+    gkeys = []
+    for i in range(50):
+        fingerprint = ['%040X' % (i * 15485863)]
+        keys = fingerprint + ['%040X' % (i * 32452843)] if i % 4 == 0 else fingerprint
+        gkeys.append(GKEY('dev%02d' % i, 'Developer %d' % i,
+            'dev%02d' % i if i % 3 else 'shared', keys, fingerprint,
+            ['Developer %d <dev%02d@gentoo.org>' % (i, i)]))
+    gkeys.extend([
+        # fingerprints the columns can not pack, kept as they are
+        GKEY('mixed', 'Mixed Case', 'mixed', ['abcdEF' + '0' * 34],
+            ['abcdEF' + '0' * 34], []),
+        GKEY('prefixed', 'Prefixed', 'prefixed', ['0x' + 'A' * 40],
+            ['0x' + 'A' * 40, 'B' * 40], ['Prefixed <prefixed@gentoo.org>']),
+        GKEY('spaced', 'Spaced', 'spaced', ['ABCD ' * 10], ['ABCD ' * 10], []),
+        GKEY('short', 'Short', 'short', ['0xDEADBEEF'], ['DEADBEEF'], []),
+        GKEY(u'\xfcnicode', u'\xdcnicode N\xe4me \u0141', u'\xfcnicode',
+            [], [], [u'\xdcnicode <\xfc@gentoo.org>', '']),
+        # fields the columns can not hold at all
+        GKEY('nameless', None, 'nameless', ['C' * 40], ['C' * 40], []),
+        GKEY('tupled', 'Tupled', 'tupled', ('D' * 40,), ('D' * 40,), ()),
+        ])
+    return gkeys
+
+
+class TestGKEYStore(unittest.TestCase):
+
+    def setUp(self):
+        self.gkeys = make_gkeys()
+        self.expected = dict((x.nick, x) for x in self.gkeys)
+        self.store = GKEYStore((x.nick, x) for x in self.gkeys)
+
+
+    def assertSame(self, store, expected):
+        self.assertEqual(len(store), len(expected))
+        self.assertEqual(list(store), list(expected))
+        self.assertEqual(list(store.items()), list(expected.items()))
+        self.assertEqual(dict(store), expected)
+        for nick in expected:
+            self.assertTrue(nick in store)
+            self.assertEqual(store[nick], expected[nick])
+            self.assertEqual(store[nick].keyid, expected[nick].keyid)
+            self.assertEqual(store.get(nick), expected[nick])
+        self.assertFalse('nobody' in store)
+        self.assertRaises(KeyError, store.__getitem__, 'nobody')
+        self.assertEqual(store.get('nobody'), None)
+
+
+    def test_get(self):
+        self.assertSame(self.store, self.expected)
+        self.assertSame(GKEYStore(self.expected), self.expected)
+        for nick in ['mixed', 'prefixed', 'spaced', 'short']:
+            self.assertEqual(self.store[nick].fingerprint,
+                self.expected[nick].fingerprint)
+        self.assertEqual(self.store['prefixed'].keyid,
+            ['0x' + 'A' * 16, '0x' + 'B' * 16])
+
+
+    def test_set(self):
+        replaced = self.expected['dev07']._replace(name='Renamed',
+            fingerprint=['0x' + 'e' * 40], uid=[])
+        for mapping in [self.store, self.expected]:
+            mapping['dev07'] = replaced
+            mapping['mixed'] = self.expected['dev08']._replace(nick='mixed')
+            mapping['new'] = GKEY('new', 'New', 'new', ['F' * 40], ['F' * 40], [])
+        self.assertSame(self.store, self.expected)
+        self.store['dict'] = {'nick': 'dict', 'name': 'Dict', 'keydir': 'dict',
+            'keys': [], 'fingerprint': [], 'uid': []}
+        self.assertEqual(self.store['dict'],
+            GKEY('dict', 'Dict', 'dict', [], [], []))
+
+
+    def test_delete(self):
+        for nick in ['dev00', 'mixed', 'tupled', 'dev49']:
+            del self.store[nick]
+            del self.expected[nick]
+        self.assertSame(self.store, self.expected)
+        self.assertRaises(KeyError, self.store.__delitem__, 'dev00')
+        self.assertEqual(self.store.pop('prefixed'), self.expected.pop('prefixed'))
+        self.assertSame(self.store, self.expected)
+
+
+    def test_repack(self):
+        gkey = self.expected['dev01']
+        for i in range(3000):
+            gkey = gkey._replace(name='Developer %d' % i)
+            self.store['dev01'] = gkey
+            self.expected['dev01'] = gkey
+        # the replaced rows' space was reclaimed
+        self.assertTrue(len(self.store._keydirs) < 1100)
+        self.assertSame(self.store, self.expected)
+        for nick in list(self.expected)[:40]:
+            del self.store[nick]
+            del self.expected[nick]
+        self.assertSame(self.store, self.expected)
+
+
+    def test_pickle(self):
+        store = pickle.loads(pickle.dumps(self.store, 2))
+        self.assertTrue(isinstance(store, GKEYStore))
+        self.assertSame(store, self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
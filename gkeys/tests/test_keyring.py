@@ -0,0 +1,172 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_keyring.py
+
+    Parity checks of the keyring reader against gpg's colon listing of
+    the fixture keyrings
+
+    The fixture keyrings hold the same RSA, DSA/ElGamal, EdDSA/cv25519
+    and nistp256 keys, with revoked, expired and unexpired keys, subkeys
+    and user ids.  listing.colons is gpg 2.2's
+
+        gpg --trust-model always -k --with-colons --fingerprint
+
+    output for them, listed at LISTED_AT.
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from gkeys.exception import KeyringError
+from gkeys.keyring import (COLON_FIELDS, ColonRecord, FprRecord,
+    KeyringReader, colon_line)
+from gkeys.listcache import ListingResult
+
+try:
+    from gkeys.checks import KeyChecks
+except ImportError:
+    # pyGPG is not installed
+    KeyChecks = None
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keyrings')
+KEYDIRS = ['kbx', 'legacy']
+LISTING = os.path.join(FIXTURES, 'listing.colons')
+LISTED_AT = 1792301925
+
+GPG = getattr(shutil, 'which', lambda x: None)('gpg')
+
+RECORD_NAMES = ['pub', 'sub', 'uid', 'fpr']
+
+
+def fields(line):
+    '''Returns the fields of a colon line the reader lists'''
+    values = line.split(':')
+    return (values + [''] * len(COLON_FIELDS))[:len(COLON_FIELDS)]
+
+
+def recorded_lines():
+    with open(LISTING, 'r') as listing:
+        return [x for x in listing.read().splitlines()
+            if x.split(':')[0] in RECORD_NAMES]
+
+
+def recorded_result():
+    '''Returns the recorded listing as a gpg result'''
+    records = []
+    for line in recorded_lines():
+        values = fields(line)
+        values[0] = values[0].upper()
+        if values[0] == 'FPR':
+            records.append(FprRecord(*values))
+        else:
+            records.append(ColonRecord(*(values + [''])))
+    return ListingResult(records)
+
+
+def primary_keyids(lines):
+    return [fields(x)[4] for x in lines if x.startswith('pub:')]
+
+
+class TestKeyringReader(unittest.TestCase):
+
+    def reader(self, name, now=LISTED_AT):
+        return KeyringReader(os.path.join(FIXTURES, name), 'always', now)
+
+
+    def test_recorded_listing(self):
+        expected = [fields(x) for x in recorded_lines()]
+        for name in KEYDIRS:
+            result = self.reader(name).listing()
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual([fields(colon_line(x)) for x in result.status.data],
+                expected, name)
+
+
+    def test_targets(self):
+        lines = recorded_lines()
+        keyids = primary_keyids(lines)
+        fingerprints = [fields(x)[9] for x in lines if x.startswith('fpr:')]
+        for name in KEYDIRS:
+            reader = self.reader(name)
+            # a subkey's fingerprint lists its primary key
+            result = reader.listing(fingerprints[1])
+            self.assertEqual(result.status.data[0].long_keyid, keyids[0])
+            result = reader.listing(['0x' + keyids[2], keyids[1]])
+            self.assertEqual([x.long_keyid for x in result.status.data
+                if x.name == 'PUB'], keyids[1:3])
+            result = reader.listing('0' * 40)
+            self.assertEqual((result.returncode, result.status.data), (2, []))
+            self.assertRaises(KeyringError, reader.listing, 'alice@gentoo.org')
+
+
+    def test_damaged_keyring(self):
+        keydir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, keydir)
+        keyring = os.path.join(keydir, 'pubring.gpg')
+        # a public key packet truncated in its curve OID
+        with open(keyring, 'wb') as ringfile:
+            ringfile.write(bytearray([0x98, 0x06, 0x04, 0, 0, 0, 0x01, 0x16]))
+        self.assertRaises(KeyringError, KeyringReader(keydir).listing)
+        with open(os.path.join(FIXTURES, 'legacy', 'pubring.gpg'), 'rb') as ringfile:
+            data = ringfile.read()
+        for size in range(1, len(data), 97):
+            with open(keyring, 'wb') as ringfile:
+                ringfile.write(data[:size])
+            try:
+                KeyringReader(keydir, 'always').listing()
+            except KeyringError:
+                pass
+
+
+    @unittest.skipIf(KeyChecks is None, "pyGPG is not installed")
+    def test_consumers(self):
+        '''The key checks give the same results for the reader's records
+        as for the gpg listing's'''
+        logger = logging.getLogger('gkeys.tests')
+        checks = KeyChecks(logger)
+        expected = recorded_result()
+        for name in KEYDIRS:
+            result = self.reader(name).listing()
+            for keyid in primary_keyids(recorded_lines()):
+                keyid = '0x' + keyid
+                self.assertEqual(checks.validity_checks(name, keyid, result),
+                    checks.validity_checks(name, keyid, expected))
+                self.assertEqual(checks.spec_check(name, keyid, result),
+                    checks.spec_check(name, keyid, expected))
+            self.assertEqual(
+                checks.spec_check_batch([('0x' + x.long_keyid, result)
+                    for x in result.status.data if x.name == 'PUB']),
+                checks.spec_check_batch([('0x' + x.long_keyid, expected)
+                    for x in expected.status.data if x.name == 'PUB']))
+
+
+    @unittest.skipIf(GPG is None, "gpg is not installed")
+    def test_gpg(self):
+        '''The reader lists the fixture keyrings as the installed gpg does'''
+        for name in KEYDIRS:
+            homedir = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, homedir)
+            for filename in os.listdir(os.path.join(FIXTURES, name)):
+                shutil.copy(os.path.join(FIXTURES, name, filename), homedir)
+            gpg = subprocess.Popen([GPG, '--homedir', homedir,
+                '--trust-model', 'always', '--no-auto-check-trustdb',
+                '--batch', '-k', '--with-colons', '--fingerprint'],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output = gpg.communicate()[0].decode('utf_8')
+            result = KeyringReader(homedir, 'always').listing()
+            self.assertEqual([fields(colon_line(x)) for x in result.status.data],
+                [fields(x) for x in output.splitlines()
+                    if x.split(':')[0] in RECORD_NAMES], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
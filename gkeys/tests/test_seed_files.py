@@ -0,0 +1,252 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_seed_files.py
+
+    Checks the seed file's on disk companions: the pickled seed cache
+    and the change journal, and the sqlite seed store
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from gkeys.gkey import GKEY
+from gkeys.seed import SEED_CACHE, SEED_CACHE_MIN_SIZE, SEED_JOURNAL, Seeds
+
+
+class Config(object):
+    '''The configuration keys the Seeds use'''
+
+    def __init__(self, **options):
+        self.options = options
+
+
+    def get_key(self, key, subkey=None):
+        if key == 'permissions':
+            return {'directories': '0o755', 'files': '0o022'}[subkey]
+        return self.options.get(key)
+
+
+def make_seeds(count):
+    return dict(('dev%03d' % i, GKEY('dev%03d' % i, 'Developer %d' % i,
+        'keydir%d' % (i % 3), ['%040X' % (i * 7919)], ['%040X' % (i * 7919)],
+        ['Developer %d <dev%03d@gentoo.org>' % (i, i)])) for i in range(count))
+
+
+class SeedFileTest(unittest.TestCase):
+
+    options = {}
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, 'gkey.seeds')
+        self.config = Config(**self.options)
+        self.logger = logging.getLogger('gkeys.tests')
+
+
+    def seeds(self, filename=None):
+        '''Returns the Seeds of the seed file, not loaded'''
+        return Seeds(filename or self.filename, self.config, self.logger)
+
+
+    def loaded(self, filename=None):
+        seeds = self.seeds(filename)
+        self.assertTrue(seeds.load())
+        return seeds
+
+
+    def write(self, gkeys, filename=None):
+        seeds = self.seeds(filename)
+        for nick in sorted(gkeys):
+            seeds.add(nick, gkeys[nick])
+        self.assertTrue(seeds.save())
+        return seeds
+
+
+class TestSeedCache(SeedFileTest):
+
+    def setUp(self):
+        super(TestSeedCache, self).setUp()
+        self.gkeys = make_seeds(200)
+        self.write(self.gkeys)
+        self.assertTrue(os.path.getsize(self.filename) >= SEED_CACHE_MIN_SIZE)
+        self.cachepath = self.filename + SEED_CACHE
+        # the first load saves the cache
+        self.assertEqual(self.loaded().seeds, self.gkeys)
+        self.assertTrue(os.path.exists(self.cachepath))
+
+
+    def cached(self):
+        '''Returns the cache's seed file size, mtime and digest'''
+        with open(self.cachepath, 'rb') as cachefile:
+            return pickle.load(cachefile)[2:5]
+
+
+    def edit(self, old, new):
+        with open(self.filename, 'r') as seedfile:
+            text = seedfile.read()
+        with open(self.filename, 'w') as seedfile:
+            seedfile.write(text.replace(old, new))
+
+
+    def test_cache(self):
+        seeds = self.seeds()
+        self.assertTrue(seeds._load_cache(False))
+        self.assertEqual(seeds.seeds, self.gkeys)
+
+
+    def test_stale(self):
+        mtime = os.path.getmtime(self.filename)
+        # the same size and mtime, only the digest can tell
+        self.edit('Developer 17 <', 'Developer 71 <')
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertFalse(self.seeds()._load_cache(False))
+        seeds = self.loaded()
+        self.assertEqual(seeds.seeds['dev017'].uid, ['Developer 71 <dev017@gentoo.org>'])
+        self.assertEqual(self.cached()[1], mtime + 10)
+        # a different size
+        self.edit('Developer 17"', 'Developer Seventeen"')
+        self.assertFalse(self.seeds()._load_cache(False))
+        self.assertEqual(self.loaded().seeds['dev017'].name, 'Developer Seventeen')
+
+
+    def test_restamp(self):
+        size, mtime, digest = self.cached()
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        seeds = self.seeds()
+        self.assertTrue(seeds._load_cache(False))
+        self.assertEqual(seeds.seeds, self.gkeys)
+        # the next load can trust the mtime again
+        self.assertEqual(self.cached(), (size, mtime + 10, digest))
+
+
+    def test_corrupt(self):
+        for data in [b'', b'not a pickle', pickle.dumps(('old', 'cache'), 2)]:
+            with open(self.cachepath, 'wb') as cachefile:
+                cachefile.write(data)
+            self.assertFalse(self.seeds()._load_cache(False))
+            # the seeds are read from the json seed file, and cached again
+            self.assertEqual(self.loaded().seeds, self.gkeys)
+            self.assertTrue(self.seeds()._load_cache(False))
+
+
+class TestSeedJournal(SeedFileTest):
+
+    options = {'seed_journal': 'yes'}
+
+    def setUp(self):
+        super(TestSeedJournal, self).setUp()
+        self.gkeys = make_seeds(20)
+        self.write(self.gkeys)
+        self.journal = self.filename + SEED_JOURNAL
+        with open(self.filename, 'r') as seedfile:
+            self.text = seedfile.read()
+
+
+    def change(self):
+        '''Adds, deletes and updates seeds, returns the seeds expected'''
+        seeds = self.loaded()
+        expected = dict(self.gkeys)
+        new = GKEY('newdev', 'New Developer', 'keydir0', ['F' * 40],
+            ['F' * 40], ['New Developer <newdev@gentoo.org>'])
+        self.assertTrue(seeds.add(new.nick, new))
+        expected[new.nick] = new
+        self.assertTrue(seeds.delete({'nick': 'dev003'}))
+        del expected['dev003']
+        updated = expected['dev005']._replace(name='Renamed Developer')
+        seeds.update(updated)
+        expected['dev005'] = updated
+        self.assertTrue(seeds.save())
+        return expected
+
+
+    def test_reload(self):
+        expected = self.change()
+        self.assertTrue(os.path.exists(self.journal))
+        # the changes went to the journal, the seed file is untouched
+        with open(self.filename, 'r') as seedfile:
+            self.assertEqual(seedfile.read(), self.text)
+        self.assertEqual(self.loaded().seeds, expected)
+        self.assertEqual(dict((x.nick, x) for x in self.seeds().stream()),
+            expected)
+        # more changes append to the journal
+        seeds = self.loaded()
+        seeds.delete({'nick': 'newdev'})
+        del expected['newdev']
+        self.assertTrue(seeds.save())
+        self.assertEqual(self.loaded().seeds, expected)
+
+
+    def test_truncated(self):
+        expected = self.change()
+        with open(self.journal, 'r') as journal:
+            lines = journal.read().splitlines(True)
+        # an append interrupted in its last record, the update
+        with open(self.journal, 'w') as journal:
+            journal.write(''.join(lines[:-1]) + lines[-1][:len(lines[-1]) // 2])
+        expected['dev005'] = self.gkeys['dev005']
+        seeds = self.loaded()
+        self.assertEqual(seeds.seeds, expected)
+        # the next append starts on a new line
+        seeds.delete({'nick': 'dev007'})
+        del expected['dev007']
+        self.assertTrue(seeds.save())
+        self.assertEqual(self.loaded().seeds, expected)
+
+
+    def test_compact(self):
+        expected = self.change()
+        seeds = self.loaded()
+        self.assertTrue(seeds.compact())
+        self.assertFalse(os.path.exists(self.journal))
+        with open(self.filename, 'r') as seedfile:
+            data = json.load(seedfile)
+        self.assertEqual(data, dict((nick, dict(gkey._asdict()))
+            for nick, gkey in expected.items()))
+        self.assertEqual(self.loaded().seeds, expected)
+
+
+class TestSeedStore(SeedFileTest):
+
+    def test_round_trip(self):
+        gkeys = make_seeds(30)
+        gkeys.update((x.nick, x) for x in [
+            # every field, unicode, several and no values
+            GKEY(u'd\xe9v', u'D\xe9veloppeur \u0141ukasz', u'k\xe9ydir',
+                ['A' * 40, 'B' * 40, 'C' * 40], ['B' * 40, 'a' * 40],
+                [u'D\xe9veloppeur <d\xe9v@gentoo.org>', 'alias <alias@gentoo.org>']),
+            GKEY('empty', '', 'empty', [], [], []),
+            GKEY('spaced', 'Spaced Key', 'spaced', ['1234 ' * 10], ['1234 ' * 10],
+                ['"quoted" <spaced@gentoo.org>']),
+            ])
+        self.write(gkeys)
+        with open(self.filename, 'r') as seedfile:
+            text = seedfile.read()
+        dbpath = os.path.join(self.tmpdir, 'installed.db')
+        seeds = self.loaded()
+        self.assertTrue(seeds.save(dbpath))
+        store = self.loaded(dbpath)
+        self.assertEqual(store.lookup('nick', u'D\xc9V'), [gkeys[u'd\xe9v']])
+        self.assertEqual(sorted(store.stream()), sorted(gkeys.values()))
+        self.assertEqual(store.seeds, gkeys)
+        for nick, gkey in store.seeds.items():
+            for field in GKEY._fields:
+                self.assertEqual(type(getattr(gkey, field)),
+                    type(getattr(gkeys[nick], field)), (nick, field))
+        filename = os.path.join(self.tmpdir, 'round.seeds')
+        self.assertTrue(store.save(filename))
+        with open(filename, 'r') as seedfile:
+            self.assertEqual(seedfile.read(), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_seed_search.py
+
+    Checks the Seeds searches, answered from the query planner and the
+    lookup, trigram and regex indexes, against a linear scan of the seeds
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import logging
+import random
+import re
+import unittest
+
+from gkeys.gkey import GKEY
+from gkeys.seed import (PLAN_INDEX, PLAN_SCAN, PLAN_SUBSTRING,
+    TRIGRAM_BUILD_SCANS, Seeds, search_text, substring_distance)
+
+
+FIRST = ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Mallory', 'Trent', 'Zoe']
+LAST = ['Smith', 'Smythe', 'Jones', 'Johnson', 'Brown', 'Browning', 'Ng']
+
+# the index paths are only taken once the searches have built the indexes
+REPEATS = TRIGRAM_BUILD_SCANS + 1
+
+
+def make_seeds(count=300):
+    '''Returns the synthetic GKEYs, in the (unsorted) order they are added'''
+    rng = random.Random(7)
+    gkeys = []
+    for i in range(count):
+        nick = 'dev%03d' % rng.randrange(1000)
+        while nick in [x.nick for x in gkeys]:
+            nick = 'dev%03d' % rng.randrange(1000)
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        fingerprint = ['%040X' % rng.getrandbits(160)]
+        if i % 5 == 0:
+            fingerprint.append('%040X' % rng.getrandbits(160))
+        keys = fingerprint[:]
+        if i % 7 == 0:
+            keys.append('%040X' % rng.getrandbits(160))
+        if i % 11 == 0:
+            # fingerprints stored as they were entered
+            fingerprint = [x.lower() for x in fingerprint]
+        uid = ['%s %s <%s@gentoo.org>' % (first, last, nick)]
+        if i % 3 == 0:
+            uid.append('%s %s <%s.%s@example.com>'
+                % (first, last, first.lower(), last.lower()))
+        gkeys.append(GKEY(nick, '%s %s' % (first, last), 'keydir%d' % (i % 4),
+            keys, fingerprint, uid))
+    return gkeys
+
+
+def scan_list(seeds, **kwargs):
+    '''The linear scan Seeds.list() replaced'''
+    result = seeds
+    for key in kwargs:
+        if not kwargs[key]:
+            continue
+        if key in ['fingerprint', 'keys', 'keyid']:
+            kwargs[key] = [x.replace(' ', '').upper() for x in kwargs[key]]
+        if key in ['fingerprint', 'keys', 'uid']:
+            result = [x for x in result if kwargs[key][0] in getattr(x, key)]
+        elif key in ['keyid']:
+            searchids = [x.lstrip('0X') for x in kwargs[key]]
+            result = [x for x in result
+                if set(searchids).intersection(y.lstrip('0x') for y in x.keyid)]
+        else:
+            result = [x for x in result
+                if kwargs[key].lower() in getattr(x, key).lower()]
+    return sorted(result)
+
+
+def scan_field(seeds, field, value, exact=False):
+    '''The linear scan Seeds.field_search() replaced, in seed order'''
+    finds = value if isinstance(value, list) else [value]
+    results = []
+    for seed in seeds:
+        vals = getattr(seed, field)
+        vals = vals if isinstance(vals, list) else [vals]
+        for find in finds:
+            if exact:
+                if any(find in x for x in vals):
+                    break
+            elif any(find.lower() in x.lower() for x in vals):
+                break
+        else:
+            continue
+        results.append(seed)
+    return results
+
+
+class TestSeedSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.gkeys = make_seeds()
+        self.seeds = Seeds(config=None, _logger=logging.getLogger('gkeys.tests'))
+        for gkey in self.gkeys:
+            self.seeds.add(gkey.nick, gkey)
+
+
+    def repeat(self, search, expected, *args, **kwargs):
+        '''Runs the search until it is answered from the indexes,
+        each result must be the expected one'''
+        for i in range(REPEATS):
+            self.assertEqual(search(*args, **kwargs), expected,
+                '%s %r %r, run %d' % (search.__name__, args, kwargs, i))
+
+
+    def test_list(self):
+        gkey = self.gkeys[10]
+        queries = [
+            {'fingerprint': [gkey.fingerprint[0]]},
+            {'fingerprint': [' '.join(self.gkeys[1].fingerprint[0][i:i + 4]
+                for i in range(0, 40, 4)).lower()]},
+            {'keys': [self.gkeys[14].keys[-1]]},
+            {'keyid': [self.gkeys[1].keyid[0]]},
+            {'keyid': [self.gkeys[2].keyid[0][2:].lower(), '0x' + '0' * 16]},
+            {'uid': [self.gkeys[3].uid[-1]]},
+            {'name': 'SMITH'},
+            {'name': 'alice s'},
+            {'name': 'smith', 'keyid': [x.keyid[0] for x in self.gkeys[:40]]},
+            {'name': 'Bob', 'keydir': 'keydir1'},
+            {'uid': ['nobody@gentoo.org']},
+            ]
+        for query in queries:
+            expected = scan_list(self.gkeys, **dict(query))
+            self.repeat(self.seeds.list, expected, **query)
+        self.assertTrue(scan_list(self.gkeys, name='SMITH'))
+        self.assertEqual(self.seeds.list(nick='*'), sorted(self.gkeys))
+
+
+    def test_field_search(self):
+        gkey = self.gkeys[20]
+        queries = [
+            ('name', 'SMITH', False),
+            ('name', 'Smith', True),
+            ('name', 'smith', True),
+            ('name', 'ow', False),
+            ('uid', 'ALICE', False),
+            ('uid', ['@example.com', 'zoe'], False),
+            ('uid', 'nobody', False),
+            ('fingerprint', gkey.fingerprint[0], False),
+            ('fingerprint', gkey.fingerprint[0].lower(), False),
+            ('fingerprint', gkey.fingerprint[0][-16:], False),
+            ('keys', [x.keys[-1] for x in self.gkeys[:30]], False),
+            ('keyid', gkey.keyid[0], False),
+            ('keyid', self.gkeys[21].keyid[0].upper(), False),
+            ('keydir', 'keydir2', True),
+            ]
+        for field, value, exact in queries:
+            expected = scan_field(self.gkeys, field, value, exact)
+            self.repeat(self.seeds.field_search, expected, field, value, exact)
+            self.repeat(self.seeds.search, expected, field, value, exact)
+        self.assertEqual(self.seeds.search('nick', gkey.nick, True), [gkey])
+        self.assertEqual(self.seeds.field_search('nick', 'nobody', True), [])
+
+
+    def test_changed_seeds(self):
+        '''The results keep the seeds' order after adds and deletes'''
+        expected = scan_field(self.gkeys, 'name', 'smith')
+        self.repeat(self.seeds.field_search, expected, 'name', 'smith')
+        gkey = GKEY('zz-new', 'Ann Smith', 'keydir0', [], [], ['ann@gentoo.org'])
+        moved = [x for x in self.gkeys if x.name.endswith('Smith')][0]
+        self.seeds.delete(moved)
+        self.seeds.add(gkey.nick, gkey)
+        self.seeds.add(moved.nick, moved)
+        self.gkeys.remove(moved)
+        self.gkeys.extend([gkey, moved])
+        expected = scan_field(self.gkeys, 'name', 'smith')
+        self.assertEqual(expected[-2:], [gkey, moved])
+        self.repeat(self.seeds.field_search, expected, 'name', 'smith')
+
+
+    def test_regex_search(self):
+        for pattern in ['smith', '^alice', r'\.com$', 'Sm[iy]th', 'dev0[0-4]',
+                'jones\n', r'\Adev1', 'xyz']:
+            regex = re.compile(pattern, re.M | re.I)
+            expected = sorted(x for x in self.gkeys if regex.search(search_text(x)))
+            self.repeat(self.seeds.search, expected, 'regex', pattern)
+        self.assertEqual(self.seeds.regex_search('('), [])
+        self.assertEqual(len(self.seeds.regex_search('a*')), len(self.gkeys))
+
+
+    def test_regex_search_empty(self):
+        seeds = Seeds(config=None, _logger=logging.getLogger('gkeys.tests'))
+        for pattern in ['', 'a*', '^', 'smith']:
+            self.assertEqual(seeds.regex_search(pattern), [])
+
+
+    def test_fuzzy_search(self):
+        for field, value in [('name', 'Smiht'), ('name', 'johnsen'),
+                ('uid', 'mallory jones'), ('name', 'Zoe')]:
+            find = value.lower()
+            distance = len(find) // 4
+            found = []
+            for gkey in self.gkeys:
+                values = getattr(gkey, field)
+                values = values if isinstance(values, list) else [values]
+                best = min(substring_distance(find, x.lower()) for x in values)
+                if best <= distance:
+                    found.append((best, gkey))
+            expected = [x[1] for x in sorted(found)]
+            self.repeat(self.seeds.fuzzy_search, expected, field, value)
+            self.assertEqual(sorted(self.seeds.search(field, value, fuzzy=True)),
+                sorted(expected))
+
+
+    def test_search_all(self):
+        gkey = self.gkeys[30]
+        queries = [
+            [('name', 'smith'), ('uid', 'example')],
+            [('name', 'bob'), ('keyid', [x.keyid[0] for x in self.gkeys[:60]])],
+            [('fingerprint', gkey.fingerprint[0]), ('name', gkey.name[:4])],
+            [('uid', 'gentoo.org'), ('regex', '^carol'), ('keydir', 'keydir3')],
+            [('name', 'nobody'), ('uid', 'gentoo')],
+            ]
+        for searches in queries:
+            found = self.gkeys
+            for field, value in searches:
+                if field == 'regex':
+                    regex = re.compile(value, re.M)
+                    matches = [x for x in self.gkeys if regex.search(search_text(x))]
+                else:
+                    matches = scan_field(self.gkeys, field, value)
+                found = [x for x in found if x in matches]
+            self.repeat(self.seeds.search_all, sorted(found), searches)
+        self.assertEqual(self.seeds.search_all([('name', 'smith'), ('regex', '(')]),
+            [])
+
+
+    def test_plan(self):
+        predicates = [
+            ((PLAN_SCAN, 0), 'regex', 'a'),
+            ((PLAN_SUBSTRING, -3), 'name', 'bob'),
+            ((PLAN_INDEX, 1), 'keyid', 'k'),
+            ((PLAN_SUBSTRING, -5), 'name', 'smith'),
+            ]
+        candidates = {'keyid': set('abcdefghijk'), 'name': set('abcxyz')}
+        asked = []
+
+        def find(field, value):
+            asked.append(value)
+            return candidates.get(field) if field != 'regex' else None
+
+        nicks, ordered = self.seeds._plan(predicates, find)
+        self.assertEqual([x[2] for x in ordered], ['k', 'smith', 'bob', 'a'])
+        self.assertEqual(nicks, set('abc'))
+        # the intersection stops once the candidates are few
+        self.assertEqual(asked, ['k', 'smith'])
+        nicks, ordered = self.seeds._plan(predicates)
+        self.assertEqual(nicks, None)
+        self.assertEqual(len(ordered), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
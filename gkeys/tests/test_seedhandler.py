@@ -0,0 +1,224 @@
+#
+#-*- coding:utf-8 -*-
+
+"""
+    Gentoo-keys - test_seedhandler.py
+
+    Checks the category's installed keys db load_category() reads, and
+    the KeyHandler's search results cached against it
+
+    @license: GNU GPL2, see COPYING for details.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from gkeys.gkey import GKEY
+from gkeys.keyhandler import KEY_OPTIONS, KeyHandler
+from gkeys.seed import (INSTALLED_DB, INSTALLED_SQLITE_DB, INSTALLED_STATE,
+    Seeds, installed_current, keydirs_state)
+from gkeys.seedhandler import SeedHandler
+
+
+CATEGORY = 'gentoo'
+
+
+class Config(object):
+    '''The configuration keys the SeedHandler uses'''
+
+    def __init__(self, keyrings, **options):
+        self.keyrings = keyrings
+        self.options = options
+
+
+    def get_key(self, key, subkey=None):
+        if key == 'keyrings':
+            return os.path.join(self.keyrings, subkey)
+        if key == 'permissions':
+            return {'directories': '0o755', 'files': '0o022'}[subkey]
+        return self.options.get(key)
+
+
+def make_gkey(nick, number):
+    fingerprint = ['%040X' % (number * 104729)]
+    return GKEY(nick, 'Developer %d' % number, nick, fingerprint, fingerprint,
+        ['Developer %d <%s@gentoo.org>' % (number, nick)])
+
+
+class InstalledDbTest(unittest.TestCase):
+
+    options = {}
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.config = Config(self.tmpdir, **self.options)
+        self.logger = logging.getLogger('gkeys.tests')
+        self.catdir = self.config.get_key('keyrings', CATEGORY)
+        self.gkeys = {}
+        for number, nick in enumerate(['alice', 'bob', 'carol']):
+            self.install(make_gkey(nick, number))
+
+
+    def install(self, gkey):
+        '''Installs a gkey in its keydir's gkey.seeds'''
+        seeds = Seeds(os.path.join(self.catdir, gkey.keydir, 'gkey.seeds'),
+            self.config, self.logger)
+        seeds.add(gkey.nick, gkey)
+        self.assertTrue(seeds.save())
+        self.gkeys[gkey.nick] = gkey
+
+
+    def load(self):
+        '''Returns the loaded seeds and the kind of state they came from'''
+        handler = SeedHandler(self.logger, self.config)
+        seeds = handler.load_category(CATEGORY)
+        return seeds.seeds, handler.loaded_state[0]
+
+
+class TestInstalledDbState(InstalledDbTest):
+    '''The db is rebuilt from the keydirs' gkey.seeds after any change
+    to them, by the INSTALLED_STATE record saved with it'''
+
+    def setUp(self):
+        super(TestInstalledDbState, self).setUp()
+        self.dbpath = os.path.join(self.catdir, INSTALLED_DB)
+        self.handler = SeedHandler(self.logger, self.config)
+        self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+        self.assertTrue(os.path.exists(self.dbpath + INSTALLED_STATE))
+        self.assertEqual(self.load(), (self.gkeys, 'db'))
+
+
+    def assertRebuilt(self, state):
+        '''The change is seen, the db is rebuilt on the next load
+        and current again'''
+        self.assertNotEqual(self.handler.category_state(CATEGORY), state)
+        self.assertFalse(installed_current(self.dbpath, self.catdir))
+        self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+        self.assertTrue(installed_current(self.dbpath, self.catdir))
+        self.assertEqual(self.load(), (self.gkeys, 'db'))
+        db = Seeds(self.dbpath, self.config, self.logger)
+        self.assertTrue(db.load())
+        self.assertEqual(db.seeds, self.gkeys)
+
+
+    def test_new_keydir(self):
+        state = self.handler.category_state(CATEGORY)
+        self.install(make_gkey('dave', 3))
+        self.assertRebuilt(state)
+
+
+    def test_removed_keydir(self):
+        state = self.handler.category_state(CATEGORY)
+        shutil.rmtree(os.path.join(self.catdir, 'bob'))
+        del self.gkeys['bob']
+        self.assertRebuilt(state)
+
+
+    def test_edited_seeds(self):
+        state = self.handler.category_state(CATEGORY)
+        self.install(self.gkeys['carol']._replace(uid=['Carol <carol@example.com>']))
+        self.assertRebuilt(state)
+
+
+    def test_unchanged(self):
+        state = self.handler.category_state(CATEGORY)
+        self.assertEqual(self.handler.category_state(CATEGORY), state)
+        # a partial load leaves the db as it is
+        self.install(make_gkey('dave', 3))
+        seeds = self.handler.load_category(CATEGORY, ['dave'])
+        self.assertEqual(list(seeds.seeds), ['dave'])
+        self.assertFalse(installed_current(self.dbpath, self.catdir))
+
+
+    def test_saved_state(self):
+        # the keydirs state is the one from before the seeds were read
+        keydirs = keydirs_state(self.catdir)
+        seeds = self.handler.load_category(CATEGORY)
+        self.install(self.gkeys['alice']._replace(name='Alice'))
+        self.assertTrue(self.handler.save_installed_db(self.catdir, seeds, keydirs))
+        self.assertFalse(installed_current(self.dbpath, self.catdir))
+        self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+        # and defaults to the current one
+        self.assertTrue(self.handler.save_installed_db(self.catdir, seeds))
+        self.assertTrue(installed_current(self.dbpath, self.catdir))
+
+
+    def test_bad_state(self):
+        for data in ['', '{"version": 0}', '[]', '{"version": 1}']:
+            with open(self.dbpath + INSTALLED_STATE, 'w') as statefile:
+                statefile.write(data)
+            self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+            self.assertEqual(self.load(), (self.gkeys, 'db'))
+
+
+class TestInstalledDbBackend(InstalledDbTest):
+
+    def test_backend(self):
+        json_db = os.path.join(self.catdir, INSTALLED_DB)
+        sqlite_db = os.path.join(self.catdir, INSTALLED_SQLITE_DB)
+        self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+        self.assertTrue(os.path.exists(json_db))
+        self.assertFalse(os.path.exists(sqlite_db))
+        self.assertEqual(self.load(), (self.gkeys, 'db'))
+        # the sqlite backend builds its own db on its first load
+        self.config.options['installed_db_backend'] = 'sqlite'
+        self.assertEqual(self.load(), (self.gkeys, 'keydirs'))
+        self.assertTrue(os.path.exists(sqlite_db))
+        seeds = Seeds(sqlite_db, self.config, self.logger)
+        self.assertTrue(seeds.load())
+        self.assertTrue(seeds.store is not None)
+        self.assertEqual(seeds.seeds, self.gkeys)
+        self.assertEqual(self.load(), (self.gkeys, 'db'))
+        # and back, the json db is still current
+        self.config.options['installed_db_backend'] = 'json'
+        self.assertEqual(self.load(), (self.gkeys, 'db'))
+
+
+class TestCategorySearch(InstalledDbTest):
+
+    def search(self, handler, **kwargs):
+        args = argparse.Namespace(category=CATEGORY, exact=False,
+            fuzzy=False, all=False)
+        for option in KEY_OPTIONS:
+            setattr(args, option, kwargs.get(option))
+        return [x.nick for x in handler.key_search(args)[CATEGORY]]
+
+
+    def test_cached(self):
+        # build the db
+        self.load()
+        handler = KeyHandler(self.config, self.logger)
+        self.assertEqual(self.search(handler, name='developer'),
+            ['alice', 'bob', 'carol'])
+        self.assertEqual(handler.seedhandler.loaded_state[0], 'db')
+        handler.seedhandler.load_category = None
+        # answered from the cache, without loading the category
+        self.assertEqual(self.search(handler, name='developer'),
+            ['alice', 'bob', 'carol'])
+        del handler.seedhandler.load_category
+
+
+    def test_keydir_changes(self):
+        self.load()
+        handler = KeyHandler(self.config, self.logger)
+        self.assertEqual(self.search(handler, name='developer'),
+            ['alice', 'bob', 'carol'])
+        # the db is unchanged, but stale
+        self.install(self.gkeys['bob']._replace(name='Renamed'))
+        self.assertEqual(self.search(handler, name='developer'),
+            ['alice', 'carol'])
+        self.install(make_gkey('dave', 9))
+        self.assertEqual(self.search(handler, name='developer'),
+            ['alice', 'carol', 'dave'])
+        shutil.rmtree(os.path.join(self.catdir, 'alice'))
+        self.assertEqual(self.search(handler, name='developer'),
+            ['carol', 'dave'])
+
+
+if __name__ == '__main__':
+    unittest.main()